@@ -0,0 +1,4 @@
+from .benchmark import ProcessingBenchmark
+from .commit_generator import CommitGenerator
+
+__all__ = ["CommitGenerator", "ProcessingBenchmark"]
@@ -0,0 +1,372 @@
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from ..processing import (
+    DiffProcessor,
+    FinalProcessor,
+    Lexer,
+    MessageProcessor,
+    OutliersProcessor,
+    PostDeduplicationProcessor,
+    PreDeduplicationProcessor,
+)
+from ..tokenization import DiffExtractor, TrainingProcessor
+from ..utils import BaseProcessor
+from .commit_generator import CommitGenerator
+
+
+class ProcessingBenchmark:
+    """This class is used to measure performance of processing and tokenization stages on synthetic data.
+
+    For each dataset size, commits are generated once and then the whole pipeline is run for each combination
+    of # workers and chunksize: outliers -> messages -> diffs -> lexer -> preprocessing for SourcererCC ->
+    dropping clones -> final touch -> diffs extraction (-> training data preparation, when tokenizers are given).
+    Each stage receives the output of previous one, so that all stages work on realistic inputs.
+
+    Results for each stage are appended to `results.jsonl` in output directory and can be compared against results
+    of previous run to detect slowdowns.
+
+    Args:
+        generator: Generator to create synthetic commits with.
+        output_dir: Directory to save generated data, outputs of stages and results to.
+        data_format: In which format data is saved.
+        processors_kwargs: Keyword arguments for each processor, keys are names of processors
+            (e.g. `outliers_processor`, `lexer`, `diff_extractor`)
+            (`n_workers` and `chunksize` are set by the benchmark itself).
+        training_processor_kwargs: Keyword arguments for `TrainingProcessor`. Optional, when not given,
+            training data preparation stage is skipped (it requires tokenizers).
+        logger_name: Name of logger for this class. Optional, default value is None.
+    """
+
+    def __init__(
+        self,
+        generator: CommitGenerator,
+        output_dir: str,
+        data_format: str,
+        processors_kwargs: Optional[Dict[str, Dict[str, Any]]] = None,
+        training_processor_kwargs: Optional[Dict[str, Any]] = None,
+        logger_name: Optional[str] = None,
+    ):
+        self._generator = generator
+        self._output_dir = output_dir
+        self._data_format = data_format
+        self._processors_kwargs = processors_kwargs if processors_kwargs else {}
+        self._training_processor_kwargs = training_processor_kwargs
+        self.logger = BaseProcessor._get_logger(logger_name)
+
+    def _get_processor(self, cls: Callable[..., BaseProcessor], name: str, n_workers: int, chunksize: int, **kwargs):
+        processor_kwargs = {**self._processors_kwargs.get(name, {}), **kwargs}
+        return cls(
+            **processor_kwargs,
+            n_workers=n_workers,
+            chunksize=chunksize,
+            data_format=self._data_format,
+            logger_name=f"benchmark_{name}",
+        )
+
+    def _run_stage(self, name: str, processor: BaseProcessor, *runs: Callable[[], None]) -> Dict[str, Any]:
+        """Runs a single stage (which might consist of several calls to the same processor) and collects
+        its statistics.
+        """
+        self.logger.info(f"Running {name}")
+        res: Dict[str, Any] = {"stage": name, "time": 0.0}
+        for run in runs:
+            start_time = time.perf_counter()
+            run()
+            res["time"] += time.perf_counter() - start_time
+
+            # only available for stages that go through `BaseProcessor.__call__`
+            if processor._metrics is not None:
+                metrics = processor._metrics.to_dict()
+                for key in ["prepare_time", "read_time", "process_time", "write_time", "rows_in", "rows_out"]:
+                    res[key] = res.get(key, 0) + metrics[key]
+
+        if "rows_in" in res:
+            res["rows_per_second"] = res["rows_in"] / res["time"] if res["time"] > 0 else None
+        return res
+
+    def _run_pipeline(self, input_dir: str, run_dir: str, n_workers: int, chunksize: int) -> List[Dict[str, Any]]:
+        """Runs all stages over generated data from `input_dir`, saving outputs to `run_dir`."""
+        for dir_name in ["filtered_outliers", "filtered_msgs", "filtered_diffs", "lexed", "tokenization"]:
+            os.makedirs(os.path.join(run_dir, dir_name), exist_ok=True)
+        for dir_name in ["n_tokens", "literals_len", "deduplication", "training"]:
+            os.makedirs(os.path.join(run_dir, dir_name), exist_ok=True)
+
+        def path(*parts: str) -> str:
+            return os.path.join(run_dir, *parts)
+
+        results = []
+
+        processor = self._get_processor(OutliersProcessor, "outliers_processor", n_workers, chunksize)
+        results.append(
+            self._run_stage(
+                "outliers_processor",
+                processor,
+                lambda: processor(
+                    in_fname=os.path.join(input_dir, "train"),
+                    out_fname=path("filtered_outliers", "train"),
+                    prepare_n_tokens_dir=path("n_tokens"),
+                ),
+            )
+        )
+
+        processor = self._get_processor(MessageProcessor, "message_processor", n_workers, chunksize)
+        results.append(
+            self._run_stage(
+                "message_processor",
+                processor,
+                lambda: processor(
+                    in_fname=path("filtered_outliers", "train"), out_fname=path("filtered_msgs", "train")
+                ),
+            )
+        )
+
+        processor = self._get_processor(DiffProcessor, "diff_processor", n_workers, chunksize)
+        results.append(
+            self._run_stage(
+                "diff_processor",
+                processor,
+                lambda: processor(in_fname=path("filtered_msgs", "train"), out_fname=path("filtered_diffs", "train")),
+            )
+        )
+
+        processor = self._get_processor(Lexer, "lexer", n_workers, chunksize)
+        results.append(
+            self._run_stage(
+                "lexer",
+                processor,
+                lambda: processor(
+                    in_fname=path("filtered_diffs", "train"),
+                    out_fname=path("lexed", "train"),
+                    delimiter_out_fname=path("tokenization", "train"),
+                    prepare_literals_len_dir=path("literals_len"),
+                ),
+            )
+        )
+
+        processor = self._get_processor(
+            PreDeduplicationProcessor, "pre_deduplication_processor", n_workers, chunksize, project_id=1
+        )
+        results.append(
+            self._run_stage(
+                "pre_deduplication_processor",
+                processor,
+                lambda: processor(
+                    in_fname=path("lexed", "train"),
+                    out_fname=path("deduplication", "train_message.txt"),
+                    data_col="message",
+                    add_data_format=False,
+                ),
+                lambda: processor(
+                    in_fname=path("lexed", "train"),
+                    out_fname=path("deduplication", "train_diffs.txt"),
+                    data_col="mods",
+                    add_data_format=False,
+                ),
+            )
+        )
+
+        processor = self._get_processor(
+            PostDeduplicationProcessor, "post_deduplication_processor", n_workers, chunksize
+        )
+        results.append(
+            self._run_stage(
+                "post_deduplication_processor",
+                processor,
+                lambda: processor(
+                    in_fname=path("lexed", "train"),
+                    out_fname=path("lexed", "train_no_duplicates"),
+                    prepare_msg_clones_fname=os.path.join(input_dir, "clones.pairs"),
+                    prepare_diff_clones_fname=os.path.join(input_dir, "clones.pairs"),
+                ),
+            )
+        )
+
+        processor = self._get_processor(FinalProcessor, "final_processor", n_workers, chunksize)
+        results.append(
+            self._run_stage(
+                "final_processor",
+                processor,
+                lambda: processor(
+                    in_fname=path("lexed", "train_no_duplicates"),
+                    out_fname=path("train_final"),
+                    prepare_license_in_fname=os.path.join(input_dir, "repo_license_map.json"),
+                    prepare_in_fnames=[os.path.join(input_dir, "train")],
+                ),
+            )
+        )
+
+        processor = self._get_processor(DiffExtractor, "diff_extractor", n_workers, chunksize)
+        results.append(
+            self._run_stage(
+                "diff_extractor",
+                processor,
+                lambda: processor.extract_diffs(in_fname=path("train_final"), out_fname=path("diffs.txt")),
+            )
+        )
+
+        if self._training_processor_kwargs:
+            processor = self._get_processor(
+                TrainingProcessor, "training_processor", n_workers, chunksize, **self._training_processor_kwargs
+            )
+            results.append(
+                self._run_stage(
+                    "training_processor",
+                    processor,
+                    lambda: processor(in_fname=path("train_final"), output_dir=path("training"), part="train"),
+                )
+            )
+
+        return results
+
+    def _generate_input(self, input_dir: str, n_commits: int) -> None:
+        """Generates synthetic commits together with supplementary files required by processing stages."""
+        os.makedirs(input_dir, exist_ok=True)
+        self._generator(out_fname=os.path.join(input_dir, "train"), n_commits=n_commits)
+        self._generator.save_clones(os.path.join(input_dir, "clones.pairs"))
+        self._generator.save_licenses(os.path.join(input_dir, "repo_license_map.json"))
+
+    def run(self, n_commits: List[int], n_workers: List[int], chunksizes: List[int]) -> List[Dict[str, Any]]:
+        """Runs all stages for each combination of dataset size, # workers and chunksize.
+
+        Args:
+            n_commits: Dataset sizes to evaluate.
+            n_workers: Numbers of workers to evaluate.
+            chunksizes: Chunksizes to evaluate.
+
+        Returns:
+            A list with statistics for each stage of each run.
+        """
+        results = []
+        results_fname = os.path.join(self._output_dir, "results.jsonl")
+        for cur_n_commits in n_commits:
+            input_dir = os.path.join(self._output_dir, f"n_commits_{cur_n_commits}")
+            self._generate_input(input_dir, cur_n_commits)
+
+            for cur_n_workers in n_workers:
+                for chunksize in chunksizes:
+                    self.logger.info(
+                        f"Benchmarking on {cur_n_commits} commits with {cur_n_workers} workers, chunksize {chunksize}"
+                    )
+                    run_dir = os.path.join(input_dir, f"n_workers_{cur_n_workers}_chunksize_{chunksize}")
+                    run_info = {"n_commits": cur_n_commits, "n_workers": cur_n_workers, "chunksize": chunksize}
+                    stage_results = [
+                        {**run_info, **res} for res in self._run_pipeline(input_dir, run_dir, cur_n_workers, chunksize)
+                    ]
+                    with open(results_fname, "a") as f:
+                        f.writelines(json.dumps(res) + "\n" for res in stage_results)
+                    results.extend(stage_results)
+
+        self._log_summary(results)
+        return results
+
+    @staticmethod
+    def _filter_diff_reference(diff: str) -> str:
+        """Straightforward line-by-line version of `DiffProcessor._filter_diff`, which it has to match exactly."""
+        processed_lines = []
+        for line in diff.split("\n"):
+            line = line.strip()
+            if (line.startswith(("-", "+")) and len(line) > 1) or (
+                line.startswith("Binary files") and line.endswith("differ")
+            ):
+                processed_lines.append(line)
+        return re.sub(r"[^\S\n]+", " ", "\n".join(processed_lines))
+
+    def run_diff_filter(self, n_commits: int, n_repeats: int = 3) -> Dict[str, Any]:
+        """Compares `DiffProcessor._filter_diff` against its line-by-line reference version on diffs
+        of synthetic commits (best time out of several repeats is reported for both).
+
+        Results are appended to `diff_filter.jsonl` in output directory.
+
+        Args:
+            n_commits: # of commits to take diffs from.
+            n_repeats: # of times to filter all diffs with each implementation.
+
+        Returns:
+            A dictionary with # of diffs, total size of diffs and time of both implementations.
+
+        Raises:
+            ValueError: When outputs of two implementations differ for any diff.
+        """
+        diffs = [
+            mod["diff"]
+            for commit in self._generator.generate(n_commits)
+            for mod in commit["mods"]
+            if isinstance(mod["diff"], str) and mod["diff"].isascii()
+        ]
+        res: Dict[str, Any] = {"stage": "diff_filter", "n_commits": n_commits, "n_diffs": len(diffs)}
+        res["n_bytes"] = sum(len(diff) for diff in diffs)
+
+        outputs = {}
+        for key, filter_diff in [
+            ("time", DiffProcessor._filter_diff),
+            ("reference_time", ProcessingBenchmark._filter_diff_reference),
+        ]:
+            times = []
+            for _ in range(n_repeats):
+                start_time = time.perf_counter()
+                outputs[key] = [filter_diff(diff) for diff in diffs]
+                times.append(time.perf_counter() - start_time)
+            res[key] = min(times)
+
+        for diff, output, reference_output in zip(diffs, outputs["time"], outputs["reference_time"]):
+            if output != reference_output:
+                raise ValueError(f"Filtered diff differs from reference: {output!r} vs {reference_output!r} ({diff!r})")
+
+        res["speedup"] = res["reference_time"] / res["time"] if res["time"] > 0 else None
+        self.logger.info(
+            f"Diff filter on {res['n_diffs']} diffs ({res['n_bytes'] / 2**20:.1f} MiB): {res['time']:.2f} s "
+            f"vs {res['reference_time']:.2f} s for reference version"
+        )
+        with open(os.path.join(self._output_dir, "diff_filter.jsonl"), "a") as f:
+            f.write(json.dumps(res) + "\n")
+        return res
+
+    def _log_summary(self, results: List[Dict[str, Any]]) -> None:
+        for res in results:
+            self.logger.info(
+                f"{res['stage']:<30} n_commits={res['n_commits']:<8} n_workers={res['n_workers']:<3} "
+                f"chunksize={res['chunksize']:<6} time={res['time']:.2f} s"
+            )
+
+    @staticmethod
+    def _get_key(res: Dict[str, Any]) -> str:
+        return f"{res['stage']}_{res['n_commits']}_{res['n_workers']}_{res['chunksize']}"
+
+    def compare(
+        self, results: List[Dict[str, Any]], baseline_fname: str, max_slowdown: float = 0.1
+    ) -> List[Dict[str, Any]]:
+        """Compares results with results of a previous run and reports stages that became slower.
+
+        Args:
+            results: Results of current run.
+            baseline_fname: Path to file with results of previous run (`results.jsonl` from its output directory).
+            max_slowdown: Allowed relative increase in time (e.g. 0.1 stands for 10%).
+
+        Returns:
+            A list of results that are slower than allowed, each one with additional `baseline_time` key.
+        """
+        with open(baseline_fname, "r") as f:
+            # when the same configuration was run several times, the latest result is used
+            baseline = {self._get_key(res): res for res in map(json.loads, f)}
+
+        slowdowns = []
+        for res in results:
+            key = self._get_key(res)
+            if key not in baseline:
+                continue
+            baseline_time = baseline[key]["time"]
+            if res["time"] > baseline_time * (1 + max_slowdown):
+                self.logger.warning(
+                    f"{res['stage']} (n_commits={res['n_commits']}, n_workers={res['n_workers']}, "
+                    f"chunksize={res['chunksize']}) is slower than baseline: "
+                    f"{res['time']:.2f} s vs {baseline_time:.2f} s"
+                )
+                slowdowns.append({**res, "baseline_time": baseline_time})
+
+        if not slowdowns:
+            self.logger.info("No slowdowns compared to baseline")
+        return slowdowns
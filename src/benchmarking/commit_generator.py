@@ -0,0 +1,254 @@
+import hashlib
+import json
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils import BaseProcessor
+
+
+class CommitGenerator(BaseProcessor):
+    """This class is used to generate synthetic commits for benchmarking processing stages without mining
+    real repositories.
+
+    Commits are saved in the same format as `RepoProcessor.unite_files` produces: each commit has `author`, `date`,
+    `hash`, `message` and `mods` (with `change_type`, `old_path`, `new_path` and `diff`), as well as unique `id`
+    and `repo`. Generation is deterministic: the same seed always produces the same commits, and smaller datasets
+    are prefixes of larger ones.
+
+    Sizes are drawn from log-normal distributions, which are described by dictionaries with `median`, `sigma` and
+    `max` keys (e.g. `{"median": 8, "sigma": 0.9, "max": 256}`).
+
+    Args:
+        seed: Random seed.
+        commits_per_repo: Number of commits in each repository.
+        n_authors: Number of unique authors.
+        message_n_words: Distribution of # words in commit messages.
+        n_mods: Distribution of # modified files in commits.
+        diff_n_lines: Distribution of # changed lines in each modified file.
+        noise_prob: Probability of adding each kind of noise which is filtered by `MessageProcessor`
+            (issue references, urls, signatures, etc.) to a message.
+        trivial_prob: Probability of generating trivial/bot message (e.g. "Update README.md").
+        non_ascii_prob: Probability of adding non-ASCII symbols to a message or a diff.
+        duplicate_prob: Probability of generating an exact copy of one of previous commits.
+        data_format: In which format generated data is saved.
+        chunksize: Number of commits to write at once. Optional, default value is 1000.
+        logger_name: Name of logger for this class. Optional, default value is None.
+    """
+
+    _VERBS = ["Fix", "Add", "Update", "Remove", "Refactor", "Implement", "Improve", "Rename", "Move", "Support"]
+    _WORDS = [
+        "bug", "test", "tests", "support", "parser", "config", "logging", "error", "handling", "docs", "api",
+        "client", "server", "request", "response", "cache", "memory", "leak", "typo", "build", "script", "method",
+        "class", "function", "option", "default", "value", "values", "check", "null", "pointer", "exception",
+        "timeout", "connection", "path", "file", "files", "version", "dependency", "dependencies", "the", "a", "in",
+        "for", "to", "of", "with", "when", "on", "and", "from", "new", "old", "unused", "missing", "invalid",
+    ]  # fmt: skip
+    _TRIVIAL_MESSAGES = ["Update README.md", "Bump version to {major}.{minor}.{patch}", "Update changelog", "Update"]
+    _LANGUAGES = {
+        "py": ["def {name}({arg}):", "    return {name}({arg}, {num})", "{name} = '{word} {word}'", "import {name}"],
+        "java": [
+            "public void {name}(int {arg}) {{",
+            "    return {name}.{name}({arg}, {num});",
+            'String {name} = "{word} {word}";',
+            "}}",
+        ],
+        "js": ["function {name}({arg}) {{", "  return {name}({arg} + {num});", "const {name} = '{word} {word}';", "}}"],
+        "go": ["func {name}({arg} int) error {{", "\treturn {name}({arg}, {num})", '{name} := "{word} {word}"', "}}"],
+        "cpp": ["int {name}(int {arg}) {{", "    return {name}({arg}, {num});", 'auto {name} = "{word} {word}";', "}}"],
+        "md": ["# {word} {word}", "* {word} {word} {word}", "{word} {word} {word} {word}.", ""],
+    }
+    _CHANGE_TYPES = ["MODIFY", "ADD", "DELETE", "RENAME"]
+    _CHANGE_TYPES_PROBS = [0.8, 0.12, 0.05, 0.03]
+
+    def __init__(
+        self,
+        seed: int = 0,
+        commits_per_repo: int = 1000,
+        n_authors: int = 1000,
+        message_n_words: Optional[Dict[str, float]] = None,
+        n_mods: Optional[Dict[str, float]] = None,
+        diff_n_lines: Optional[Dict[str, float]] = None,
+        noise_prob: float = 0.05,
+        trivial_prob: float = 0.02,
+        non_ascii_prob: float = 0.01,
+        duplicate_prob: float = 0.01,
+        data_format: str = "jsonl",
+        chunksize: Optional[int] = None,
+        logger_name: Optional[str] = None,
+    ):
+        super().__init__(chunksize=chunksize, data_format=data_format, logger_name=logger_name)
+        self._seed = seed
+        self._commits_per_repo = commits_per_repo
+        self._n_repos = 0
+        self._n_authors = n_authors
+        self._message_n_words = message_n_words if message_n_words else {"median": 8, "sigma": 0.8, "max": 256}
+        self._n_mods = n_mods if n_mods else {"median": 2, "sigma": 0.9, "max": 64}
+        self._diff_n_lines = diff_n_lines if diff_n_lines else {"median": 12, "sigma": 1.2, "max": 2000}
+        self._noise_prob = noise_prob
+        self._trivial_prob = trivial_prob
+        self._non_ascii_prob = non_ascii_prob
+        self._duplicate_prob = duplicate_prob
+
+        self.duplicates: List[Tuple[int, int]] = []
+
+    @staticmethod
+    def _sample_size(rng: np.random.Generator, distribution: Dict[str, float]) -> int:
+        """Draws a single positive integer from log-normal distribution."""
+        size = rng.lognormal(mean=np.log(distribution["median"]), sigma=distribution["sigma"])
+        return int(min(max(round(size), 1), distribution["max"]))
+
+    def _word(self, rng: np.random.Generator) -> str:
+        return self._WORDS[rng.integers(len(self._WORDS))]
+
+    def _generate_message(self, rng: np.random.Generator) -> str:
+        if rng.random() < self._trivial_prob:
+            template = self._TRIVIAL_MESSAGES[rng.integers(len(self._TRIVIAL_MESSAGES))]
+            return template.format(major=rng.integers(5), minor=rng.integers(20), patch=rng.integers(100))
+
+        n_words = self._sample_size(rng, self._message_n_words)
+        message = " ".join([self._VERBS[rng.integers(len(self._VERBS))]] + [self._word(rng) for _ in range(n_words)])
+
+        author_id = rng.integers(self._n_authors)
+        noise = [
+            f" (#{rng.integers(1, 10000)})",
+            f" https://github.com/org/repo/issues/{rng.integers(1, 10000)}",
+            f" {hashlib.sha1(message.encode('utf-8')).hexdigest()[:10]}",
+            f"\n\nSigned-off-by: Author {author_id} <author{author_id}@mail.com>",
+            " ✅",
+        ]
+        probs = [self._noise_prob] * 4 + [self._non_ascii_prob]
+        for cur_noise, prob in zip(noise, probs):
+            if rng.random() < prob:
+                message += cur_noise
+        return message
+
+    def _generate_line(self, rng: np.random.Generator, extension: str) -> str:
+        templates = self._LANGUAGES[extension]
+        return templates[rng.integers(len(templates))].format(
+            name=f"{self._word(rng)}_{self._word(rng)}",
+            arg=self._word(rng),
+            word=self._word(rng),
+            num=rng.integers(1000),
+        )
+
+    def _generate_diff(self, rng: np.random.Generator, extension: str, change_type: str) -> str:
+        n_lines = self._sample_size(rng, self._diff_n_lines)
+        if change_type == "ADD":
+            prefixes = ["+"] * n_lines
+            header = f"@@ -0,0 +1,{n_lines} @@"
+        elif change_type == "DELETE":
+            prefixes = ["-"] * n_lines
+            header = f"@@ -1,{n_lines} +0,0 @@"
+        else:
+            prefixes = rng.choice(["+", "-", " "], size=n_lines, p=[0.4, 0.3, 0.3]).tolist()
+            start = rng.integers(1, 500)
+            n_old_lines, n_new_lines = n_lines - prefixes.count("+"), n_lines - prefixes.count("-")
+            header = f"@@ -{start},{n_old_lines} +{start},{n_new_lines} @@"
+
+        lines = [header] + [f"{prefix}{self._generate_line(rng, extension)}" for prefix in prefixes]
+        if rng.random() < self._non_ascii_prob:
+            lines.append("+# été")
+        return "\n".join(lines) + "\n"
+
+    def _generate_mods(self, rng: np.random.Generator) -> List[Dict[str, Optional[str]]]:
+        mods = []
+        extensions = list(self._LANGUAGES)
+        for _ in range(self._sample_size(rng, self._n_mods)):
+            extension = extensions[rng.integers(len(extensions))]
+            change_type = self._CHANGE_TYPES[rng.choice(len(self._CHANGE_TYPES), p=self._CHANGE_TYPES_PROBS)]
+            path = f"src/{self._word(rng)}/{self._word(rng)}_{rng.integers(100)}.{extension}"
+            old_path, new_path = path, path
+            if change_type == "ADD":
+                old_path = None
+            elif change_type == "DELETE":
+                new_path = None
+            elif change_type == "RENAME":
+                new_path = f"src/{self._word(rng)}/{self._word(rng)}_{rng.integers(100)}.{extension}"
+
+            diff = self._generate_diff(rng, extension, change_type) if change_type != "RENAME" else ""
+            mods.append({"change_type": change_type, "old_path": old_path, "new_path": new_path, "diff": diff})
+        return mods
+
+    def generate(self, n_commits: int) -> Iterator[Dict[str, Any]]:
+        """Generates given number of commits.
+
+        Commits are spread over repositories in contiguous blocks (like in data collected from real repositories)
+        and dates increase within each repository. Ids of exact copies are saved to `duplicates` attribute
+        as (original id, copy id) pairs.
+
+        Args:
+            n_commits: Number of commits to generate.
+        """
+        rng = np.random.default_rng(self._seed)
+        self.duplicates = []
+        self._n_repos = math.ceil(n_commits / self._commits_per_repo)
+        date = datetime(2015, 1, 1)
+        prev_commits: List[Dict[str, Any]] = []
+
+        for i in range(n_commits):
+            repo_id = i // self._commits_per_repo
+            if i % self._commits_per_repo == 0:
+                date = datetime(2015, 1, 1)
+            date += timedelta(seconds=int(rng.integers(60, 3 * 24 * 60 * 60)))
+            author_id = rng.integers(self._n_authors)
+
+            commit = {
+                "author": (f"Author {author_id}", f"author{author_id}@mail.com"),
+                "date": date.strftime("%d.%m.%Y %H:%M:%S"),
+                "hash": hashlib.sha1(f"{self._seed}_{i}".encode("utf-8")).hexdigest(),
+            }
+            if prev_commits and rng.random() < self._duplicate_prob:
+                original = prev_commits[rng.integers(len(prev_commits))]
+                self.duplicates.append((original["id"], i))
+                commit["message"], commit["mods"] = original["message"], original["mods"]
+            else:
+                commit["message"], commit["mods"] = self._generate_message(rng), self._generate_mods(rng)
+            commit["id"] = i
+            commit["repo"] = f"org{repo_id}/repo{repo_id}"
+
+            # keep a small window of previous commits to copy from
+            prev_commits.append(commit)
+            if len(prev_commits) > 1000:
+                prev_commits.pop(0)
+            yield commit
+
+    def __call__(self, out_fname: str, n_commits: int, add_data_format: Optional[bool] = True) -> None:
+        """Generates given number of commits and saves them to target file.
+
+        Args:
+            out_fname: Path to save generated data to.
+            n_commits: Number of commits to generate.
+            add_data_format: True to add data format extension to given path.
+        """
+        self.logger.info(f"Generating {n_commits} commits to {out_fname}")
+
+        self._prepare_outfile(out_fname, add_data_format=add_data_format)
+        commits = []
+        for commit in self.generate(n_commits):
+            commits.append(commit)
+            if len(commits) >= self._chunksize:
+                self._append_to_outfile(commits, out_fname, add_data_format=add_data_format, as_records=True)
+                commits = []
+        if commits:
+            self._append_to_outfile(commits, out_fname, add_data_format=add_data_format, as_records=True)
+        self._close_outfile(out_fname, add_data_format=add_data_format)
+
+        self.logger.info(f"Finished generating {n_commits} commits")
+
+    def save_licenses(self, out_fname: str) -> None:
+        """Saves repository-license mapping for repositories from the last `generate` call
+        (in format expected by `FinalProcessor`).
+        """
+        licenses = ["MIT License", "Apache License 2.0", "BSD 3-Clause License"]
+        with open(out_fname, "w") as f:
+            json.dump({f"org{i}/repo{i}": licenses[i % len(licenses)] for i in range(self._n_repos)}, f)
+
+    def save_clones(self, out_fname: str, part_id: int = 1) -> None:
+        """Saves pairs of exact copies from the last `generate` call in SourcererCC output format
+        (in format expected by `PostDeduplicationProcessor`).
+        """
+        with open(out_fname, "w") as f:
+            f.writelines(f"{part_id},{id1},{part_id},{id2}\n" for id1, id2 in self.duplicates)
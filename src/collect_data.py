@@ -1,13 +1,14 @@
 import json
 import logging
 import os
+from collections import Counter
 
 import hydra
 from hydra.utils import to_absolute_path
 from joblib import Parallel, delayed
 from omegaconf import DictConfig
 
-from .collection import RepoProcessor
+from .collection import HashIndex, RepoProcessor, RepoScheduler
 
 
 @hydra.main(config_path="../configs", config_name="collect_data")
@@ -28,6 +29,9 @@ def main(cfg: DictConfig) -> None:
 
     os.makedirs(cfg.paths.temp_clone_dir, exist_ok=True)
 
+    # shared by all parts, so that commits repeated across parts are kept only in the first one (train)
+    hash_index = HashIndex() if cfg.duplicates else None
+
     for part in parts:
         inputs = []
         logging.info(f"Processing {part}")
@@ -43,20 +47,46 @@ def main(cfg: DictConfig) -> None:
             output_dir=os.path.join(cfg.paths.output_dir, "raw", part),
             logger_name="repo_processor",
             data_format=cfg.data_format,
+            n_workers=cfg.n_workers,
             **cfg.repo_processor,
         )
 
+        # the most expensive repos are mined first, so that the pool doesn't end up waiting for them
+        scheduler = RepoScheduler(timings_fname=cfg.paths.timings_fname, temp_clone_dir=cfg.paths.temp_clone_dir)
+        tasks = scheduler.schedule(
+            [
+                {"repo_name": cur_input["repo"], "repo_url": cur_input["url"], "only_commits": cur_input["hashes"]}
+                for cur_input in inputs
+            ]
+        )
+
         with Parallel(cfg.n_workers) as pool:
+            # large repos are split into partitions, so that a single repo doesn't occupy one worker till the end
+            partitions = pool(delayed(rp.get_partitions)(**task) for task in tasks)
+            partition_tasks = scheduler.schedule(
+                [partition for repo_partitions in partitions for partition in repo_partitions]
+            )
+            timings = pool(delayed(rp.process_repo)(**partition) for partition in partition_tasks)
+            scheduler.save_timings(timings)
+
+            filtered = Counter()
+            for timing in timings:
+                if timing is not None and "filtered" in timing:
+                    filtered.update(timing["filtered"])
+            if filtered:
+                logging.info(f"Filtered at mining time: {dict(filtered)}")
             pool(
-                delayed(rp.process_repo)(
-                    repo_name=cur_input["repo"],
-                    repo_url=cur_input["url"],
-                    only_commits=cur_input["hashes"],
-                )
-                for cur_input in inputs
+                delayed(rp.merge_partitions)(repo_name=task["repo_name"], n_partitions=len(repo_partitions))
+                for task, repo_partitions in zip(tasks, partitions)
             )
 
-        rp.unite_files(out_fname=os.path.join(cfg.paths.output_dir, part), org_repo_sep=cfg.org_repo_sep)
+        rp.unite_files(
+            out_fname=os.path.join(cfg.paths.output_dir, part),
+            org_repo_sep=cfg.org_repo_sep,
+            n_tokens_dir=os.path.join(cfg.paths.n_tokens_dir, part) if cfg.count_n_tokens else None,
+            hash_index=hash_index,
+            duplicates=cfg.duplicates or "drop",
+        )
 
 
 if __name__ == "__main__":
@@ -1,3 +1,7 @@
+from .clone_cache import CloneCache
+from .git_log_miner import GitLogMiner
+from .hash_index import HashIndex
 from .repo_processor import RepoProcessor
+from .repo_scheduler import RepoScheduler
 
-__all__ = ["RepoProcessor"]
+__all__ = ["CloneCache", "GitLogMiner", "HashIndex", "RepoProcessor", "RepoScheduler"]
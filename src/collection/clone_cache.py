@@ -0,0 +1,110 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Optional
+
+
+class CloneCache:
+    """This class is used to keep local clones of mined repositories, so that they are reused across runs.
+
+    Each repository is cloned (without checking out files) to its own directory named after full repository name
+    (`org#repo`), so repositories with the same name from different organizations don't collide.
+
+    When `shared_objects` is True, objects of all repositories are first fetched to a single bare repository
+    (`.objects` inside `clone_dir`), and clones borrow objects from it via git alternates (`git clone --reference`).
+    Related repositories (e.g. forks) only download and store objects that the shared repository doesn't have yet.
+    Note that clones can't be used without the shared repository, so it shouldn't be removed separately.
+
+    Args:
+        clone_dir: Directory to clone repositories to.
+        shared_objects: True to share objects between clones. Optional, default value is True.
+        logger_name: Name of logger for this class. Optional, default value is None.
+    """
+
+    _OBJECTS_DIR = ".objects"
+
+    def __init__(self, clone_dir: str, shared_objects: bool = True, logger_name: Optional[str] = None):
+        self._clone_dir = clone_dir
+        self._shared_objects = shared_objects
+        self._logger_name = logger_name
+
+    @property
+    def logger(self) -> logging.Logger:
+        return logging.getLogger(self._logger_name)
+
+    def get_path(self, repo_name: str) -> str:
+        """Returns path given repository is (or would be) cloned to."""
+        return os.path.join(self._clone_dir, repo_name)
+
+    def _get_objects_path(self) -> str:
+        """Returns path to shared repository, creating it first when necessary."""
+        objects_path = os.path.join(self._clone_dir, self._OBJECTS_DIR)
+        if not os.path.exists(objects_path):
+            tmp_path = tempfile.mkdtemp(dir=self._clone_dir, prefix=f"{self._OBJECTS_DIR}.")
+            subprocess.run(["git", "init", "--quiet", "--bare", tmp_path], check=True)
+            try:
+                os.replace(tmp_path, objects_path)
+            except OSError:  # created concurrently by another worker
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        return objects_path
+
+    def _fetch_objects(self, repo_name: str, repo_url: str) -> bool:
+        """Fetches branches of given repository to shared repository (under `refs/remotes/{repo_name}/`,
+        so that their objects are never pruned). Returns False when it failed.
+        """
+        objects_path = self._get_objects_path()
+        try:
+            subprocess.run(
+                [
+                    "git",
+                    "-C",
+                    objects_path,
+                    "-c",
+                    "gc.auto=0",
+                    "fetch",
+                    "--quiet",
+                    "--no-tags",
+                    "--no-write-fetch-head",
+                    repo_url,
+                    f"+refs/heads/*:refs/remotes/{repo_name}/*",
+                ],
+                check=True,
+            )
+            return True
+        except subprocess.CalledProcessError as e:
+            self.logger.warning(f"[{repo_name}] Couldn't fetch objects to shared repository; {e}")
+            return False
+
+    def get(self, repo_name: str, repo_url: str) -> str:
+        """Returns path to local clone of given repository, cloning it first when necessary."""
+        repo_path = self.get_path(repo_name)
+        if os.path.exists(repo_path):
+            self.logger.debug(f"[{repo_name}] Already cloned")
+            return repo_path
+
+        command = ["git", "clone", "--quiet", "--no-checkout"]
+        if self._shared_objects and self._fetch_objects(repo_name, repo_url):
+            command += ["--reference", self._get_objects_path()]
+
+        # clone to temporary directory first, so that interrupted clones are never mistaken for complete ones
+        tmp_path = tempfile.mkdtemp(dir=self._clone_dir, prefix=f".{repo_name}.")
+        try:
+            subprocess.run(command + [repo_url, tmp_path], check=True)
+            os.replace(tmp_path, repo_path)
+        except OSError:
+            if not os.path.exists(repo_path):
+                raise
+            self.logger.debug(f"[{repo_name}] Cloned concurrently by another worker")
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return repo_path
+
+    @staticmethod
+    def fetch(repo_path: str) -> None:
+        """Updates local branches of already cloned repository (including the current one) from remote."""
+        subprocess.run(
+            ["git", "-C", repo_path, "fetch", "--quiet", "--update-head-ok", "origin", "+refs/heads/*:refs/heads/*"],
+            check=True,
+        )
@@ -1,25 +1,43 @@
-from typing import Dict, Sequence, Union
+from typing import Dict, Optional, Sequence, Union
 
 from pydriller import Commit, Modification
 
+from .mods_filter import ModsFilter
+
 
 class CommitProcessor:
     @staticmethod
-    def get_info_from_modification(m: Modification) -> Dict[str, str]:
+    def get_info_from_modification(
+        m: Modification, mods_filter: Optional[ModsFilter] = None
+    ) -> Optional[Dict[str, str]]:
         """
         Extracts specific information about single file modification.
+        Returns None when modification is dropped by given filter (skipped files are not serialized, although
+        PyDriller still computes their diffs).
         """
+        if mods_filter is not None and mods_filter.skip_paths(m.old_path, m.new_path):
+            return None
+
+        diff = m.diff
+        if mods_filter is not None:
+            diff = mods_filter.filter_diff(diff)
+            if diff is None:
+                return None
+
         return {
             "change_type": str(m.change_type).split(".")[1],
             "old_path": m.old_path,
             "new_path": m.new_path,
-            "diff": m.diff,
+            "diff": diff,
         }
 
     @staticmethod
-    def process_commit(commit: Commit) -> Dict[str, Union[Sequence[str], str]]:
+    def process_commit(
+        commit: Commit, mods_filter: Optional[ModsFilter] = None
+    ) -> Optional[Dict[str, Union[Sequence[str], str]]]:
         """
         Extracts specific information about commit.
+        Returns None when commit is dropped by given filter (e.g. because it modifies too many files).
         """
         res = {
             "author": (commit.author.name, commit.author.email),
@@ -29,6 +47,15 @@ class CommitProcessor:
             "mods": [],
         }
 
-        for m in commit.modifications:
-            res["mods"].append(CommitProcessor.get_info_from_modification(m))
+        modifications = commit.modifications
+        if mods_filter is not None:
+            n_files = mods_filter.filter_n_files(len(modifications))
+            if n_files is None:
+                return None
+            modifications = modifications[:n_files]
+
+        for m in modifications:
+            info = CommitProcessor.get_info_from_modification(m, mods_filter)
+            if info is not None:
+                res["mods"].append(info)
         return res
@@ -0,0 +1,225 @@
+import subprocess
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class GitLogMiner:
+    """This class is used to mine commits from local git repository by parsing output of a single
+    `git log --patch` process, without spawning git subprocesses for each commit.
+
+    Each commit is converted to the same dictionary `CommitProcessor.process_commit` returns for PyDriller commits.
+    Commits are traversed in chronological order (from the oldest one), like PyDriller does by default.
+
+    Args:
+        repo_path: Path to local git repository.
+        only_commits: Hashes of commits to mine. Optional, all commits are mined by default.
+        only_no_merge: True to skip merge commits (like in PyDriller). Optional, default value is False.
+    """
+
+    _COMMIT_MARKER = b"\x00\x01commit\n"
+    # hash, author name, author email, author date and raw message, which ends with NUL byte
+    _FORMAT = "%x00%x01commit%n%H%n%an%n%ae%n%ad%n%B%x00"
+
+    def __init__(self, repo_path: str, only_commits: Optional[List[str]] = None, only_no_merge: bool = False):
+        self._repo_path = repo_path
+        self._only_commits = only_commits
+        self._only_no_merge = only_no_merge
+
+    def _get_command(self) -> List[str]:
+        command = [
+            "git",
+            "-C",
+            self._repo_path,
+            "-c",
+            "core.quotePath=false",
+            "log",
+            "--patch",
+            "-M",
+            "--no-color",
+            "--no-ext-diff",
+            "--no-textconv",
+            "--src-prefix=a/",
+            "--dst-prefix=b/",
+            f"--format={self._FORMAT}",
+            "--date=format:%d.%m.%Y %H:%M:%S",
+        ]
+        if self._only_no_merge:
+            command.append("--no-merges")
+        if self._only_commits is not None:
+            # read given hashes from stdin and show only them, in the same order
+            command.extend(["--no-walk=unsorted", "--stdin"])
+        else:
+            command.append("--reverse")
+        return command
+
+    @staticmethod
+    def get_commit_hashes(repo_path: str, only_no_merge: bool = False) -> List[str]:
+        """Returns hashes of all commits reachable from HEAD in chronological order (the order they are mined in)."""
+        command = ["git", "-C", repo_path, "rev-list", "--reverse", "HEAD"]
+        if only_no_merge:
+            command.append("--no-merges")
+        return subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout.decode().split()
+
+    def traverse_commits(self) -> Iterator[Dict[str, Any]]:
+        """Iterates over commits from repository.
+
+        Raises:
+            RuntimeError: When git process finishes with an error.
+        """
+        only_commits = None
+        if self._only_commits is not None:
+            # like PyDriller, only commits reachable from HEAD are mined (in chronological order)
+            commits_to_mine = set(self._only_commits)
+            only_commits = [
+                commit_hash
+                for commit_hash in self.get_commit_hashes(self._repo_path, self._only_no_merge)
+                if commit_hash in commits_to_mine
+            ]
+            if not only_commits:
+                return
+
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                self._get_command(),
+                stdin=subprocess.PIPE if only_commits is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+            )
+            try:
+                if only_commits is not None:
+                    # git reads the whole input before producing any output
+                    process.stdin.write("".join(f"{commit_hash}\n" for commit_hash in only_commits).encode())
+                    process.stdin.close()
+
+                yield from self.parse(process.stdout)
+
+                if process.wait() != 0:
+                    stderr.seek(0)
+                    raise RuntimeError(f"git log failed: {stderr.read().decode('utf-8', errors='replace').strip()}")
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+
+    @staticmethod
+    def _unquote(path: bytes) -> bytes:
+        """Converts path quoted by git (e.g. when it contains newlines or quotes) back to raw bytes."""
+        if not path.startswith(b'"'):
+            return path
+        return path[1:-1].decode("unicode_escape").encode("latin-1")
+
+    @staticmethod
+    def _decode_path(path: Optional[bytes], prefix: bytes = b"") -> Optional[str]:
+        if path is None or path == b"/dev/null":
+            return None
+        path = GitLogMiner._unquote(path)
+        if path.startswith(prefix):
+            path = path[len(prefix) :]
+        return path.decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _finish_mod(mod: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """Converts information collected from single file diff to the same format PyDriller modifications have."""
+        old_path, new_path = mod["old_path"], mod["new_path"]
+        if old_path is None and new_path is None:
+            # no ---/+++ lines (e.g. binary files or mode changes): paths are the same, so header can be split in half
+            header = mod["header"]
+            path = GitLogMiner._decode_path(header[: (len(header) - 1) // 2], prefix=b"a/")
+            old_path, new_path = path, path
+        if mod["change_type"] == "ADD":
+            old_path = None
+        elif mod["change_type"] == "DELETE":
+            new_path = None
+
+        return {
+            "change_type": mod["change_type"],
+            "old_path": old_path,
+            "new_path": new_path,
+            "diff": b"".join(mod["diff"]).decode("utf-8", errors="ignore"),
+        }
+
+    @staticmethod
+    def _parse_header_line(mod: Dict[str, Any], line: bytes) -> None:
+        """Updates information about single file diff with given line from its extended header."""
+        line = line.rstrip(b"\n")
+        if line.startswith(b"new file mode"):
+            mod["change_type"] = "ADD"
+        elif line.startswith(b"deleted file mode"):
+            mod["change_type"] = "DELETE"
+        elif line.startswith(b"rename from "):
+            mod["change_type"] = "RENAME"
+            mod["old_path"] = GitLogMiner._decode_path(line[len(b"rename from ") :])
+        elif line.startswith(b"rename to "):
+            mod["new_path"] = GitLogMiner._decode_path(line[len(b"rename to ") :])
+        elif line.startswith(b"copy from "):
+            mod["change_type"] = "COPY"
+            mod["old_path"] = GitLogMiner._decode_path(line[len(b"copy from ") :])
+        elif line.startswith(b"copy to "):
+            mod["new_path"] = GitLogMiner._decode_path(line[len(b"copy to ") :])
+        elif line.startswith(b"--- "):
+            # git appends tab to paths with spaces in these lines
+            mod["old_path"] = GitLogMiner._decode_path(line[len(b"--- ") :].rstrip(b"\t"), prefix=b"a/")
+        elif line.startswith(b"+++ "):
+            mod["new_path"] = GitLogMiner._decode_path(line[len(b"+++ ") :].rstrip(b"\t"), prefix=b"b/")
+
+    @staticmethod
+    def parse(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+        """Incrementally parses output of `git log --patch` with format from `_FORMAT` into commits.
+
+        Args:
+            lines: Lines of git output (as bytes, including line endings).
+        """
+        lines = iter(lines)
+        commit: Optional[Dict[str, Any]] = None
+        mod: Optional[Dict[str, Any]] = None
+
+        for line in lines:
+            if line == GitLogMiner._COMMIT_MARKER:
+                if mod is not None:
+                    commit["mods"].append(GitLogMiner._finish_mod(mod))
+                    mod = None
+                if commit is not None:
+                    yield commit
+
+                commit_hash, author_name, author_email, date = (
+                    next(lines).rstrip(b"\n").decode("utf-8", errors="replace") for _ in range(4)
+                )
+                message_lines = []
+                for message_line in lines:
+                    end = message_line.find(b"\x00")
+                    if end != -1:
+                        message_lines.append(message_line[:end])
+                        break
+                    message_lines.append(message_line)
+
+                commit = {
+                    "author": (author_name, author_email),
+                    "date": date,
+                    "hash": commit_hash,
+                    "message": b"".join(message_lines).decode("utf-8", errors="replace").strip(),
+                    "mods": [],
+                }
+            elif line.startswith(b"diff --git "):
+                if mod is not None:
+                    commit["mods"].append(GitLogMiner._finish_mod(mod))
+                mod = {
+                    "header": line[len(b"diff --git ") :].rstrip(b"\n"),
+                    "change_type": "MODIFY",
+                    "old_path": None,
+                    "new_path": None,
+                    "in_header": True,
+                    "diff": [],
+                }
+            elif mod is not None:
+                if mod["in_header"] and (line.startswith(b"@@") or line.startswith(b"Binary files")):
+                    mod["in_header"] = False
+                if mod["in_header"]:
+                    GitLogMiner._parse_header_line(mod, line)
+                else:
+                    mod["diff"].append(line)
+
+        if mod is not None:
+            commit["mods"].append(GitLogMiner._finish_mod(mod))
+        if commit is not None:
+            yield commit
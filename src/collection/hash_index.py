@@ -0,0 +1,44 @@
+from typing import Iterable
+
+import numpy as np
+
+
+class HashIndex:
+    """This class is used to find commits that were already seen in other repositories (e.g. in forks and mirrors)
+    by their hashes.
+
+    Hashes are stored as a sorted array of 20-byte binary digests, so lookups are binary searches
+    and memory is ~20 bytes per commit.
+
+    Args:
+        hashes: Initial hashes (hex strings). Optional, index is empty by default.
+    """
+
+    def __init__(self, hashes: Iterable[str] = ()):
+        self._hashes = np.unique(self.to_binary(hashes))
+
+    def __len__(self) -> int:
+        return self._hashes.shape[0]
+
+    @staticmethod
+    def to_binary(hashes: Iterable[str]) -> np.ndarray:
+        """Converts hex hashes to array of binary digests (longer hashes, e.g. SHA-256, are cut to 20 bytes)."""
+        return np.array([bytes.fromhex(commit_hash)[:20] for commit_hash in hashes], dtype="S20")
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Returns mask of given binary hashes that are present in index."""
+        if not len(self) or not hashes.shape[0]:
+            return np.zeros(hashes.shape[0], dtype=bool)
+        positions = np.minimum(np.searchsorted(self._hashes, hashes), len(self) - 1)
+        return self._hashes[positions] == hashes
+
+    def get_first_seen(self, hashes: np.ndarray) -> np.ndarray:
+        """Returns mask of given binary hashes that are neither present in index nor repeated earlier in given array."""
+        first_seen = np.zeros(hashes.shape[0], dtype=bool)
+        _, first_idxs = np.unique(hashes, return_index=True)
+        first_seen[first_idxs] = True
+        return first_seen & ~self.contains(hashes)
+
+    def update(self, hashes: np.ndarray) -> None:
+        """Adds given binary hashes to index."""
+        self._hashes = np.union1d(self._hashes, hashes)
@@ -0,0 +1,125 @@
+import fnmatch
+import re
+from typing import Any, Dict, List, Optional
+
+
+class ModsFilter:
+    """This class is used to filter out huge or useless modifications (e.g. vendored code, minified files, lock files,
+    generated code) at mining time, before they are serialized and passed to later stages.
+
+    Number of filtered modifications (and commits) for each reason is stored in `counts`.
+
+    Args:
+        max_diff_bytes: Maximum size of diff of a single file (in bytes, utf-8). Optional, not limited by default.
+        max_diff_lines: Maximum number of lines in diff of a single file. Optional, not limited by default.
+        max_files: Maximum number of modified files in a single commit. Optional, not limited by default.
+        exclude_paths: Glob patterns for paths of files to skip (e.g. `*.min.js`, `vendor/*`, `package-lock.json`);
+            pattern without `/` is matched against file name, otherwise against full path. Optional, default
+            value is None.
+        action: What to do with modifications (or commits) that exceed limits: `drop` them or `truncate` them
+            to the limit. Files matching `exclude_paths` are always dropped. Optional, default value is `drop`.
+    """
+
+    def __init__(
+        self,
+        max_diff_bytes: Optional[int] = None,
+        max_diff_lines: Optional[int] = None,
+        max_files: Optional[int] = None,
+        exclude_paths: Optional[List[str]] = None,
+        action: str = "drop",
+    ):
+        if action not in ["drop", "truncate"]:
+            raise ValueError("Unknown action. Currently supported are `drop` and `truncate`.")
+        self._max_diff_bytes = max_diff_bytes
+        self._max_diff_lines = max_diff_lines
+        self._max_files = max_files
+        self._action = action
+
+        exclude_paths = list(exclude_paths) if exclude_paths else []
+        self._name_pattern = self._compile([pattern for pattern in exclude_paths if "/" not in pattern])
+        self._path_pattern = self._compile([pattern for pattern in exclude_paths if "/" in pattern])
+
+        self.counts: Dict[str, int] = {}
+        self.reset()
+
+    @property
+    def is_active(self) -> bool:
+        """Whether at least one limit or pattern is set (otherwise filter doesn't change anything)."""
+        limits = [self._max_diff_bytes, self._max_diff_lines, self._max_files, self._name_pattern, self._path_pattern]
+        return any(limit is not None for limit in limits)
+
+    @staticmethod
+    def _compile(patterns: List[str]) -> Optional["re.Pattern"]:
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns))
+
+    def reset(self) -> None:
+        """Sets all counts to zero."""
+        self.counts = {"path": 0, "bytes": 0, "lines": 0, "files": 0, "truncated": 0}
+
+    def _is_excluded(self, path: Optional[str]) -> bool:
+        if path is None:
+            return False
+        if self._path_pattern is not None and self._path_pattern.match(path):
+            return True
+        return self._name_pattern is not None and self._name_pattern.match(path.rsplit("/", 1)[-1]) is not None
+
+    def skip_paths(self, old_path: Optional[str], new_path: Optional[str]) -> bool:
+        """Checks whether modification of file with given paths should be skipped (does not require its diff)."""
+        if self._is_excluded(new_path) or self._is_excluded(old_path):
+            self.counts["path"] += 1
+            return True
+        return False
+
+    def filter_diff(self, diff: str) -> Optional[str]:
+        """Returns diff of a single file (truncated when necessary) or None when it should be dropped."""
+        if self._max_diff_lines is not None and diff.count("\n") > self._max_diff_lines:
+            self.counts["lines"] += 1
+            if self._action == "drop":
+                return None
+            self.counts["truncated"] += 1
+            # lines are split by "\n" only, the same way they are counted
+            diff = "".join(f"{line}\n" for line in diff.split("\n", self._max_diff_lines)[: self._max_diff_lines])
+
+        # each character takes at most 4 bytes in utf-8, so short diffs are not encoded
+        if self._max_diff_bytes is not None and len(diff) * 4 > self._max_diff_bytes:
+            diff_bytes = diff.encode("utf-8", errors="surrogatepass")
+            if len(diff_bytes) > self._max_diff_bytes:
+                self.counts["bytes"] += 1
+                if self._action == "drop":
+                    return None
+                self.counts["truncated"] += 1
+                # cut at the last line boundary that fits into the limit
+                diff_bytes = diff_bytes[: self._max_diff_bytes]
+                diff_bytes = diff_bytes[: diff_bytes.rfind(b"\n") + 1]
+                diff = diff_bytes.decode("utf-8", errors="ignore")
+        return diff
+
+    def filter_n_files(self, n_files: int) -> Optional[int]:
+        """Returns how many modifications of a commit with given # modified files should be kept
+        or None when the whole commit should be dropped.
+        """
+        if self._max_files is None or n_files <= self._max_files:
+            return n_files
+        self.counts["files"] += 1
+        if self._action == "drop":
+            return None
+        self.counts["truncated"] += 1
+        return self._max_files
+
+    def filter_commit(self, commit: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Filters modifications of already extracted commit. Returns None when the whole commit should be dropped."""
+        n_files = self.filter_n_files(len(commit["mods"]))
+        if n_files is None:
+            return None
+
+        mods = []
+        for mod in commit["mods"][:n_files]:
+            if self.skip_paths(mod["old_path"], mod["new_path"]):
+                continue
+            diff = self.filter_diff(mod["diff"])
+            if diff is None:
+                continue
+            mods.append({**mod, "diff": diff})
+        return {**commit, "mods": mods}
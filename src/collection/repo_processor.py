@@ -1,22 +1,52 @@
-import gzip
+import json
 import os
+import shutil
+import time
 from configparser import NoOptionError
-from typing import Optional
+from itertools import chain, count
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-import pandas as pd
+import numpy as np
+import orjson
+from joblib import Parallel, delayed
 from pydriller import RepositoryMining
 from tqdm import tqdm
 
 from ..utils import BaseProcessor
+from ..utils.base_utils import BufferedFileWriter
+from ..utils.compression import COMPRESSION_EXTENSIONS, open_compressed
+from ..utils.histogram import IntHistogram
+from ..utils.n_tokens import get_n_tokens_mods, get_n_tokens_str, save_n_tokens_source
+from .clone_cache import CloneCache
 from .commit_processor import CommitProcessor
+from .git_log_miner import GitLogMiner
+from .hash_index import HashIndex
+from .mods_filter import ModsFilter
 
 
 class RepoProcessor(BaseProcessor):
     """Mines commit information from given repository.
 
     Args:
-        temp_clone_dir: Directory to clone git repositories to.
+        temp_clone_dir: Directory to clone git repositories to (each one is cloned to `temp_clone_dir/org#repo`).
         output_dir: Directory to save mined data to.
+        backend: How to mine commits: `pydriller` or `git` (parse output of a single `git log --patch` process,
+            which is much faster, but only supports `only_commits` and `only_no_merge` arguments).
+            Optional, default value is `pydriller`.
+        max_commits_per_partition: When given, history of repositories with more commits is split into partitions
+            of this size, which are mined by separate workers from the same local clone and then merged.
+            Optional, by default each repository is mined by a single worker.
+        compression: Codec to compress mined commits with on the fly: `gzip` or `zstd`.
+            Optional, default value is `gzip`.
+        compression_level: Compression level. Optional, codec's default level is used when not given.
+        incremental: True to mine only new commits from already processed repositories (their clones are updated
+            via `git fetch`) and save them as a new segment; mined commits are listed in `manifest.json`
+            in repository directory. Optional, by default already processed repositories are skipped.
+        mods_filter: Keyword arguments for `ModsFilter` to drop or truncate huge or useless modifications
+            at mining time. Optional, all modifications are kept by default.
+        shared_objects: True to clone repositories with objects shared between them via a single repository
+            inside `temp_clone_dir` (see `CloneCache`), so that forks don't store (and download) the same objects.
+            Optional, default value is True.
     """
 
     def __init__(
@@ -27,101 +57,650 @@ class RepoProcessor(BaseProcessor):
         data_format: str,
         n_workers: Optional[int] = None,
         logger_name: Optional[str] = None,
+        backend: str = "pydriller",
+        max_commits_per_partition: Optional[int] = None,
+        compression: str = "gzip",
+        compression_level: Optional[int] = None,
+        incremental: bool = False,
+        mods_filter: Optional[Dict[str, Any]] = None,
+        shared_objects: bool = True,
     ):
         super().__init__(chunksize=chunksize, logger_name=logger_name, n_workers=n_workers, data_format=data_format)
         self._temp_clone_dir = temp_clone_dir
         self._output_dir = output_dir
 
-    def process_repo(self, repo_name: str, repo_url: str, **repo_kwargs) -> None:
-        """Mines commits from given repository.
+        if backend not in ["pydriller", "git"]:
+            raise ValueError("Unknown backend. Currently supported are `pydriller` and `git`.")
+        self._backend = backend
+        self._max_commits_per_partition = max_commits_per_partition
+
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Unknown compression. Currently supported are {list(COMPRESSION_EXTENSIONS)}.")
+        self._compression = compression
+        self._compression_level = compression_level
+        self._incremental = incremental
+        # filter without any limits or patterns (e.g. default config) would only log zero counts for each repo
+        self._mods_filter: Optional[ModsFilter] = ModsFilter(**mods_filter) if mods_filter else None
+        if self._mods_filter is not None and not self._mods_filter.is_active:
+            self._mods_filter = None
+        self._clone_cache = CloneCache(temp_clone_dir, shared_objects=shared_objects, logger_name=logger_name)
+
+    def _get_commits_fname(self, partition: Optional[int] = None, segment: Optional[int] = None) -> str:
+        """Returns name of file with mined commits from repository (or its partition or segment)."""
+        name = "commits"
+        if partition is not None:
+            name = f"commits.part_{partition}"
+        elif segment:
+            name = f"commits.segment_{segment}"
+        return f"{name}.{self.data_format}.{COMPRESSION_EXTENSIONS[self._compression]}"
+
+    def _load_manifest(self, repo_name: str) -> Dict[str, Any]:
+        """Returns manifest of given repository: names of files with mined commits (segments) in the order
+        they were mined, hashes of all mined commits and the last mined commit.
+
+        For repositories processed without manifest, it is built from the file with mined commits.
+        """
+        manifest_fname = os.path.join(self._output_dir, repo_name, "manifest.json")
+        if os.path.exists(manifest_fname):
+            with open(manifest_fname, "r") as f:
+                return json.load(f)
+
+        with open_compressed(
+            os.path.join(self._output_dir, repo_name, self._get_commits_fname()),
+            mode="rb",
+            compression=self._compression,
+        ) as f:
+            hashes = [orjson.loads(line)["hash"] for line in f]
+        return {
+            "segments": [self._get_commits_fname()],
+            "hashes": hashes,
+            "last_commit": hashes[-1] if hashes else None,
+        }
+
+    def _save_manifest(self, repo_name: str, manifest: Dict[str, Any]) -> None:
+        manifest_fname = os.path.join(self._output_dir, repo_name, "manifest.json")
+        with open(f"{manifest_fname}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_fname}.tmp", manifest_fname)
+
+    def _get_segment_fnames(self, repo_name: str) -> List[str]:
+        """Returns paths to all files with mined commits from given repository in the order they were mined."""
+        repo_dir = os.path.join(self._output_dir, repo_name)
+        if os.path.exists(os.path.join(repo_dir, "manifest.json")):
+            return [os.path.join(repo_dir, fname) for fname in self._load_manifest(repo_name)["segments"]]
+        return [os.path.join(repo_dir, self._get_commits_fname())]
+
+    def _get_new_commits(
+        self, repo_name: str, repo_url: str, manifest: Dict[str, Any], **repo_kwargs
+    ) -> Optional[List[str]]:
+        """Updates local clone of given repository and returns hashes of commits that are not mined yet."""
+        try:
+            repo_path = self._get_repo_path(repo_name, repo_url)
+            CloneCache.fetch(repo_path)
+            commit_hashes = GitLogMiner.get_commit_hashes(
+                repo_path, only_no_merge=repo_kwargs.get("only_no_merge", False)
+            )
+        except Exception as e:  # sometimes random errors can happen during fetching (e.g. if repo was deleted)
+            self.logger.error(f"[{repo_name}] Couldn't update; {e}")
+            return None
+
+        mined_commits = set(manifest["hashes"])
+        commit_hashes = [commit_hash for commit_hash in commit_hashes if commit_hash not in mined_commits]
+        if repo_kwargs.get("only_commits") is not None:
+            only_commits = set(repo_kwargs["only_commits"])
+            commit_hashes = [commit_hash for commit_hash in commit_hashes if commit_hash in only_commits]
+        return commit_hashes
+
+    def _get_repo_path(self, repo_name: str, repo_url: str) -> str:
+        """Returns path to local clone of given repository, cloning it first when necessary."""
+        return self._clone_cache.get(repo_name, repo_url)
+
+    def _traverse_commits_pydriller(self, repo_name: str, repo_url: str, **repo_kwargs) -> Iterator[Dict[str, Any]]:
+        repo = RepositoryMining(self._get_repo_path(repo_name, repo_url), **repo_kwargs)
+
+        for commit in repo.traverse_commits():
+            try:
+                cur_data = CommitProcessor.process_commit(commit, self._mods_filter)
+            except (AttributeError, NoOptionError) as e:
+                self.logger.error(f"[{repo_name}] {e} with {commit.hash}")
+                continue
+            if cur_data is not None:
+                yield cur_data
+
+    def _traverse_commits_git(self, repo_name: str, repo_url: str, **repo_kwargs) -> Iterator[Dict[str, Any]]:
+        unsupported_kwargs = set(repo_kwargs) - {"only_commits", "only_no_merge"}
+        if unsupported_kwargs:
+            self.logger.warning(f"[{repo_name}] Arguments {sorted(unsupported_kwargs)} are ignored by `git` backend")
+
+        miner = GitLogMiner(
+            self._get_repo_path(repo_name, repo_url),
+            only_commits=repo_kwargs.get("only_commits"),
+            only_no_merge=repo_kwargs.get("only_no_merge", False),
+        )
+        for cur_data in miner.traverse_commits():
+            if self._mods_filter is not None:
+                cur_data = self._mods_filter.filter_commit(cur_data)
+            if cur_data is not None:
+                yield cur_data
+
+    def get_partitions(self, repo_name: str, repo_url: str, **repo_kwargs) -> List[Dict[str, Any]]:
+        """Splits history of given repository into partitions that can be mined in parallel.
+
+        Partitions are consecutive ranges of commits in the order they are mined (from the oldest one),
+        so merging their outputs in order gives the same file as mining the whole repository at once.
 
         Args:
             repo_name: Full repository name, including author/organization.
             repo_url: A valid url to remote repository.
-            **repo_kwargs: Arbitrary keyword arguments, will be passed to `pydriller.RepositoryMining`.
+            **repo_kwargs: Arbitrary keyword arguments, will be passed to `process_repo`.
+
+        Returns:
+            A list of keyword arguments for `process_repo`, one for each partition.
+        """
+        repo_task = {"repo_name": repo_name, "repo_url": repo_url, **repo_kwargs}
+        if self._max_commits_per_partition is None or self._get_commits_fname() in os.listdir(
+            os.path.join(self._output_dir, repo_name)
+        ):
+            return [repo_task]
+
+        try:
+            commit_hashes = GitLogMiner.get_commit_hashes(
+                self._get_repo_path(repo_name, repo_url), only_no_merge=repo_kwargs.get("only_no_merge", False)
+            )
+        except Exception as e:  # sometimes random errors can happen during cloning (e.g. if repo was deleted)
+            self.logger.error(f"[{repo_name}] Couldn't clone; {e}")
+            return [repo_task]
+
+        if repo_kwargs.get("only_commits") is not None:
+            only_commits = set(repo_kwargs["only_commits"])
+            commit_hashes = [commit_hash for commit_hash in commit_hashes if commit_hash in only_commits]
+
+        if len(commit_hashes) <= self._max_commits_per_partition:
+            return [repo_task]
+
+        self.logger.info(f"[{repo_name}] Splitting {len(commit_hashes)} commits into partitions")
+        return [
+            {**repo_task, "only_commits": commit_hashes[i : i + self._max_commits_per_partition], "partition": j}
+            for j, i in enumerate(range(0, len(commit_hashes), self._max_commits_per_partition))
+        ]
+
+    def merge_partitions(self, repo_name: str, n_partitions: int) -> None:
+        """Merges mined partitions of given repository into a single file in the original order.
+
+        Args:
+            repo_name: Full repository name, including author/organization.
+            n_partitions: Number of partitions repository was split into.
         """
-        out_fname = os.path.join(self._output_dir, repo_name, "commits")
+        repo_dir = os.path.join(self._output_dir, repo_name)
+        if n_partitions <= 1 or self._get_commits_fname() in os.listdir(repo_dir):
+            return
 
-        # do not process already processed repos
-        if f"commits.{self.data_format}.gz" in os.listdir(os.path.join(self._output_dir, repo_name)):
+        partition_fnames = [os.path.join(repo_dir, self._get_commits_fname(partition=i)) for i in range(n_partitions)]
+        if not all(os.path.exists(fname) for fname in partition_fnames):
+            self.logger.error(f"[{repo_name}] Couldn't merge partitions, some of them are missing")
             return
 
-        # read already cloned repos from disk
-        if repo_url.split("/")[-1].replace(".git", "") in os.listdir(self._temp_clone_dir):
-            self.logger.debug(f"[{repo_name}] Already cloned")
-            repo = RepositoryMining(
-                f'{self._temp_clone_dir}/{repo_url.split("/")[-1].replace(".git", "")}', **repo_kwargs
+        # both gzip and zstd allow concatenating compressed files, so there is no need to recompress data
+        out_fname = os.path.join(repo_dir, self._get_commits_fname())
+        with open(f"{out_fname}.tmp", "wb") as f_out:
+            for fname in partition_fnames:
+                with open(fname, "rb") as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+        os.replace(f"{out_fname}.tmp", out_fname)
+
+        for fname in partition_fnames:
+            os.remove(fname)
+        self.logger.info(f"[{repo_name}] Merged {n_partitions} partitions")
+
+    def _load_progress(self, repo_name: str, repo_url: str, tmp_fname: str, **repo_kwargs) -> Optional[Dict[str, Any]]:
+        """Restores progress of previous (interrupted) mining to given temporary file.
+
+        Returns:
+            None when there is nothing to restore, otherwise a dictionary with hashes of commits that were already
+            saved to file and keyword arguments to mine the rest of commits with.
+        """
+        progress_fname = f"{tmp_fname}.progress.json"
+        if not os.path.exists(progress_fname) or not os.path.exists(tmp_fname):
+            return None
+        with open(progress_fname, "r") as f:
+            progress = json.load(f)
+
+        try:
+            commit_hashes = GitLogMiner.get_commit_hashes(
+                self._get_repo_path(repo_name, repo_url), only_no_merge=repo_kwargs.get("only_no_merge", False)
             )
-        else:
-            repo = RepositoryMining(repo_url, clone_repo_to=self._temp_clone_dir, **repo_kwargs)
+        except Exception as e:  # sometimes random errors can happen during cloning (e.g. if repo was deleted)
+            self.logger.warning(f"[{repo_name}] Couldn't restore progress, starting from scratch; {e}")
+            return None
+        if progress["last_commit"] not in commit_hashes:
+            self.logger.warning(f"[{repo_name}] Last mined commit is missing from history, starting from scratch")
+            return None
 
-        self.logger.info(f"[{repo_name}] Start processing")
+        # drop everything written after the last committed chunk
+        os.truncate(tmp_fname, progress["position"])
+        with open_compressed(tmp_fname, mode="rb", compression=self._compression) as f:
+            hashes = [orjson.loads(line)["hash"] for line in f]
 
-        self._prepare_outfile(out_fname)
+        commit_hashes = commit_hashes[commit_hashes.index(progress["last_commit"]) + 1 :]
+        if repo_kwargs.get("only_commits") is not None:
+            only_commits = set(repo_kwargs["only_commits"])
+            commit_hashes = [commit_hash for commit_hash in commit_hashes if commit_hash in only_commits]
+
+        self.logger.info(f"[{repo_name}] Continue processing after {len(hashes)} commits")
+        return {"hashes": hashes, "repo_kwargs": {**repo_kwargs, "only_commits": commit_hashes}}
+
+    def _commit_progress(self, tmp_fname: str, last_commit: str) -> None:
+        """Makes sure all data written to given temporary file is on disk and saves the last commit in it,
+        so that mining can be continued from this point if it is interrupted.
+        """
+        # closing writer finishes current gzip member (or zstd frame), new data is appended as a separate one
+        self._close_outfile(tmp_fname, add_data_format=False)
+        with open(tmp_fname, "rb") as f:
+            os.fsync(f.fileno())
+            position = f.seek(0, os.SEEK_END)
+
+        progress_fname = f"{tmp_fname}.progress.json"
+        with open(f"{progress_fname}.tmp", "w") as f:
+            json.dump({"last_commit": last_commit, "position": position}, f)
+        os.replace(f"{progress_fname}.tmp", progress_fname)
+
+        self._prepare_outfile(
+            tmp_fname,
+            add_data_format=False,
+            compression=self._compression,
+            compression_level=self._compression_level,
+            append=True,
+        )
+
+    def _mine_to_file(self, repo_name: str, repo_url: str, out_fname: str, **repo_kwargs) -> Optional[List[str]]:
+        """Mines commits from given repository to given file.
+
+        Each chunk of commits is committed to disk together with the last commit in it, so when mining is
+        interrupted, the next call continues after this commit instead of starting from scratch.
+
+        Returns:
+            Hashes of mined commits, None when mining failed.
+        """
+        # data is compressed on the fly to a temporary file, which is renamed when all commits are mined,
+        # so existence of output file means that repository (or partition) was fully processed
+        tmp_fname = f"{out_fname}.tmp"
+        progress_fname = f"{tmp_fname}.progress.json"
+
+        progress = self._load_progress(repo_name, repo_url, tmp_fname, **repo_kwargs)
+        if progress is not None:
+            hashes = progress["hashes"]
+            repo_kwargs = progress["repo_kwargs"]
+        else:
+            hashes = []
+            if os.path.exists(progress_fname):
+                os.remove(progress_fname)
+        self._prepare_outfile(
+            tmp_fname,
+            add_data_format=False,
+            compression=self._compression,
+            compression_level=self._compression_level,
+            append=progress is not None,
+        )
+
+        if self._backend == "git":
+            commits = self._traverse_commits_git(repo_name, repo_url, **repo_kwargs)
+        else:
+            commits = self._traverse_commits_pydriller(repo_name, repo_url, **repo_kwargs)
 
         commits_data = []
         try:
-            for commit in repo.traverse_commits():
-                try:
-                    cur_data = CommitProcessor.process_commit(commit)
-                except (AttributeError, NoOptionError) as e:
-                    self.logger.error(f"[{repo_name}] {e} with {commit.hash}")
-                    continue
-
+            for cur_data in commits:
                 commits_data.append(cur_data)
+                hashes.append(cur_data["hash"])
 
                 if len(commits_data) >= self._chunksize:
                     self.logger.debug(f"[{repo_name}] Processed more than {self._chunksize} commits, writing to file")
-                    self._append_to_outfile(commits_data, out_fname)
+                    self._append_to_outfile(commits_data, tmp_fname, add_data_format=False, as_records=True)
+                    self._commit_progress(tmp_fname, last_commit=cur_data["hash"])
                     commits_data = []
         except Exception as e:  # sometimes random errors can happen during cloning (e.g. if repo was deleted)
             self.logger.error(f"[{repo_name}] Couldn't clone; {e}")
-            return
+            self._close_outfile(tmp_fname, add_data_format=False)
+            # committed chunks are kept to continue from them next time
+            if not os.path.exists(progress_fname):
+                os.remove(tmp_fname)
+            return None
 
         if len(commits_data) > 0:
             self.logger.debug(f"[{repo_name}] Final writing to file")
-            self._append_to_outfile(pd.DataFrame.from_records(commits_data), out_fname)
+            self._append_to_outfile(commits_data, tmp_fname, add_data_format=False, as_records=True)
+        self._close_outfile(tmp_fname, add_data_format=False)
+        os.replace(tmp_fname, out_fname)
+        if os.path.exists(progress_fname):
+            os.remove(progress_fname)
+        return hashes
+
+    def process_repo(
+        self, repo_name: str, repo_url: str, partition: Optional[int] = None, **repo_kwargs
+    ) -> Optional[Dict[str, Any]]:
+        """Mines commits from given repository.
 
-        self.logger.debug(f"[{repo_name}] Zipping file")
-        with open(f"{out_fname}.{self.data_format}", "rb") as f_in, gzip.open(
-            f"{out_fname}.{self.data_format}.gz", "wb"
-        ) as f_out:
-            f_out.writelines(f_in)
-        os.remove(f"{out_fname}.{self.data_format}")
+        Already processed repositories are skipped, unless `incremental` is True: then commits that are not mined yet
+        are saved to a new segment.
+
+        Args:
+            repo_name: Full repository name, including author/organization.
+            repo_url: A valid url to remote repository.
+            partition: Index of partition to mine (see `get_partitions`). Optional, whole repository is mined
+                by default.
+            **repo_kwargs: Arbitrary keyword arguments, will be passed to `pydriller.RepositoryMining`
+                (or to `GitLogMiner`, when `git` backend is used).
+
+        Returns:
+            Timing of mining (see `RepoScheduler`) together with # modifications filtered by `mods_filter`
+            for each reason, None when there was nothing to mine or mining failed.
+        """
+        out_fname = os.path.join(self._output_dir, repo_name, self._get_commits_fname(partition=partition))
+
+        # do not process already processed repos (and partitions)
+        processed_fnames = os.listdir(os.path.join(self._output_dir, repo_name))
+        is_processed = self._get_commits_fname() in processed_fnames
+        if partition is not None:
+            if is_processed or os.path.basename(out_fname) in processed_fnames:
+                return None
+        elif is_processed and not self._incremental:
+            return None
+
+        start_time = time.perf_counter()
+        if self._mods_filter is not None:
+            self._mods_filter.reset()
+        manifest = None
+        if is_processed:
+            manifest = self._load_manifest(repo_name)
+            if "manifest.json" not in processed_fnames:
+                self._save_manifest(repo_name, manifest)
+
+            new_commits = self._get_new_commits(repo_name, repo_url, manifest, **repo_kwargs)
+            if not new_commits:
+                self.logger.debug(f"[{repo_name}] No new commits")
+                return None
+
+            out_fname = os.path.join(
+                self._output_dir, repo_name, self._get_commits_fname(segment=len(manifest["segments"]))
+            )
+            repo_kwargs = {**repo_kwargs, "only_commits": new_commits}
+            self.logger.info(f"[{repo_name}] Start processing {len(new_commits)} new commits")
+        elif partition is not None:
+            self.logger.info(f"[{repo_name}] Start processing partition {partition}")
+        else:
+            self.logger.info(f"[{repo_name}] Start processing")
+
+        hashes = self._mine_to_file(repo_name, repo_url, out_fname, **repo_kwargs)
+        if hashes is None:
+            return None
+
+        if manifest is not None:
+            manifest["segments"].append(os.path.basename(out_fname))
+            manifest["hashes"].extend(hashes)
+            if hashes:
+                manifest["last_commit"] = hashes[-1]
+            self._save_manifest(repo_name, manifest)
 
         self.logger.info(f"[{repo_name}] Finish processing")
+        res = {
+            "repo": repo_name,
+            "time": time.perf_counter() - start_time,
+            "n_hashes": len(repo_kwargs["only_commits"]) if repo_kwargs.get("only_commits") is not None else None,
+            "n_commits": len(hashes),
+        }
+        if self._mods_filter is not None:
+            self.logger.info(f"[{repo_name}] Filtered at mining time: {self._mods_filter.counts}")
+            res["filtered"] = dict(self._mods_filter.counts)
+        return res
+
+    def _count_commits(self, repo_name: str) -> Optional[int]:
+        """Returns # commits mined from given repository (None when its files can't be read)."""
+        try:
+            n_commits = 0
+            for fname in self._get_segment_fnames(repo_name):
+                with open_compressed(fname, mode="rb", compression=self._compression) as f:
+                    n_commits += sum(block.count(b"\n") for block in iter(lambda: f.read(16 * 1024 * 1024), b""))
+            return n_commits
+        except Exception as e:  # e.g. repo wasn't cloned or its file is corrupted
+            self.logger.error(f"[{repo_name}] Couldn't read; {e}")
+            return None
+
+    def _read_hashes(self, repo_name: str) -> Optional[np.ndarray]:
+        """Returns binary hashes of commits mined from given repository in the order they are saved
+        (None when its files can't be read).
+        """
+        try:
+            hashes = []
+            for fname in self._get_segment_fnames(repo_name):
+                with open_compressed(fname, mode="rb", compression=self._compression) as f:
+                    for line in f:
+                        # serialized commits are flat up to `hash` key, so its first occurrence is the key itself
+                        start = line.find(b'"hash":"') + len(b'"hash":"')
+                        end = line.find(b'"', start)
+                        hashes.append(
+                            line[start:end].decode() if start >= len(b'"hash":"') else orjson.loads(line)["hash"]
+                        )
+            return HashIndex.to_binary(hashes)
+        except Exception as e:  # e.g. repo wasn't cloned or its file is corrupted
+            self.logger.error(f"[{repo_name}] Couldn't read; {e}")
+            return None
+
+    def _unite_repo(
+        self,
+        repo_name: str,
+        id_ranges: List[List[int]],
+        out_fname: str,
+        org_repo_sep: str,
+        count_tokens: bool = False,
+        first_seen: Optional[np.ndarray] = None,
+        duplicates: str = "drop",
+    ) -> Optional[np.ndarray]:
+        """Copies commits from given repository to separate file, adding ids (from given [first id, # ids] ranges)
+        and repository name to each line as is, without parsing JSON.
+
+        When `count_tokens` is True, each line is also parsed to count tokens in its diff and message
+        the same way `OutliersProcessor` does; (id, # tokens in diff, # tokens in message) triples are returned.
+
+        When `first_seen` mask is given, commits already seen in other repositories are either skipped
+        (`duplicates="drop"`, their ids stay unused) or marked with `is_duplicate` key (`duplicates="flag"`).
+        """
+        repo_suffix = b'"repo":' + orjson.dumps(repo_name.replace(org_repo_sep, "/"))
+        suffix = repo_suffix + b"}\n"
+        # when duplicates are flagged, suffix depends on whether commit is seen for the first time
+        flagged_suffixes: Optional[Dict[bool, bytes]] = None
+        if first_seen is not None and duplicates == "flag":
+            flagged_suffixes = {
+                True: repo_suffix + b',"is_duplicate":false}\n',
+                False: repo_suffix + b',"is_duplicate":true}\n',
+            }
+        ids = chain.from_iterable(range(first_id, first_id + n_ids) for first_id, n_ids in id_ranges)
+        line_idx = count()
+        n_tokens: List[Tuple[int, int, int]] = []
+        writer = BufferedFileWriter(out_fname, mode="wb")
+        for fname in self._get_segment_fnames(repo_name):
+            with open_compressed(fname, mode="rb", compression=self._compression) as f:
+                for line, cur_id in zip(f, ids):
+                    is_first_seen = first_seen is None or bool(first_seen[next(line_idx)])
+                    if not is_first_seen and duplicates == "drop":
+                        continue
+                    if count_tokens:
+                        n_tokens.append((cur_id, *self._get_n_tokens(cur_id, orjson.loads(line))))
+                    # each line is a JSON object, so new keys are inserted before its closing bracket
+                    line = line.rstrip()[:-1]
+                    cur_suffix = suffix if flagged_suffixes is None else flagged_suffixes[is_first_seen]
+                    writer.write(b"".join([line, b"," if line != b"{" else b"", b'"id":%d,' % cur_id, cur_suffix]))
+        writer.close()
+
+        if not count_tokens:
+            return None
+        return np.array(n_tokens, dtype=np.int64).reshape(-1, 3)
 
-    def unite_files(self, out_fname: str, org_repo_sep: str) -> None:
+    def _get_n_tokens(self, id: int, commit: Dict[str, Any]) -> Tuple[int, int]:
+        """Returns # of tokens in diff and message of given commit (-1 in case of errors)."""
+        n_tokens = []
+        for get_n_tokens, value in [(get_n_tokens_mods, commit["mods"]), (get_n_tokens_str, commit["message"])]:
+            try:
+                n_tokens.append(get_n_tokens(value))
+            except TypeError as e:
+                self.logger.warning(f"TypeError {e} with {id}")
+                n_tokens.append(-1)
+        return n_tokens[0], n_tokens[1]
+
+    @staticmethod
+    def _save_n_tokens(n_tokens: List[np.ndarray], n_tokens_dir: str, data_fname: str) -> None:
+        """Saves # of tokens in diffs and messages in the same format as `OutliersProcessor` does:
+        binary file with (id, # tokens) pairs as int64 and histogram of # tokens for each of them,
+        together with a marker of data file they belong to.
+        """
+        os.makedirs(n_tokens_dir, exist_ok=True)
+        n_tokens = np.concatenate(n_tokens) if n_tokens else np.empty((0, 3), dtype=np.int64)
+        for i, key in enumerate(["diff", "message"], start=1):
+            pairs = np.ascontiguousarray(n_tokens[:, [0, i]])
+            pairs.tofile(os.path.join(n_tokens_dir, f"n_tokens_{key}.bin"))
+
+            histogram = IntHistogram()
+            histogram.update(pairs[pairs[:, 1] != -1, 1].tolist())
+            histogram.save(os.path.join(n_tokens_dir, f"{key}_hist.json"))
+        save_n_tokens_source(n_tokens_dir, data_fname)
+
+    def _get_first_seen(self, repos_hashes: Dict[str, np.ndarray], hash_index: HashIndex) -> Dict[str, np.ndarray]:
+        """Returns masks of commits seen for the first time for each repository (in the given order of repositories)
+        and adds their hashes to given index.
+        """
+        hashes = np.concatenate(list(repos_hashes.values())) if repos_hashes else np.empty(0, dtype="S20")
+        first_seen = hash_index.get_first_seen(hashes)
+        hash_index.update(hashes[first_seen])
+        self.logger.info(f"Found {int((~first_seen).sum())} duplicated commits out of {hashes.shape[0]}")
+
+        ends = np.cumsum([repo_hashes.shape[0] for repo_hashes in repos_hashes.values()], dtype=np.int64)
+        return dict(zip(repos_hashes, np.split(first_seen, ends[:-1])))
+
+    @staticmethod
+    def _assign_ids(
+        n_commits: Dict[str, int], id_map: Dict[str, Any]
+    ) -> Tuple[Dict[str, List[List[int]]], Dict[str, Any]]:
+        """Assigns ids to commits from each repository.
+
+        Commits that already have ids in `id_map` keep them, new commits (from new repositories or new segments)
+        get new ids after the largest assigned one.
+
+        Args:
+            n_commits: # commits in each repository.
+            id_map: Ranges of ids ([first id, # ids]) assigned to each repository in previous runs.
+
+        Returns:
+            Ranges of ids for each repository and updated id map.
+        """
+        repos_id_ranges = {
+            repo_name: [list(id_range) for id_range in id_ranges] for repo_name, id_ranges in id_map["repos"].items()
+        }
+        next_id = id_map["next_id"]
+
+        for repo_name, cur_n_commits in n_commits.items():
+            id_ranges = repos_id_ranges.setdefault(repo_name, [])
+            n_assigned = sum(n_ids for _, n_ids in id_ranges)
+            if cur_n_commits > n_assigned:
+                id_ranges.append([next_id, cur_n_commits - n_assigned])
+                next_id += cur_n_commits - n_assigned
+
+        return {repo_name: repos_id_ranges[repo_name] for repo_name in n_commits}, {
+            "repos": repos_id_ranges,
+            "next_id": next_id,
+        }
+
+    def unite_files(
+        self,
+        out_fname: str,
+        org_repo_sep: str,
+        n_tokens_dir: Optional[str] = None,
+        hash_index: Optional[HashIndex] = None,
+        duplicates: str = "drop",
+    ) -> None:
         """Unites separate repositories files, add unique ids, repositories names and licences types as features.
 
         For faster data collection, initially commits from each repo are saved to its own file.
 
+        Repositories are processed in parallel: first, # commits in each repository is counted
+        to assign contiguous ranges of ids, then `id` and `repo` are added to each line of each repository
+        without parsing it, and finally files for all repositories are concatenated in order.
+
+        Assigned ids are saved to `{out_fname}.ids.json`, so that when data is collected again (e.g. with new commits
+        mined incrementally), already existing commits keep their ids.
+
         Args:
             out_fname: Path to resulting single file.
             org_repo_sep: Delimiter used instead of '/' in full repository name.
+            n_tokens_dir: When given, # of tokens in diffs and messages are counted while commits are
+                copied and saved to this directory, so that `OutliersProcessor` can reuse them instead of reading
+                the whole data once more. Optional, default value is None.
+            hash_index: When given, commits with hashes from this index or repeated in several repositories
+                (e.g. forks and mirrors) are treated as duplicates; only the first seen copy is kept as is,
+                and hashes of united commits are added to index (so when parts are united one after another
+                with the same index, duplicates are kept in the earliest part, e.g. in train). Optional,
+                by default commits are not deduplicated.
+            duplicates: What to do with duplicated commits: `drop` them (their ids stay unused) or `flag` them
+                with `is_duplicate` key. Optional, default value is `drop`.
         """
-        self._prepare_outfile(out_fname)
+        if duplicates not in ["drop", "flag"]:
+            raise ValueError("Unknown duplicates action. Currently supported are `drop` and `flag`.")
+
+        if not self._data_manager.supports_byte_offsets:
+            # commits are mined to (compressed) jsonl files, which are only supported by `JsonlManager`
+            raise NotImplementedError("Currently only jsonl data can be collected")
 
-        cur_idx = 0
-        for repo_name in tqdm(os.listdir(self._output_dir), desc=f"Processing commits from each repo", leave=False):
-            # read data in chunks
-            reader = self._read_input(
-                os.path.join(self._output_dir, repo_name, f"commits.{self.data_format}.gz"),
-                compression="gzip",
-                add_data_format=False,
+        id_map_fname = f"{out_fname}.ids.json"
+        id_map = {"repos": {}, "next_id": 0}
+        if os.path.exists(id_map_fname):
+            with open(id_map_fname, "r") as f:
+                id_map = json.load(f)
+
+        repo_names = os.listdir(self._output_dir)
+        with Parallel(self._n_workers) as pool:
+            if hash_index is None:
+                n_commits = pool(delayed(self._count_commits)(repo_name) for repo_name in repo_names)
+            else:
+                repos_hashes = dict(zip(repo_names, pool(delayed(self._read_hashes)(name) for name in repo_names)))
+                n_commits = [None if hashes is None else hashes.shape[0] for hashes in repos_hashes.values()]
+
+            # aggregate № examples so that each example from every repo has an unique id
+            repos_id_ranges, id_map = self._assign_ids(
+                {
+                    repo_name: cur_n_commits
+                    for repo_name, cur_n_commits in zip(repo_names, n_commits)
+                    if cur_n_commits is not None
+                },
+                id_map,
             )
-            cur_len = 0
-            try:
-                for i, chunk in enumerate(reader):
-                    # aggregate № examples so that each example from every repo has an unique id
-                    chunk["id"] = chunk.index
-                    chunk["id"] += cur_idx
-                    chunk["repo"] = repo_name.replace(org_repo_sep, "/")
+            repos = [(repo_name, f"{out_fname}.part_{i}") for i, repo_name in enumerate(repos_id_ranges)]
+
+            repos_first_seen: Dict[str, Optional[np.ndarray]] = {repo_name: None for repo_name, _ in repos}
+            if hash_index is not None:
+                repos_first_seen = self._get_first_seen(
+                    {repo_name: repos_hashes[repo_name] for repo_name, _ in repos}, hash_index
+                )
 
-                    self._append_to_outfile(chunk, out_fname)
+            n_tokens = pool(
+                delayed(self._unite_repo)(
+                    repo_name,
+                    repos_id_ranges[repo_name],
+                    f"{part_fname}.{self.data_format}",
+                    org_repo_sep,
+                    count_tokens=bool(n_tokens_dir),
+                    first_seen=repos_first_seen[repo_name],
+                    duplicates=duplicates,
+                )
+                for repo_name, part_fname in repos
+            )
+
+        self._prepare_outfile(out_fname)
+        for _, part_fname in tqdm(repos, desc="Concatenating commits from each repo", leave=False):
+            self._data_manager.append_file_to_outfile(part_fname, out_fname)
+        self._close_outfile(out_fname)
 
-                    cur_len += chunk.shape[0]
+        if n_tokens_dir:
+            self._save_n_tokens(n_tokens, n_tokens_dir, self._data_manager._get_fname(out_fname))
 
-                cur_idx += cur_len
-            except ValueError as e:
-                self.logger.error(f"[{repo_name}] Couldn't read; {e}")
+        with open(f"{id_map_fname}.tmp", "w") as f:
+            json.dump(id_map, f)
+        os.replace(f"{id_map_fname}.tmp", id_map_fname)
+        self.logger.info(f"United {sum(n for n in n_commits if n is not None)} commits from {len(repos)} repos")
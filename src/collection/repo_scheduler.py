@@ -0,0 +1,109 @@
+import json
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from .clone_cache import CloneCache
+
+
+class RepoScheduler:
+    """This class is used to order repositories (or their partitions) for mining, so that the most expensive ones
+    start first and the pool doesn't end up waiting for a single large repository.
+
+    Cost of each task is estimated in seconds:
+
+    * when repository was mined before, its measured time per commit from timings log is used;
+    * otherwise, # commits to mine (length of `only_commits`) is multiplied by average time per commit;
+    * for tasks without `only_commits`, size of local clone is multiplied by average time per byte.
+
+    Args:
+        timings_fname: Path to timings log (JSON Lines, one record for each mined repository).
+            Optional, when not given, costs are estimated only from # commits and clone sizes.
+        temp_clone_dir: Directory git repositories are cloned to. Optional, required to use clone sizes.
+    """
+
+    # rough estimates used while there are no measurements yet
+    _DEFAULT_TIME_PER_COMMIT = 0.01
+    _DEFAULT_BYTES_PER_COMMIT = 10_000
+
+    def __init__(self, timings_fname: Optional[str] = None, temp_clone_dir: Optional[str] = None):
+        self._timings_fname = timings_fname
+        self._temp_clone_dir = temp_clone_dir
+        self._timings = self._load_timings()
+
+        measured_n_hashes = [t for t in self._timings.values() if t["n_hashes"]]
+        self._time_per_commit = (
+            sum(t["time"] for t in measured_n_hashes) / sum(t["n_hashes"] for t in measured_n_hashes)
+            if measured_n_hashes
+            else self._DEFAULT_TIME_PER_COMMIT
+        )
+        measured_sizes = [t for t in self._timings.values() if t.get("clone_size")]
+        self._time_per_byte = (
+            sum(t["time"] for t in measured_sizes) / sum(t["clone_size"] for t in measured_sizes)
+            if measured_sizes
+            else self._DEFAULT_TIME_PER_COMMIT / self._DEFAULT_BYTES_PER_COMMIT
+        )
+
+    def _load_timings(self) -> Dict[str, Dict[str, Any]]:
+        if not self._timings_fname or not os.path.exists(self._timings_fname):
+            return {}
+        with open(self._timings_fname, "r") as f:
+            # when the same repository was mined several times, the latest record is used
+            return {timing["repo"]: timing for timing in map(json.loads, f)}
+
+    def _get_clone_size(self, repo_name: str) -> Optional[int]:
+        # note that with shared objects, objects borrowed from other clones are not counted
+        if not self._temp_clone_dir:
+            return None
+        repo_path = CloneCache(self._temp_clone_dir).get_path(repo_name)
+        if not os.path.exists(repo_path):
+            return None
+        return sum(
+            os.path.getsize(os.path.join(root, fname)) for root, _, fnames in os.walk(repo_path) for fname in fnames
+        )
+
+    def get_cost(self, task: Dict[str, Any]) -> float:
+        """Estimates time required to mine given task.
+
+        Args:
+            task: Keyword arguments for `RepoProcessor.process_repo` (or `RepoProcessor.get_partitions`).
+        """
+        timing = self._timings.get(task["repo_name"])
+
+        if task.get("only_commits") is not None:
+            if timing and timing["n_hashes"]:
+                return len(task["only_commits"]) * timing["time"] / timing["n_hashes"]
+            return len(task["only_commits"]) * self._time_per_commit
+
+        if timing:
+            return timing["time"]
+        clone_size = self._get_clone_size(task["repo_name"])
+        return clone_size * self._time_per_byte if clone_size is not None else 0.0
+
+    def schedule(self, tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Returns given tasks sorted from the most expensive to the cheapest one."""
+        return sorted(tasks, key=self.get_cost, reverse=True)
+
+    def save_timings(self, timings: List[Optional[Dict[str, Any]]]) -> None:
+        """Appends measured timings to timings log (timings of partitions are summed for each repository).
+
+        Args:
+            timings: Outputs of `RepoProcessor.process_repo` (None for skipped tasks).
+        """
+        if not self._timings_fname:
+            return
+
+        repo_timings: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"time": 0.0, "n_hashes": 0, "n_commits": 0})
+        for timing in timings:
+            if timing is None:
+                continue
+            repo_timing = repo_timings[timing["repo"]]
+            repo_timing["time"] += timing["time"]
+            repo_timing["n_hashes"] += timing["n_hashes"] or 0
+            repo_timing["n_commits"] += timing["n_commits"]
+
+        with open(self._timings_fname, "a") as f:
+            for repo_name, repo_timing in repo_timings.items():
+                record = {"repo": repo_name, **repo_timing, "clone_size": self._get_clone_size(repo_name)}
+                f.write(json.dumps(record) + "\n")
+                self._timings[repo_name] = record
@@ -37,12 +37,16 @@ def main(cfg: DictConfig) -> None:
     processor(
         in_fname=os.path.join(cfg.paths.input_dir, "lexed", "train"),
         out_fname=os.path.join(cfg.paths.input_dir, "lexed", "train_no_duplicates"),
+        checkpoint=cfg.checkpoint,
+        n_shards=cfg.n_shards.post_deduplication_processor,
         prepare_diff_clones_fname=os.path.join(cfg.paths.deduplication_dir, "results_messages_100.pairs"),
         prepare_msg_clones_fname=os.path.join(cfg.paths.deduplication_dir, "results_diffs_100.pairs"),
     )
     processor(
         in_fname=os.path.join(cfg.paths.input_dir, "tokenization", "train"),
         out_fname=os.path.join(cfg.paths.input_dir, "tokenization", "train_no_duplicates"),
+        checkpoint=cfg.checkpoint,
+        n_shards=cfg.n_shards.post_deduplication_processor,
         prepare_is_ready=True,
         prepare_diff_clones_fname=os.path.join(cfg.paths.deduplication_dir, "results_messages_100.pairs"),
         prepare_msg_clones_fname=os.path.join(cfg.paths.deduplication_dir, "results_diffs_100.pairs"),
@@ -59,6 +63,8 @@ def main(cfg: DictConfig) -> None:
         processor(
             in_fname=os.path.join(cfg.paths.input_dir, "lexed", part + ("_no_duplicates" if part == "train" else "")),
             out_fname=os.path.join(cfg.paths.input_dir, f"{part}_final"),
+            checkpoint=cfg.checkpoint,
+            n_shards=cfg.n_shards.final_processor,
             prepare_license_in_fname=os.path.join(cfg.paths.licenses_dir, "repo_license_map.json"),
             prepare_in_fnames=[os.path.join(cfg.paths.input_dir, part) for part in parts],
         )
@@ -68,6 +74,8 @@ def main(cfg: DictConfig) -> None:
                 cfg.paths.input_dir, "tokenization", part + ("_no_duplicates" if part == "train" else "")
             ),
             out_fname=os.path.join(cfg.paths.input_dir, "tokenization", f"{part}_final"),
+            checkpoint=cfg.checkpoint,
+            n_shards=cfg.n_shards.final_processor,
             prepare_license_in_fname=os.path.join(cfg.paths.licenses_dir, "repo_license_map.json"),
             prepare_in_fnames=[os.path.join(cfg.paths.input_dir, part) for part in parts],
         )
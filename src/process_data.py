@@ -1,5 +1,6 @@
 import logging
 import os
+from typing import List
 
 import hydra
 from hydra.utils import to_absolute_path
@@ -7,6 +8,7 @@ from omegaconf import DictConfig
 
 from .processing import (
     DiffProcessor,
+    FusedProcessor,
     Lexer,
     MessageProcessor,
     OutliersProcessor,
@@ -14,11 +16,75 @@ from .processing import (
 )
 
 
+def run_fused(cfg: DictConfig, parts: List[str]) -> None:
+    """Runs all processing stages over a single read of each part, saving only lexed data
+    and data in SourcererCC format.
+    """
+    if cfg.checkpoint:
+        logging.warning("Checkpoints are not supported in fused mode, `checkpoint` is ignored")
+    fused_stages = ["outliers_processor", "message_processor", "diff_processor", "lexer", "pre_deduplication_processor"]
+    sharded_stages = [stage for stage in fused_stages if cfg.n_shards[stage] > 1]
+    if sharded_stages:
+        logging.warning(f"Sharding is not supported in fused mode, `n_shards` is ignored for {sharded_stages}")
+
+    os.makedirs(os.path.join(cfg.paths.input_dir, "lexed"), exist_ok=True)
+    os.makedirs(os.path.join(cfg.paths.input_dir, "tokenization"), exist_ok=True)
+    os.makedirs(os.path.join(cfg.paths.deduplication_dir, "raw"), exist_ok=True)
+
+    outliers_processor = OutliersProcessor(
+        **cfg.outliers_processor, data_format=cfg.data_format, logger_name="outliers_processor"
+    )
+    lexer = Lexer(**cfg.lexer, data_format=cfg.data_format, logger_name="lexer")
+    for part_id, part in enumerate(parts):
+        os.makedirs(os.path.join(cfg.paths.tokens_percentile_dir, part), exist_ok=True)
+        os.makedirs(os.path.join(cfg.paths.literals_percentile_dir, part), exist_ok=True)
+
+        tokens_percentile_dir, literals_percentile_dir = None, None
+        if part != "train":
+            tokens_percentile_dir = os.path.join(cfg.paths.tokens_percentile_dir, "train")
+            literals_percentile_dir = os.path.join(cfg.paths.literals_percentile_dir, "train")
+
+        processor = FusedProcessor(
+            outliers_processor=outliers_processor,
+            message_processor=MessageProcessor(
+                **cfg.message_processor, data_format=cfg.data_format, logger_name="message_processor"
+            ),
+            diff_processor=DiffProcessor(
+                **cfg.diff_processor, data_format=cfg.data_format, logger_name="diff_processor"
+            ),
+            lexer=lexer,
+            pre_deduplication_processor=PreDeduplicationProcessor(
+                **cfg.pre_deduplication_processor,
+                project_id=part_id + 1,
+                data_format=cfg.data_format,
+                logger_name="prededupl_processor",
+            ),
+            **cfg.fused_processor,
+            data_format=cfg.data_format,
+            logger_name="fused_processor",
+        )
+
+        logging.info(f"Processing {part}")
+        processor(
+            in_fname=os.path.join(cfg.paths.input_dir, part),
+            out_fname=os.path.join(cfg.paths.input_dir, "lexed", part),
+            delimiter_out_fname=os.path.join(cfg.paths.input_dir, "tokenization", part),
+            message_dedup_out_fname=os.path.join(cfg.paths.deduplication_dir, "raw", f"{part}_message.txt"),
+            diff_dedup_out_fname=os.path.join(cfg.paths.deduplication_dir, "raw", f"{part}_diffs.txt"),
+            prepare_n_tokens_dir=os.path.join(cfg.paths.tokens_percentile_dir, part),
+            prepare_literals_len_dir=os.path.join(cfg.paths.literals_percentile_dir, part),
+            prepare_tokens_percentile_dir=tokens_percentile_dir,
+            prepare_literals_percentile_dir=literals_percentile_dir,
+        )
+
+
 @hydra.main(config_path="../configs", config_name="process_data")
 def main(cfg: DictConfig) -> None:
     for key in cfg.paths:
         cfg.paths[key] = to_absolute_path(cfg.paths[key])
         os.makedirs(cfg.paths[key], exist_ok=True)
+    if cfg.lexer.get("quarantine_fname"):
+        cfg.lexer.quarantine_fname = to_absolute_path(cfg.lexer.quarantine_fname)
 
     logging.info("======= Using config =======")
     logging.info(cfg)
@@ -31,6 +97,10 @@ def main(cfg: DictConfig) -> None:
         ]
     )
 
+    if cfg.fused:
+        run_fused(cfg, parts)
+        return
+
     # ---------------------------------
     # -         drop outliers         -
     # ---------------------------------
@@ -50,6 +120,8 @@ def main(cfg: DictConfig) -> None:
         processor(
             in_fname=os.path.join(cfg.paths.input_dir, part),
             out_fname=os.path.join(cfg.paths.input_dir, "filtered_outliers", part),
+            checkpoint=cfg.checkpoint,
+            n_shards=cfg.n_shards.outliers_processor,
             prepare_n_tokens_dir=os.path.join(cfg.paths.tokens_percentile_dir, part),
             prepare_percentile_dir=percentile_dir,
         )
@@ -70,6 +142,8 @@ def main(cfg: DictConfig) -> None:
                 part,
             ),
             out_fname=os.path.join(cfg.paths.input_dir, "filtered_msgs", part),
+            checkpoint=cfg.checkpoint,
+            n_shards=cfg.n_shards.message_processor,
         )
 
     # -----------------------------------
@@ -82,6 +156,8 @@ def main(cfg: DictConfig) -> None:
         processor(
             in_fname=os.path.join(cfg.paths.input_dir, "filtered_msgs", part),
             out_fname=os.path.join(cfg.paths.input_dir, "filtered_diffs", part),
+            checkpoint=cfg.checkpoint,
+            n_shards=cfg.n_shards.diff_processor,
         )
 
     # -----------------------------------
@@ -102,6 +178,8 @@ def main(cfg: DictConfig) -> None:
         lexer(
             in_fname=os.path.join(cfg.paths.input_dir, "filtered_diffs", part),
             out_fname=os.path.join(cfg.paths.input_dir, "lexed", part),
+            checkpoint=cfg.checkpoint,
+            n_shards=cfg.n_shards.lexer,
             delimiter_out_fname=os.path.join(cfg.paths.input_dir, "tokenization", part),
             prepare_literals_len_dir=os.path.join(cfg.paths.literals_percentile_dir, part),
             prepare_percentile_dir=percentile_dir,
@@ -124,6 +202,8 @@ def main(cfg: DictConfig) -> None:
         processor(
             in_fname=os.path.join(cfg.paths.input_dir, "lexed", part),
             out_fname=os.path.join(cfg.paths.deduplication_dir, "raw", f"{part}_message.txt"),
+            checkpoint=cfg.checkpoint,
+            n_shards=cfg.n_shards.pre_deduplication_processor,
             data_col="message",
             add_data_format=False,
         )
@@ -132,6 +212,8 @@ def main(cfg: DictConfig) -> None:
         processor(
             in_fname=os.path.join(cfg.paths.input_dir, "lexed", part),
             out_fname=os.path.join(cfg.paths.deduplication_dir, "raw", f"{part}_diffs.txt"),
+            checkpoint=cfg.checkpoint,
+            n_shards=cfg.n_shards.pre_deduplication_processor,
             data_col="mods",
             add_data_format=False,
         )
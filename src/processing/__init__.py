@@ -1,5 +1,6 @@
 from .diff_processor import DiffProcessor
 from .final_processor import FinalProcessor
+from .fused_processor import FusedProcessor
 from .lexer import Lexer
 from .message_processor import MessageProcessor
 from .outliers_processor import OutliersProcessor
@@ -8,6 +9,7 @@ from .pre_deduplication_processor import PreDeduplicationProcessor
 
 __all__ = [
     "FinalProcessor",
+    "FusedProcessor",
     "OutliersProcessor",
     "PreDeduplicationProcessor",
     "PostDeduplicationProcessor",
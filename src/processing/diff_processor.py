@@ -2,7 +2,6 @@ import re
 from typing import Dict, List
 
 import pandas as pd
-from joblib import Parallel, delayed
 
 from ..utils import BaseProcessor
 
@@ -10,6 +9,10 @@ from ..utils import BaseProcessor
 class DiffProcessor(BaseProcessor):
     """This class is used to delete undesirable patterns from diffs."""
 
+    # lines that are kept in `_filter_diff` (after stripping): added or removed lines (except for lone `+` and `-`)
+    # and `Binary files <filename1> and <filename2> differ`
+    _KEPT_LINES = re.compile(r"^[^\S\n]*([-+][^\n]*\S|Binary files[^\n]*differ)[^\S\n]*$", flags=re.MULTILINE)
+
     @staticmethod
     def _filter_diff(diff: str) -> str:
         """Filters single diff string.
@@ -18,30 +21,11 @@ class DiffProcessor(BaseProcessor):
             * removing some unnecessary git stuff (e.g. @@ ... @@)
             * removing non-changed lines
             * removing extra `\t` and `\r` symbols
-        """
-        diff_lines = diff.split("\n")
-        processed_lines = []
-
-        for line in diff_lines:
-            line = line.strip()
-
-            if line.startswith("-") and len(line) > 1:
-                # lines that were removed
-                # example: - version='2.0.2'
-                processed_lines.append(line)
-
-            elif line.startswith("+") and len(line) > 1:
-                # lines that were added
-                # example: + version='2.0.2'
-                processed_lines.append(line)
 
-            elif line.startswith("Binary files") and line.endswith("differ"):
-                # example: Binary files <filename1> and <filename2> differ
-                processed_lines.append(line)
-
-        processed_diff = "\n".join(processed_lines)
-        processed_diff = re.sub("[^\S\n]+", " ", processed_diff)
-        return processed_diff
+        All lines are checked by a single regular expression instead of a loop over lines, and whitespaces
+        in kept lines are collapsed via `str.split` (the same as replacing `[^\S\n]+` with a single space).
+        """
+        return "\n".join([" ".join(line.split()) for line in DiffProcessor._KEPT_LINES.findall(diff)])
 
     @staticmethod
     def _filter_mods(mods: List[Dict[str, str]]) -> List[Dict[str, str]]:
@@ -55,9 +39,12 @@ class DiffProcessor(BaseProcessor):
                 filtered_mods.append(mod)
         return filtered_mods
 
-    def process(self, chunk: pd.DataFrame, **kwargs) -> pd.DataFrame:
-        with Parallel(self._n_workers) as pool:
-            filtered_mods = pool(delayed(DiffProcessor._filter_mods)(mods) for _, mods in chunk["mods"].items())
+    def process_row(self, mods: List[Dict[str, str]], **kwargs) -> List[Dict[str, str]]:
+        return DiffProcessor._filter_mods(mods)
 
-        chunk["mods"] = filtered_mods
+    def process_batch(self, mods: List[List[Dict[str, str]]], **kwargs) -> List[List[Dict[str, str]]]:
+        return list(map(DiffProcessor._filter_mods, mods))
+
+    def process(self, chunk: pd.DataFrame, **kwargs) -> pd.DataFrame:
+        chunk["mods"] = self._map_batches(self.process_batch, chunk["mods"].tolist())
         return chunk
@@ -1,5 +1,5 @@
 import json
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import pandas as pd
 from tqdm import tqdm
@@ -60,6 +60,17 @@ class FinalProcessor(BaseProcessor):
         self._get_authors(in_fname=in_fname, in_fnames=in_fnames)
         self._get_licenses(license_in_fname=license_in_fname)
 
+    def _get_prepare_state(self) -> Dict[str, Any]:
+        return {
+            "authors_map": [[*author, i] for author, i in self._authors_map.items()],
+            "repo_license_map": self._repo_license_map,
+        }
+
+    def _set_prepare_state(self, state: Dict[str, Any]) -> None:
+        self._authors_map = {tuple(item[:-1]): item[-1] for item in state["authors_map"]}
+        self._authors = set(self._authors_map)
+        self._repo_license_map = state["repo_license_map"]
+
     def process(self, chunk: pd.DataFrame, **kwargs) -> pd.DataFrame:
         chunk = chunk.drop(columns="mods")
         chunk = chunk.loc[chunk["diff"].str.len() > 0]
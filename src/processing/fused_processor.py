@@ -0,0 +1,210 @@
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from tqdm import tqdm
+
+from ..utils import BaseProcessor
+from ..utils.metrics import StageMetrics
+from .diff_processor import DiffProcessor
+from .lexer import Lexer
+from .message_processor import MessageProcessor
+from .outliers_processor import OutliersProcessor
+from .pre_deduplication_processor import PreDeduplicationProcessor
+
+
+class FusedProcessor(BaseProcessor):
+    """This class is used to run several processing stages over a single read of input data.
+
+    Each chunk is passed through `process` methods of the following processors one after another:
+    outliers -> messages -> diffs -> lexer -> preprocessing for SourcererCC.
+
+    Intermediate results (data without outliers, data with filtered messages, data with filtered diffs) are never
+    saved to disk unless explicitly requested, only outputs of the final stages are.
+
+    All stages share a single worker pool (`n_workers` of each stage is ignored) and record their statistics
+    (e.g. how often each message filter fires) to the metrics of this processor.
+
+    Args:
+        outliers_processor: Processor to drop outliers with.
+        message_processor: Processor to filter messages with.
+        diff_processor: Processor to filter diffs with.
+        lexer: Processor to lex diffs with.
+        pre_deduplication_processor: Processor to convert data into SourcererCC format with.
+        data_format: In which format mined data is saved.
+        chunksize: Number of examples to process at once (data is read in chunks). Optional, default value is 1000.
+        n_workers: Number of workers shared by all stages. Optional, default value is 1.
+        logger_name: Name of logger for this class. Optional, default value is None.
+    """
+
+    def __init__(
+        self,
+        outliers_processor: OutliersProcessor,
+        message_processor: MessageProcessor,
+        diff_processor: DiffProcessor,
+        lexer: Lexer,
+        pre_deduplication_processor: PreDeduplicationProcessor,
+        data_format: str,
+        chunksize: Optional[int] = None,
+        n_workers: Optional[int] = None,
+        logger_name: Optional[str] = None,
+    ):
+        super().__init__(chunksize=chunksize, n_workers=n_workers, data_format=data_format, logger_name=logger_name)
+        self._outliers_processor = outliers_processor
+        self._lexer = lexer
+        self._pre_deduplication_processor = pre_deduplication_processor
+        self._filter_stages: List[Tuple[str, BaseProcessor]] = [
+            ("outliers", outliers_processor),
+            ("messages", message_processor),
+            ("diffs", diff_processor),
+        ]
+        self._intermediate_out_fnames: Dict[str, str] = {}
+
+    def _processors(self) -> List[BaseProcessor]:
+        return [processor for _, processor in self._filter_stages] + [self._lexer, self._pre_deduplication_processor]
+
+    def _attach_processors(self) -> None:
+        """Makes all stages use worker pool and metrics of this processor."""
+        pool = self._get_pool()
+        for processor in self._processors():
+            processor._pool, processor._n_workers, processor._metrics = pool, self._n_workers, self._metrics
+
+    def _detach_processors(self) -> None:
+        """Closes pools of all stages (shared pool is closed once, by this processor)."""
+        for processor in self._processors():
+            processor._pool, processor._metrics = None, None
+            processor._close_pool()
+        self._close_pool()
+
+    def _iterate_filtered(
+        self, in_fname: str, save_intermediate: bool = False
+    ) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame, float]]:
+        """Reads input data and passes each chunk through filtering stages (outliers, messages, diffs).
+
+        Args:
+            in_fname: Path to read input data from.
+            save_intermediate: True to save results of stages listed in `intermediate_out_fnames`.
+
+        Returns:
+            Iterator over original chunks, filtered chunks and time spent on reading each chunk.
+        """
+        reader = self._read_input(in_fname)
+        for input_chunk, read_time in self._iterate_timed(reader):
+            chunk = input_chunk
+            for name, processor in self._filter_stages:
+                chunk = processor.process(chunk)
+                if save_intermediate and name in self._intermediate_out_fnames:
+                    self._append_to_outfile(chunk, self._intermediate_out_fnames[name])
+            yield input_chunk, chunk, read_time
+
+    def prepare(
+        self,
+        in_fname: str,
+        n_tokens_dir: str,
+        literals_len_dir: str,
+        tokens_percentile_dir: Optional[str] = None,
+        literals_percentile_dir: Optional[str] = None,
+        **kwargs,
+    ) -> None:
+        """Prepares all stages that require statistics over whole dataset.
+
+        Literals' lengths are computed on the fly on data with filtered outliers, messages and diffs,
+        which requires additional read of input data only when precomputed percentiles are not given.
+
+        Args:
+            in_fname: Path to read input data from.
+            n_tokens_dir: Path to folder to save supplementary information for outliers processor.
+            literals_len_dir: Path to folder to save supplementary information for lexer.
+            tokens_percentile_dir: Path to directory with already computed percentiles for # tokens. Optional.
+            literals_percentile_dir: Path to directory with already computed percentiles for literals' lengths.
+                Optional.
+        """
+        self._outliers_processor.prepare(in_fname, n_tokens_dir=n_tokens_dir, percentile_dir=tokens_percentile_dir)
+
+        chunks = None if literals_percentile_dir else (chunk for _, chunk, _ in self._iterate_filtered(in_fname))
+        self._lexer.prepare(
+            in_fname, literals_len_dir=literals_len_dir, percentile_dir=literals_percentile_dir, chunks=chunks
+        )
+
+    def __call__(
+        self,
+        in_fname: str,
+        out_fname: str,
+        delimiter_out_fname: str,
+        message_dedup_out_fname: str,
+        diff_dedup_out_fname: str,
+        intermediate_out_fnames: Optional[Dict[str, str]] = None,
+        **kwargs,
+    ) -> None:
+        """Iterates over input data in chunks, passes each chunk through all stages and saves final results.
+
+        Args:
+            in_fname: Path to read input data from.
+            out_fname: Path to save lexed data to.
+            delimiter_out_fname: Path to save lexed data with special delimiter to.
+            message_dedup_out_fname: Path to save messages in SourcererCC format to.
+            diff_dedup_out_fname: Path to save diffs in SourcererCC format to.
+            intermediate_out_fnames: Paths to save results of filtering stages to, keys should be from
+                `outliers`, `messages`, `diffs`. Optional, by default intermediate results are not saved.
+            **kwargs: Arbitrary keyword arguments. Keyword arguments starting from prefix 'prepare_'
+                will be passed to method that is called before data processing.
+        """
+        prepare_kwargs = {key[len("prepare_") :]: value for key, value in kwargs.items() if key.startswith("prepare_")}
+        self._intermediate_out_fnames = intermediate_out_fnames if intermediate_out_fnames else {}
+
+        self.logger.info(f"Starting processing {in_fname}")
+        self._metrics = StageMetrics(
+            stage=self.logger.name,
+            processor=type(self).__name__,
+            in_fname=in_fname,
+            n_workers=self._n_workers,
+            chunksize=self._chunksize,
+        )
+
+        lexer_out_fnames = [out_fname, delimiter_out_fname]
+        out_fnames = lexer_out_fnames + list(self._intermediate_out_fnames.values())
+        for fname in out_fnames:
+            self._prepare_outfile(fname)
+        for fname in [message_dedup_out_fname, diff_dedup_out_fname]:
+            self._prepare_outfile(fname, add_data_format=False)
+
+        try:
+            self._attach_processors()
+            start_time = time.perf_counter()
+            self.prepare(in_fname, **prepare_kwargs)
+            self._metrics.record_prepare(time.perf_counter() - start_time)
+
+            filtered_chunks = self._iterate_filtered(in_fname, save_intermediate=True)
+            start_time = time.perf_counter()
+            for input_chunk, chunk, read_time in tqdm(filtered_chunks, leave=False):
+                n_bytes_written = self._data_manager.n_bytes_written
+
+                lexed_chunk = self._lexer.process(chunk)
+                for fname, data in zip(lexer_out_fnames, self._lexer._split_outputs(lexed_chunk)):
+                    self._append_to_outfile(data, fname)
+
+                for data_col, fname in [("message", message_dedup_out_fname), ("mods", diff_dedup_out_fname)]:
+                    self._append_to_outfile(
+                        self._pre_deduplication_processor.process(lexed_chunk, data_col=data_col), fname
+                    )
+
+                # processing and writing are interleaved between stages, so they are measured together
+                self._metrics.record_chunk(
+                    read_time=read_time,
+                    process_time=time.perf_counter() - start_time - read_time,
+                    write_time=0.0,
+                    rows_in=len(input_chunk),
+                    rows_out=len(lexed_chunk),
+                    bytes_in=input_chunk.attrs.get("n_bytes"),
+                    bytes_out=self._data_manager.n_bytes_written - n_bytes_written,
+                )
+                start_time = time.perf_counter()
+        finally:
+            for fname in out_fnames:
+                self._close_outfile(fname)
+            for fname in [message_dedup_out_fname, diff_dedup_out_fname]:
+                self._close_outfile(fname, add_data_format=False)
+            self._detach_processors()
+
+        self._save_metrics(in_fname, lexer_out_fnames)
+        self.logger.info(f"Finished processing {in_fname}")
@@ -1,17 +1,20 @@
 import json
+import math
 import os
-from typing import Dict, Iterable, List, Optional, Tuple
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
 from pygments import lex
-from pygments.lexers import TextLexer, guess_lexer_for_filename
+from pygments.lexers import TextLexer
 from pygments.token import Literal, Text, _TokenType
 from pygments.util import ClassNotFound
 from tqdm import tqdm
 
-from ..utils import BaseProcessor
+from ..utils import BaseProcessor, WatchdogPool
+from ..utils.base_utils import _apply_to_batch
+from ..utils.histogram import IntHistogram
+from .lexer_resolver import LexerResolver
 
 
 class Lexer(BaseProcessor):
@@ -22,18 +25,45 @@ class Lexer(BaseProcessor):
     It also saves lexed data in a format required for pre-tokenization stage:
     lexemes are separated by additional space characters.
 
+    Lexers are chosen via `LexerResolver`, which caches lexers for filename patterns; each worker process keeps its own
+    cache between chunks. Hits and misses of the cache are recorded to stage metrics as `counts`.
+
+    Some diffs make pygments hang, so lexing can be limited by time and size budgets. Commits that exceed them
+    are quarantined: their ids are appended to quarantine file together with name of input file (ids are only unique
+    within a single part, e.g. train), commits that are already there are never lexed again, and they are either
+    dropped or tokenized by whitespaces instead.
+
     Args:
         upper_percentile: Percentile to use as an upper bound (should be in (0, 1) range).
         data_format: In which format mined data is saved.
+        lexer_cache_size: Maximum # of filename patterns to cache lexers for. Optional, default value is 1024.
+        time_budget: Maximum time (in seconds) to lex a single modification. When given, commits are sent to a pool
+            that kills and replaces workers which exceed their budget, in batches with budget for all their
+            modifications; commits from batches that exceed it are retried one by one with their own budgets.
+            Optional, default value is None (no time limit).
+        max_diff_len: Maximum length of a single diff to lex. Optional, default value is None (no limit).
+        on_budget_exceeded: What to do with quarantined commits: `drop` to drop them, `fallback` to split their diffs
+            by whitespaces. Optional, default value is `drop`.
+        quarantine_fname: Path to file with quarantined commits. Optional, default value is None (quarantined commits
+            are only kept in memory).
         chunksize: Number of examples to process at once (data is read in chunks). Optional, default value is 1000.
         n_workers: Maximum number of concurrently running jobs. Optional, default value is 1 (sequential execution).
         logger_name: Name of logger for this class. Optional, default value is None.
     """
 
+    # lexer resolvers of current process (by cache size), they aren't pickled together with processor,
+    # so that workers reuse their caches between chunks
+    _RESOLVERS: Dict[int, LexerResolver] = {}
+
     def __init__(
         self,
         upper_percentile: float,
         data_format: str,
+        lexer_cache_size: int = 1024,
+        time_budget: Optional[float] = None,
+        max_diff_len: Optional[int] = None,
+        on_budget_exceeded: str = "drop",
+        quarantine_fname: Optional[str] = None,
         chunksize: Optional[int] = None,
         n_workers: Optional[int] = None,
         logger_name: Optional[str] = None,
@@ -42,10 +72,37 @@ class Lexer(BaseProcessor):
 
         self._upper_percentile = upper_percentile
         self._percentiles: Dict[float, float] = {}
-
-        # TODO: these examples make pygments hang ;( currently they are manually skipped
-        # (note: they all contain some gsql, might be related to https://github.com/pygments/pygments/pull/2006)
-        self._examples_to_skip = [1731725, 1731749, 1731755, 1731759, 1732004]
+        self._delimiter_out_fname: Optional[str] = None
+        self._lexer_cache_size = lexer_cache_size
+
+        if on_budget_exceeded not in ["drop", "fallback"]:
+            raise ValueError("`on_budget_exceeded` should be either `drop` or `fallback`")
+        self._time_budget = time_budget
+        self._max_diff_len = max_diff_len
+        self._on_budget_exceeded = on_budget_exceeded
+        self._watchdog_pool: Optional[WatchdogPool] = None
+
+        # name of current input file, commits are quarantined by (part, id) pairs
+        self._part: Optional[str] = None
+        # (part, id) -> reason (`time` or `size`)
+        self._quarantined: Dict[Tuple[Optional[str], int], str] = {}
+        self._quarantine_fname = quarantine_fname
+        if quarantine_fname and os.path.exists(quarantine_fname):
+            with open(quarantine_fname, "r") as file:
+                for line in file:
+                    entry = json.loads(line)
+                    self._quarantined[(entry["part"], entry["id"])] = entry["reason"]
+            self.logger.info(f"Loaded {len(self._quarantined)} quarantined commits from {quarantine_fname}")
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_watchdog_pool"] = None
+        return state
+
+    def _get_resolver(self) -> LexerResolver:
+        if self._lexer_cache_size not in Lexer._RESOLVERS:
+            Lexer._RESOLVERS[self._lexer_cache_size] = LexerResolver(max_size=self._lexer_cache_size)
+        return Lexer._RESOLVERS[self._lexer_cache_size]
 
     def _is_lexeme_allowed(self, lexeme: Tuple[_TokenType, str]) -> bool:
         """Checks if current lexeme is allowed.
@@ -66,7 +123,7 @@ class Lexer(BaseProcessor):
         tokens are simply split by whitespaces.
         """
         try:
-            lexer = guess_lexer_for_filename(fname, diff)
+            lexer = self._get_resolver().get_lexer(fname, diff)
             if not isinstance(lexer, TextLexer):
                 yield from lex(diff, lexer)
             else:
@@ -76,6 +133,19 @@ class Lexer(BaseProcessor):
             self.logger.warning(f"No lexer found for `{fname}` (id: {id})")
             yield from ((Text, token) for token in diff.split())
 
+    @staticmethod
+    def _get_file_diff(mod: Dict[str, str]) -> Tuple[str, str]:
+        """Returns header describing modified file and path to choose lexer by."""
+        if mod["change_type"] == "ADD":
+            return f"new file {mod['new_path']}\n", mod["new_path"]
+        if mod["change_type"] == "DELETE":
+            return f"deleted file {mod['old_path']}\n", mod["old_path"]
+        if mod["change_type"] == "RENAME":
+            return f"rename from {mod['old_path']}\nrename to {mod['new_path']}\n", mod["new_path"]
+        if mod["change_type"] == "COPY":
+            return f"copy from {mod['old_path']}\ncopy to {mod['new_path']}\n", mod["new_path"]
+        return f"{mod['new_path']}\n", mod["new_path"]
+
     def _lex_commit_mods(self, cur_id: int, cur_mods: List[Dict[str, str]]) -> List[str]:
         """Iterates over all modifications in current commit and tokenizes each of them."""
         tokens: List[str] = []
@@ -83,21 +153,7 @@ class Lexer(BaseProcessor):
         for mod in cur_mods:
             if mod["change_type"] == "UNKNOWN":
                 continue
-            if mod["change_type"] == "ADD":
-                file_diff = f"new file {mod['new_path']}\n"
-                fname = mod["new_path"]
-            elif mod["change_type"] == "DELETE":
-                file_diff = f"deleted file {mod['old_path']}\n"
-                fname = mod["old_path"]
-            elif mod["change_type"] == "RENAME":
-                file_diff = f"rename from {mod['old_path']}\nrename to {mod['new_path']}\n"
-                fname = mod["new_path"]
-            elif mod["change_type"] == "COPY":
-                file_diff = f"copy from {mod['old_path']}\ncopy to {mod['new_path']}\n"
-                fname = mod["new_path"]
-            else:
-                file_diff = f"{mod['new_path']}\n"
-                fname = mod["new_path"]
+            file_diff, fname = Lexer._get_file_diff(mod)
 
             mod_tokenized = self._lex_diff(cur_id, fname, mod["diff"])
             tokens.extend((token.strip() for token in file_diff.split()))
@@ -106,6 +162,18 @@ class Lexer(BaseProcessor):
 
         return tokens
 
+    @staticmethod
+    def _split_commit_mods(cur_mods: List[Dict[str, str]]) -> List[str]:
+        """Tokenizes all modifications in current commit by whitespaces (fallback for quarantined commits)."""
+        tokens: List[str] = []
+        for mod in cur_mods:
+            if mod["change_type"] == "UNKNOWN":
+                continue
+            file_diff, _ = Lexer._get_file_diff(mod)
+            tokens.extend(file_diff.split())
+            tokens.extend(mod["diff"].split())
+        return tokens
+
     def _get_literals_len_mods(self, cur_id: int, cur_mods: List[Dict[str, str]]) -> List[int]:
         """Iterates over all modifications in current commit,
         tokenizes each of them and returns length of each literal.
@@ -116,11 +184,7 @@ class Lexer(BaseProcessor):
             if mod["change_type"] == "UNKNOWN":
                 continue
 
-            if mod["change_type"] == "DELETE":
-                fname = mod["old_path"]
-            else:
-                fname = mod["new_path"]
-
+            _, fname = Lexer._get_file_diff(mod)
             mod_tokenized = self._lex_diff(cur_id, fname, mod["diff"])
             literals_len.extend(
                 [len(lexeme[1]) for lexeme in mod_tokenized if lexeme[0] in Literal and lexeme[0] != Literal.String.Doc]
@@ -128,48 +192,152 @@ class Lexer(BaseProcessor):
 
         return literals_len
 
-    def _get_literals_len(self, in_fname: str, literals_len_dir: str) -> None:
-        """Tokenizes diffs with appropriate lexers and saves lengths of tokens marked as literals.
+    def _get_literals_len(
+        self, in_fname: str, literals_len_dir: str, chunks: Optional[Iterable[pd.DataFrame]] = None
+    ) -> None:
+        """Tokenizes diffs with appropriate lexers and saves histogram of lengths of tokens marked as literals.
 
         Args:
             in_fname: Path to read input data from.
-            literals_len_dir: Path to directory to save literals lengths to.
+            literals_len_dir: Path to directory to save histogram of literals lengths to.
+            chunks: Data chunks to use instead of reading input file. Optional. Use-case: computing lengths
+                on data that is processed on the fly and never saved to disk.
         """
         self.logger.info(f"Starting processing literals in {in_fname}")
 
-        open(os.path.join(literals_len_dir, "literals_len.txt"), "w", encoding="utf-8").close()
-
-        reader = self._read_input(in_fname)
+        histogram = IntHistogram()
+        reader = chunks if chunks is not None else self._read_input(in_fname)
         for chunk in tqdm(reader, desc=f"Tokenizing {in_fname}", leave=False):
-            chunk = chunk.loc[~chunk["id"].isin(self._examples_to_skip)]
+            res = self._map_commits(self._get_literals_len_mods, chunk["id"].tolist(), chunk["mods"].tolist())
+            histogram.update(
+                literal_len for literals_len in res if literals_len is not None for literal_len in literals_len
+            )
 
-            with Parallel(self._n_workers) as pool:
-                res = pool(
-                    delayed(self._get_literals_len_mods)(item["id"], item["mods"])
-                    for _, item in chunk[["id", "mods"]].iterrows()
-                )
-            with open(os.path.join(literals_len_dir, "literals_len.txt"), "a", encoding="utf-8") as file:
-                for lines in res:
-                    file.writelines([f"{line}\n" for line in lines])
+        histogram.save(os.path.join(literals_len_dir, "literals_hist.json"))
 
         self.logger.info(f"Finished processing literals in {in_fname}")
 
+    def _get_watchdog_pool(self) -> WatchdogPool:
+        if self._watchdog_pool is None:
+            self._watchdog_pool = WatchdogPool(self._n_workers, logger_name=self.logger.name)
+        return self._watchdog_pool
+
+    def _close_pool(self) -> None:
+        super()._close_pool()
+        if self._watchdog_pool is not None:
+            self._watchdog_pool.close()
+            self._watchdog_pool = None
+
+    def _set_part(self, in_fname: str) -> None:
+        """Sets name of current input file, which quarantined commits are attributed to."""
+        self._part = os.path.basename(in_fname)
+
+    def _quarantine(self, id: int, reason: str) -> None:
+        self.logger.warning(f"Quarantined commit {id} from {self._part} (exceeded {reason} budget)")
+        self._quarantined[(self._part, id)] = reason
+        if self._quarantine_fname:
+            with open(self._quarantine_fname, "a") as file:
+                file.write(json.dumps({"part": self._part, "id": id, "reason": reason}) + "\n")
+
+    def _map_with_time_budget(
+        self,
+        func: Callable,
+        ids: List[int],
+        mods: List[List[Dict[str, str]]],
+        batches_per_worker: int = 4,
+        max_batch_size: int = 32,
+    ) -> List[Any]:
+        """Applies given function to each commit in watchdog pool and returns results in original order
+        (`WatchdogPool.FAILED` for commits that exceeded their time budget).
+
+        Commits are sent in contiguous batches (the same way as in `_map`, but of at most `max_batch_size` commits,
+        so that a hanging commit doesn't keep a worker busy for too long), each batch gets time budget for all
+        modifications in it. Commits from batches that exceed their budget are retried one by one,
+        so that only commits that exceed their own budgets fail.
+        """
+        time_budgets = [self._time_budget * max(len(cur_mods), 1) for cur_mods in mods]
+        pool = self._get_watchdog_pool()
+
+        batch_size = min(max(math.ceil(len(ids) / (self._n_workers * batches_per_worker)), 1), max_batch_size)
+        starts = range(0, len(ids), batch_size)
+        batches_results = pool.map(
+            partial(_apply_to_batch, func),
+            [ids[i : i + batch_size] for i in starts],
+            [mods[i : i + batch_size] for i in starts],
+            time_budgets=[sum(time_budgets[i : i + batch_size]) for i in starts],
+        )
+
+        results: List[Any] = []
+        idxs_to_retry: List[int] = []
+        for start, batch_results in zip(starts, batches_results):
+            if batch_results is WatchdogPool.FAILED:
+                cur_batch_size = min(batch_size, len(ids) - start)
+                idxs_to_retry.extend(range(start, start + cur_batch_size))
+                batch_results = [WatchdogPool.FAILED] * cur_batch_size
+            results.extend(batch_results)
+
+        if idxs_to_retry:
+            self.logger.info(f"Retrying {len(idxs_to_retry)} commits from batches that exceeded time budget")
+            retried = pool.map(
+                func,
+                [ids[i] for i in idxs_to_retry],
+                [mods[i] for i in idxs_to_retry],
+                time_budgets=[time_budgets[i] for i in idxs_to_retry],
+            )
+            for i, res in zip(idxs_to_retry, retried):
+                results[i] = res
+        return results
+
+    def _map_commits(self, func: Callable, ids: List[int], mods: List[List[Dict[str, str]]]) -> List[Optional[Any]]:
+        """Applies given function to each commit within budgets and returns results in original order
+        (None for quarantined commits).
+
+        Commits with diffs longer than `max_diff_len` are quarantined without lexing. When `time_budget` is set,
+        commits are processed in watchdog pool and commits that exceed their time budget are quarantined as well.
+        """
+        idxs = []
+        for i, (cur_id, cur_mods) in enumerate(zip(ids, mods)):
+            if (self._part, cur_id) in self._quarantined:
+                continue
+            if self._max_diff_len is not None and any(len(mod["diff"]) > self._max_diff_len for mod in cur_mods):
+                self._quarantine(cur_id, "size")
+                continue
+            idxs.append(i)
+
+        ids_to_lex, mods_to_lex = [ids[i] for i in idxs], [mods[i] for i in idxs]
+        if self._time_budget is None:
+            lexed = self._map(func, ids_to_lex, mods_to_lex)
+        else:
+            lexed = self._map_with_time_budget(func, ids_to_lex, mods_to_lex)
+
+        results: List[Optional[Any]] = [None] * len(ids)
+        for i, res in zip(idxs, lexed):
+            if res is WatchdogPool.FAILED:
+                self._quarantine(ids[i], "time")
+            else:
+                results[i] = res
+        return results
+
     def _get_percentiles(self, literals_len_dir: str) -> None:
         """Calculates percentiles of literals lengths from diffs.
 
         Args:
-            literals_len_dir: Path to directory to read precomputed literals lengths from.
+            literals_len_dir: Path to directory to read histogram of literals lengths from.
         """
-        with open(os.path.join(literals_len_dir, "literals_len.txt"), "r") as file:
-            literals_lens = [int(line.strip()) for line in file]
-
-        for q in [0.01, 0.05, 0.9, 0.95, 0.99]:
-            self._percentiles[q] = np.quantile(literals_lens, q)
+        histogram = IntHistogram.load(os.path.join(literals_len_dir, "literals_hist.json"))
+        self._percentiles = histogram.get_percentiles([0.01, 0.05, 0.9, 0.95, 0.99])
 
         with open(os.path.join(literals_len_dir, "literals.json"), "w") as file:
             json.dump(self._percentiles, file)
 
-    def prepare(self, in_fname: str, literals_len_dir: str, percentile_dir: Optional[str] = None, **kwargs) -> None:
+    def prepare(
+        self,
+        in_fname: str,
+        literals_len_dir: str,
+        percentile_dir: Optional[str] = None,
+        chunks: Optional[Iterable[pd.DataFrame]] = None,
+        **kwargs,
+    ) -> None:
         """Runs lexers on diffs and removes literals with lengths more than percentiles.
 
         Args:
@@ -177,27 +345,65 @@ class Lexer(BaseProcessor):
             literals_len_dir: Path to save supplementary information like # of tokens for each example and percentiles.
             percentile_dir: Path to directory with already computed percentiles. Optional. Use-case: dropping outliers
                from val/test by percentiles calculated on train.
+            chunks: Data chunks to compute percentiles on instead of reading input file. Optional.
         """
+        self._set_part(in_fname)
         if percentile_dir:
             # read precomputed percentiles
             with open(os.path.join(percentile_dir, "literals.json"), "r") as file:
                 self._percentiles = json.load(file, object_hook=lambda d: {float(k): v for k, v in d.items()})
         else:
             # compute percentiles
-            self._get_literals_len(in_fname=in_fname, literals_len_dir=literals_len_dir)
+            self._get_literals_len(in_fname=in_fname, literals_len_dir=literals_len_dir, chunks=chunks)
             self._get_percentiles(literals_len_dir=literals_len_dir)
 
+    def _get_prepare_state(self) -> Dict[str, Any]:
+        return {"percentiles": self._percentiles}
+
+    def _set_prepare_state(self, state: Dict[str, Any]) -> None:
+        self._percentiles = {float(k): v for k, v in state["percentiles"].items()}
+
+    def process_row(self, id: int, mods: List[Dict[str, str]], **kwargs) -> Tuple[List[str], int, int]:
+        """Returns tokens of given commit together with # of hits and misses of lexer cache."""
+        resolver = self._get_resolver()
+        hits, misses = resolver.hits, resolver.misses
+        tokens = self._lex_commit_mods(id, mods)
+        return tokens, resolver.hits - hits, resolver.misses - misses
+
     def process(self, chunk: pd.DataFrame, **kwargs) -> pd.DataFrame:
-        with Parallel(self._n_workers) as pool:
-            tokenized_diffs = pool(
-                delayed(self._lex_commit_mods)(cur_id=item["id"], cur_mods=item["mods"])
-                for _, item in chunk[["id", "mods"]].iterrows()
-            )
+        results = self._map_commits(self.process_row, chunk["id"].tolist(), chunk["mods"].tolist())
+        n_quarantined = sum(res is None for res in results)
+        if self._on_budget_exceeded == "drop":
+            chunk = chunk.loc[[res is not None for res in results]]
+            results = [res for res in results if res is not None]
+        else:
+            results = [
+                res if res is not None else (Lexer._split_commit_mods(cur_mods), 0, 0)
+                for res, cur_mods in zip(results, chunk["mods"].tolist())
+            ]
+
+        tokenized_diffs = [tokens for tokens, _, _ in results]
+        self._record_counts(
+            {
+                "lexer_cache_hits": sum(hits for _, hits, _ in results),
+                "lexer_cache_misses": sum(misses for _, _, misses in results),
+                "quarantined": n_quarantined,
+            }
+        )
 
         chunk["diff_tok"] = ["".join(diff) for diff in tokenized_diffs]
         chunk["diff_sep"] = [" ".join(diff) for diff in tokenized_diffs]
         return chunk
 
+    def _get_out_fnames(self, out_fname: str) -> List[str]:
+        return [out_fname, self._delimiter_out_fname]
+
+    def _split_outputs(self, processed_chunk: pd.DataFrame) -> List[pd.DataFrame]:
+        return [
+            processed_chunk.drop(columns=["diff_sep"]).rename(columns={"diff_tok": "diff"}),
+            processed_chunk.drop(columns=["diff_tok"]).rename(columns={"diff_sep": "diff"}),
+        ]
+
     def __call__(self, in_fname: str, out_fname: str, delimiter_out_fname: str, **kwargs) -> None:
         """Iterates over input data in chunks, lexes it and saves results to separate file.
 
@@ -216,23 +422,7 @@ class Lexer(BaseProcessor):
                 will be passed to method that is called before data processing,
                 all others - to method that processes each chunk.
         """
-        prepare_kwargs = {key[len("prepare_") :]: value for key, value in kwargs.items() if key.startswith("prepare_")}
-        process_kwargs = {key: value for key, value in kwargs.items() if not key.startswith("prepare_")}
-
-        self.logger.info(f"Starting processing {in_fname}")
-
-        self._prepare_outfile(out_fname)
-        self._prepare_outfile(delimiter_out_fname)
-        self.prepare(in_fname, **prepare_kwargs)
-
-        reader = self._read_input(in_fname)
-        for chunk in tqdm(reader, leave=False):
-            processed_chunk = self.process(chunk.loc[~chunk["id"].isin(self._examples_to_skip)], **process_kwargs)
-            self._append_to_outfile(
-                processed_chunk.drop(columns=["diff_sep"]).rename(columns={"diff_tok": "diff"}), out_fname
-            )
-            self._append_to_outfile(
-                processed_chunk.drop(columns=["diff_tok"]).rename(columns={"diff_sep": "diff"}), delimiter_out_fname
-            )
-
-        self.logger.info(f"Finished processing {in_fname}")
+        self._delimiter_out_fname = delimiter_out_fname
+        # `prepare` is skipped when resuming from checkpoint
+        self._set_part(in_fname)
+        super().__call__(in_fname, out_fname, **kwargs)
@@ -0,0 +1,123 @@
+import fnmatch
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Type
+
+from pygments.lexer import Lexer as PygmentsLexer
+from pygments.lexers import _iter_lexerclasses
+from pygments.util import ClassNotFound
+
+# matches patterns that are checked via lookup by extension (e.g. `*.py`, `*.tar.gz`, but not `*.php[345]`)
+_EXTENSION_PATTERN = re.compile(r"\*(\.[^*?\[\]]+)")
+
+# extensions and other patterns filename matches
+_Key = Tuple[Tuple[str, ...], Tuple[int, ...]]
+# indices of matching lexers, each one with a flag whether filename matches its primary pattern (not an alias one)
+_Candidates = Tuple[Tuple[int, bool], ...]
+
+
+class LexerResolver:
+    """This class is used to choose lexers for files exactly like `pygments.lexers.guess_lexer_for_filename` does,
+    but without matching each filename against patterns of all registered lexers.
+
+    Filename patterns of all lexers are indexed once: patterns like `*.py` by extension, a few dozen others
+    (e.g. `Makefile`, `*.php[345]`) are checked one by one. Lexers that match a combination of patterns are cached
+    (bounded, least recently used entries are evicted first). Content-based guessing (`analyse_text`) is only run
+    when several lexers match a filename.
+
+    Lexer classes are cached rather than their instances, because some lexers (e.g. for HTTP, MIME or Modula-2)
+    keep state between calls.
+
+    Args:
+        max_size: Maximum # of cached combinations of patterns. Optional, default value is 1024.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self._max_size = max_size
+        self._cache: "OrderedDict[_Key, _Candidates]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        # all lexers in the order pygments iterates over them, so that ambiguous cases are resolved the same way
+        self._lexers: List[Type[PygmentsLexer]] = list(_iter_lexerclasses())
+        self._by_extension: Dict[str, List[Tuple[int, bool]]] = {}
+        self._other_patterns: List[Tuple["re.Pattern", int, bool]] = []
+        for i, lexer in enumerate(self._lexers):
+            for patterns, is_primary in [(lexer.filenames, True), (lexer.alias_filenames, False)]:
+                for pattern in patterns:
+                    match = _EXTENSION_PATTERN.fullmatch(pattern)
+                    if match:
+                        self._by_extension.setdefault(match.group(1), []).append((i, is_primary))
+                    else:
+                        self._other_patterns.append((re.compile(fnmatch.translate(pattern)), i, is_primary))
+        # single check for the (rare) case when none of other patterns match
+        self._any_other_pattern = re.compile("|".join(pattern.pattern for pattern, _, _ in self._other_patterns))
+
+    def _get_key(self, fname: str) -> _Key:
+        """Returns extensions and other patterns given filename matches."""
+        extensions = []
+        start = fname.find(".")
+        while start != -1:
+            if fname[start:] in self._by_extension:
+                extensions.append(fname[start:])
+            start = fname.find(".", start + 1)
+
+        other_patterns: Tuple[int, ...] = ()
+        if self._any_other_pattern.match(fname):
+            other_patterns = tuple(i for i, (pattern, _, _) in enumerate(self._other_patterns) if pattern.match(fname))
+        return tuple(extensions), other_patterns
+
+    def _get_candidates(self, key: _Key) -> _Candidates:
+        """Returns lexers matching given patterns (in the order pygments iterates over them)."""
+        matches = [match for extension in key[0] for match in self._by_extension[extension]]
+        matches.extend(
+            (lexer_idx, is_primary) for _, lexer_idx, is_primary in (self._other_patterns[i] for i in key[1])
+        )
+
+        is_primary: Dict[int, bool] = {}
+        for lexer_idx, cur_is_primary in matches:
+            is_primary[lexer_idx] = is_primary.get(lexer_idx, True) and cur_is_primary
+        return tuple(sorted(is_primary.items()))
+
+    def _guess(self, candidates: _Candidates, text: str) -> Type[PygmentsLexer]:
+        """Chooses one of several matching lexers based on given text (the same way as pygments does)."""
+        primary = {self._lexers[lexer_idx]: is_primary for lexer_idx, is_primary in candidates}
+        # pygments iterates over a set of lexers, which is built in the same order here
+        matching_lexers = set()
+        for lexer_idx, _ in candidates:
+            matching_lexers.add(self._lexers[lexer_idx])
+
+        result = []
+        for lexer in matching_lexers:
+            rv = lexer.analyse_text(text)
+            if rv == 1.0:
+                return lexer
+            result.append((rv, lexer))
+        result.sort(key=lambda t: (t[0], primary[t[1]], t[1].priority, t[1].__name__))
+        return result[-1][1]
+
+    def get_lexer(self, fname: str, text: str) -> PygmentsLexer:
+        """Returns lexer for given file and its contents.
+
+        Raises:
+            ClassNotFound: When there are no lexers for given filename.
+        """
+        fname = os.path.basename(fname)
+        key = self._get_key(fname)
+        candidates: Optional[_Candidates] = self._cache.get(key)
+        if candidates is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+        else:
+            self.misses += 1
+            candidates = self._get_candidates(key)
+            self._cache[key] = candidates
+            if len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+        if not candidates:
+            raise ClassNotFound(f"no lexer for filename {fname!r} found")
+        if len(candidates) == 1:
+            return self._lexers[candidates[0][0]]()
+        return self._guess(candidates, text)()
@@ -1,8 +1,9 @@
 import re
 from string import punctuation
+from typing import List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
 
 from ..utils import BaseProcessor
 
@@ -18,128 +19,160 @@ class MessageProcessor(BaseProcessor):
     * Reused regexes for filtering bot and trivial messages from
     Liu, Zhongxin, et al. "Neural-machine-translation-based commit message generation: how far are we?."
     Proceedings of the 33rd ACM/IEEE International Conference on Automated Software Engineering. 2018.
+
+    All regexes are compiled once. Substitutions are applied one after another in a fixed order (each one to the
+    result of the previous one), but patterns that require some literals are only run on messages containing them.
+    How often each rule fires (# messages it changed or dropped) is recorded to stage metrics as `counts`.
     """
 
-    @staticmethod
-    def _filter_emails(message: str) -> str:
-        return re.sub(r"(^|\s)<[\w.-]+@(?=[a-z\d][^.]*\.)[a-z\d.-]*[^.]>", "", message)
+    # (rule name, literals one of which has to be present in message for pattern to match, pattern);
+    # literals for case-insensitive patterns are lowercase, empty tuple means that pattern is always run;
+    # substitutions are applied in this order
+    _SUBSTITUTIONS: List[Tuple[str, Tuple[str, ...], "re.Pattern"]] = [
+        ("email", ("@",), re.compile(r"(^|\s)<[\w.-]+@(?=[a-z\d][^.]*\.)[a-z\d.-]*[^.]>")),
+        ("url", ("http",), re.compile(r"https?://[-a-zA-Z0-9@:%._+~#?=/]+(?=($|[^-a-zA-Z0-9@:%._+~#?=/]))")),
+        # issue numbers: #123, [#123], (#123), <#123>, GH-123, gh-123, CAT-123 (Jira project id)
+        ("issue_ref", ("#",), re.compile(r"[\[\(<]?#[\d]+[\]\)>]?")),
+        ("issue_ref", ("GH-",), re.compile(r"GH-[\d]+")),
+        ("issue_ref", ("gh-",), re.compile(r"gh-[\d]+")),
+        ("issue_ref", ("-",), re.compile(r"([A-Z][A-Z0-9]+-[0-9]+)")),
+        # signatures:
+        # * Not sure about specific tools/repos, but these kinds of signatures appear quite often
+        #     * `Signed-off-by: <username>`
+        #     * `Co-authored-by: <username>`
+        #     * `Also-by: <username>`
+        #     * `Reviewed-by: <username>`
+        #     * `Former commit id: <id>`
+        # * https://github.com/google/moe: `Created by MOE: <some link>\nMOE_MIGRATED_REVID=<some number>`
+        # * https://github.com/facebook/fbshipit:
+        #     * `Differential Revision: <some number>`
+        #     * `Pulled By: <username>`
+        #     * `fbshipit-source-id: <some sha-like string>`
+        # * https://github.com/google/copybara:
+        #     * `BUG=<some number>`
+        #     * `FIXES=<some number>`
+        #     * `Change-Id: <some sha-like string>`
+        #     * `PiperOrigin-RevId: <some number>`
+        #     * `BAZEL_VERSION_REV_ID: <some number>`
+        (
+            "signature",
+            ("signed", "authored", "also", "reviewed", "pulled", "former"),
+            re.compile(
+                r"(signed(-| |)off(-| |)by|co(-| |)authored(-| |)by|also(-| |)by|reviewed(-| |)by|pulled(-| |)by|"
+                r"former(-| |)commit(-| |)id).*?(\n|$)",
+                flags=re.IGNORECASE,
+            ),
+        ),
+        ("signature", ("Created by MOE:",), re.compile(r"Created by MOE:.*?\nMOE_MIGRATED_REVID=.*?($|\n)")),
+        (
+            "signature",
+            ("fbshipit", "differential", "change-id", "piperorigin", "bazel_version"),
+            re.compile(
+                r"(fbshipit-source-id|Differential Revision|Change-Id|PiperOrigin-RevId|BAZEL_VERSION_REV_ID).*?($|\n)",
+                flags=re.IGNORECASE,
+            ),
+        ),
+        ("signature", ("BUG=", "FIXED="), re.compile(r"(BUG=|FIXED=)\d*?($|\n)")),
+        ("at_pattern", ("@",), re.compile(r"@\S+")),
+        ("sha", (), re.compile(r"(^|\s)[\dA-Fa-f-]{7,}(?=(\s|$))")),
+        ("sha", ("ref:",), re.compile(r"(ref:)[\dA-Fa-f-]{7,}(?=(\s|$))")),  # from yandex repos
+        ("sha", ("I",), re.compile(r"\bI[0-9a-fA-F]{6,40}\b")),  # gerrit
+    ]
+
+    # the same with precomputed case sensitivity of patterns
+    _SUBSTITUTION_CHECKS = [
+        (name, literals, bool(pattern.flags & re.IGNORECASE), pattern) for name, literals, pattern in _SUBSTITUTIONS
+    ]
+
+    # patterns for bot and trivial messages, expected format is message with punctuation padded with spaces
+    _TRIVIAL_OR_BOT = re.compile(
+        "|".join(
+            f"(?P<{name}>{pattern})"
+            for name, pattern in [
+                # for bot messages
+                ("bot", r"^ignore update \' .* \.$"),
+                # for shadow messages
+                ("trivial_update", r"^update(d)? (changelog|gitignore|readme( . md| file)?)( \.)?$"),
+                ("trivial_prepare_version", r"^prepare version (v)?[ \d.]+$"),
+                ("trivial_bump_version", r"^bump (up )?version( number| code)?( to (v)?[ \d.]+( - snapshot)?)?( \.)?$"),
+                ("trivial_modify", r"^modify (dockerfile|makefile)( \.)?$"),
+                ("trivial_update_submodule", r"^update submodule(s)?( \.)?$"),
+            ]
+        ),
+        flags=re.IGNORECASE,
+    )
+    # each of the patterns above starts with one of these words
+    _TRIVIAL_OR_BOT_PREFIXES = ("ignore", "update", "prepare", "bump", "modify")
+    _PUNCTUATION_TABLE = str.maketrans({key: " {0} ".format(key) for key in punctuation})
+    _SPACES = re.compile(" +")
+
+    # all rules in the order of bits in masks returned by `_filter_with_rules`
+    RULES = ["not_ascii", "bot", "trivial", "empty"] + list(dict.fromkeys(name for name, _, _ in _SUBSTITUTIONS))
+    _RULE_BITS = {rule: 1 << i for i, rule in enumerate(RULES)}
 
     @staticmethod
-    def _filter_urls(message: str) -> str:
-        return re.sub(r"https?://[-a-zA-Z0-9@:%._+~#?=/]+(?=($|[^-a-zA-Z0-9@:%._+~#?=/]))", "", message)
+    def _match_trivial_or_bot(message: str) -> Optional[str]:
+        """Returns name of the first bot or trivial pattern given message matches (None if there isn't one)."""
+        message = message.strip()
+        # none of the patterns can match when message doesn't start with the expected word
+        if message.isascii() and not message[:7].lower().startswith(MessageProcessor._TRIVIAL_OR_BOT_PREFIXES):
+            return None
 
-    @staticmethod
-    def _filter_at_pattern(message: str) -> str:
-        return re.sub(r"@\S+", "", message)
+        # pad punctuation with spaces - expected format in given regular expressions
+        message = message.translate(MessageProcessor._PUNCTUATION_TABLE)
+        message = MessageProcessor._SPACES.sub(" ", message)
 
-    @staticmethod
-    def _filter_sha(message: str) -> str:
-        x = re.sub(r"(^|\s)[\dA-Fa-f-]{7,}(?=(\s|$))", "", message)
-        x = re.sub(r"(ref:)[\dA-Fa-f-]{7,}(?=(\s|$))", "", x)  # from yandex repos
-        x = re.sub(r"\bI[0-9a-fA-F]{6,40}\b", "", x)  # gerrit
-        return x
+        match = MessageProcessor._TRIVIAL_OR_BOT.match(message)
+        return match.lastgroup if match else None
 
     @staticmethod
-    def _filter_issue_ref(message: str) -> str:
-        """
-        Deletes issue numbers from the following patterns:
-
-        * #123, [#123], (#123), <#123>
-        * GH-123
-        * gh-123
-        * [#123]
-        * CAT-123 (Jira project id)
-        """
-        x = re.sub("[\[\(<]?#[\d]+[\]\)>]?", "", message)
-        x = re.sub("GH-[\d]+", "", x)
-        x = re.sub("gh-[\d]+", "", x)
-        x = re.sub("([A-Z][A-Z0-9]+-[0-9]+)", "", x)
-        return x
+    def _is_trivial_or_bot(message: str) -> bool:
+        return MessageProcessor._match_trivial_or_bot(message) is not None
 
     @staticmethod
-    def _filter_signature(message: str) -> str:
-        """
-        Filters various signatures from messages
-
-        * Not sure about specific tools/repos, but these kinds of signatures appear quite often
-            * `Signed-off-by: <username>`
-            * `Co-authored-by: <username>`
-            * `Also-by: <username>`
-            * `Reviewed-by: <username>`
-            * `Former commit id: <id>`
-        * https://github.com/google/moe: `Created by MOE: <some link>\nMOE_MIGRATED_REVID=<some number>`
-        * https://github.com/facebook/fbshipit:
-            * `Differential Revision: <some number>`
-            * `Pulled By: <username>`
-            * `fbshipit-source-id: <some sha-like string>`
-        * https://github.com/google/copybara:
-            * `BUG=<some number>`
-            * `FIXES=<some number>`
-            * `Change-Id: <some sha-like string>`
-            * `PiperOrigin-RevId: <some number>`
-            * `BAZEL_VERSION_REV_ID: <some number>`
+    def _filter_with_rules(message: str) -> Tuple[str, int]:
+        """Filters given message and returns the result together with a bit mask of rules that fired
+        (bits follow the order of `RULES`).
         """
-        x = re.sub(
-            r"(signed(-| |)off(-| |)by|co(-| |)authored(-| |)by|also(-| |)by|reviewed(-| |)by|pulled(-| |)by|former("
-            r"-| |)commit(-| |)id).*?(\n|$)",
-            "",
-            message,
-            flags=re.IGNORECASE,
-        )
-        x = re.sub(r"Created by MOE:.*?\nMOE_MIGRATED_REVID=.*?($|\n)", "", x)
-        x = re.sub(
-            r"(fbshipit-source-id|Differential Revision|Change-Id|PiperOrigin-RevId|BAZEL_VERSION_REV_ID).*?($|\n)",
-            "",
-            x,
-            flags=re.IGNORECASE,
-        )
-        x = re.sub(r"(BUG=|FIXED=)\d*?($|\n)", "", x)
-        return x
-
-    @staticmethod
-    def _is_trivial_or_bot(message: str) -> bool:
-        message = message.strip()
-        # pad punctuation with spaces - expected format in given regular expressions
-        message = message.translate(str.maketrans({key: " {0} ".format(key) for key in punctuation}))
-        message = re.sub(" +", " ", message)
-
-        patterns = [
-            # for bot messages
-            r"^ignore update \' .* \.$",
-            # for shadow messages
-            r"^update(d)? (changelog|gitignore|readme( . md| file)?)( \.)?$",
-            r"^prepare version (v)?[ \d.]+$",
-            r"^bump (up )?version( number| code)?( to (v)?[ \d.]+( - snapshot)?)?( \.)?$",
-            r"^modify (dockerfile|makefile)( \.)?$",
-            r"^update submodule(s)?( \.)?$",
-        ]
-
-        for pattern in patterns:
-            if re.match(pattern, message, flags=re.IGNORECASE):
-                return True
-
-        return False
+        rule_bits = MessageProcessor._RULE_BITS
+        if not isinstance(message, str) or not message.isascii():
+            return "", rule_bits["not_ascii"]
+        trivial_or_bot = MessageProcessor._match_trivial_or_bot(message)
+        if trivial_or_bot is not None:
+            return "", rule_bits["bot" if trivial_or_bot == "bot" else "trivial"]
+
+        mask = 0
+        x, x_lower = message, None
+        for name, literals, ignore_case, pattern in MessageProcessor._SUBSTITUTION_CHECKS:
+            if literals:
+                if ignore_case and x_lower is None:
+                    x_lower = x.lower()
+                if not any(map((x_lower if ignore_case else x).__contains__, literals)):
+                    continue
+            x, n_subs = pattern.subn("", x)
+            if n_subs:
+                mask |= rule_bits[name]
+                x_lower = None
+        x = x.replace("\n", " ")
+        x = x.strip()
+        if not x:
+            mask |= rule_bits["empty"]
+        return x, mask
 
     @staticmethod
     def _filter(message: str) -> str:
-        if not isinstance(message, str) or not message.isascii() or MessageProcessor._is_trivial_or_bot(message):
-            return ""
-
-        x = MessageProcessor._filter_emails(message)
-        x = MessageProcessor._filter_urls(x)
-        x = MessageProcessor._filter_issue_ref(x)
-        x = MessageProcessor._filter_signature(x)
-        x = MessageProcessor._filter_at_pattern(x)
-        x = MessageProcessor._filter_sha(x)
-        x = x.replace("\n", " ")
-        x = x.strip()
-        return x
+        return MessageProcessor._filter_with_rules(message)[0]
+
+    def process_row(self, message: str, **kwargs) -> Tuple[str, int]:
+        return MessageProcessor._filter_with_rules(message)
+
+    def process_batch(self, messages: List[str], **kwargs) -> List[Tuple[str, int]]:
+        return list(map(MessageProcessor._filter_with_rules, messages))
 
     def process(self, chunk: pd.DataFrame, **kwargs) -> pd.DataFrame:
-        with Parallel(self._n_workers) as pool:
-            filtered_messages = pool(
-                delayed(MessageProcessor._filter)(message) for _, message in chunk["message"].items()
-            )
+        results = self._map_batches(self.process_batch, chunk["message"].tolist())
+        chunk["message"] = [message for message, _ in results]
 
-        chunk["message"] = filtered_messages
+        masks = np.fromiter((mask for _, mask in results), dtype=np.int64, count=len(results))
+        self._record_counts({rule: int(((masks >> i) & 1).sum()) for i, rule in enumerate(self.RULES)})
         return chunk.loc[chunk.message.str.len() > 0]
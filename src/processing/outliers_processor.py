@@ -1,13 +1,14 @@
 import json
 import os
-from typing import Dict, List, Optional, Set
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
 from tqdm import tqdm
 
 from ..utils import BaseProcessor
+from ..utils.histogram import IntHistogram
+from ..utils.n_tokens import get_n_tokens_mods, get_n_tokens_str, is_n_tokens_source, save_n_tokens_source
 
 
 class OutliersProcessor(BaseProcessor):
@@ -21,6 +22,10 @@ class OutliersProcessor(BaseProcessor):
         data_format: In which format mined data is saved.
         diff_upper_bound: Specific upper bound for number of tokens in diffs. Optional,
             default value is None, and this step is skipped.
+        use_precomputed_n_tokens: True to reuse # of tokens already saved to `n_tokens_dir` at collection time
+            (see `RepoProcessor.unite_files`) instead of reading the whole input once more in `prepare`. They are
+            recomputed when they weren't saved for the current input file (see `source.json` in `n_tokens_dir`).
+            Optional, default value is False.
         chunksize: Number of examples to proccess at once (data is read in chunks). Optional, default value is 1000.
         n_workers: Maximum number of concurrently running jobs. Optional, default value is 1 (sequential execution).
         logger_name: Name of logger for this class. Optional, default value is None.
@@ -32,6 +37,7 @@ class OutliersProcessor(BaseProcessor):
         upper_percentile: float,
         data_format: str,
         diff_upper_bound: Optional[int] = None,
+        use_precomputed_n_tokens: bool = False,
         chunksize: Optional[int] = None,
         n_workers: Optional[int] = None,
         logger_name: Optional[str] = None,
@@ -40,55 +46,39 @@ class OutliersProcessor(BaseProcessor):
         self._lower_percentile = lower_percentile
         self._upper_percentile = upper_percentile
         self._diff_upper_bound = diff_upper_bound
+        self._use_precomputed_n_tokens = use_precomputed_n_tokens
 
         self._ids_to_drop: Set[int] = set()
         self._diff_percentiles: Dict[float, float] = {}
         self._message_percentiles: Dict[float, float] = {}
 
-    def _get_n_tokens_str(self, string: str) -> int:
-        """Splits given string by whitespaces and returns # of tokens."""
-        return len(string.split())
-
-    def _get_n_tokens_msg(self, id: int, msg: str) -> str:
+    def _get_n_tokens_msg(self, id: int, msg: str) -> int:
         """
-        Tokenizes given message and returns a string
-            with id and # of tokens separated by ',' with '\n' at the end.
+        Tokenizes given message and returns # of tokens (-1 in case of errors).
         """
         try:
-            return f"{id},{self._get_n_tokens_str(msg)}\n"
+            return get_n_tokens_str(msg)
         except TypeError as e:
             self.logger.warning(f"TypeError {e} with {id}")
-            return f"{id},-1\n"
+            return -1
 
-    def _get_n_tokens_mods(self, id: int, mods: List[Dict[str, str]]) -> str:
+    def _get_n_tokens_mods(self, id: int, mods: List[Dict[str, str]]) -> int:
         """
-        Tokenizes each diff in commit modifications and returns a string
-             with id and # of tokens separated by ',' with '\n' at the end.
+        Tokenizes each diff in commit modifications and returns total # of tokens (-1 in case of errors).
         """
         try:
-            n_tokens = 0
-            for mod in mods:
-                if mod["change_type"] == "UNKNOWN":
-                    continue
-                if mod["change_type"] == "ADD":
-                    file_diff = f"new file {mod['new_path']}\n"
-                elif mod["change_type"] == "DELETE":
-                    file_diff = f"deleted file {mod['old_path']}\n"
-                elif mod["change_type"] == "RENAME":
-                    file_diff = f"rename from {mod['old_path']}\nrename to {mod['new_path']}\n"
-                elif mod["change_type"] == "COPY":
-                    file_diff = f"copy from {mod['old_path']}\ncopy to {mod['new_path']}\n"
-                else:
-                    file_diff = f"{mod['new_path']}\n"
-                n_tokens += self._get_n_tokens_str(file_diff)
-                n_tokens += self._get_n_tokens_str(mod["diff"])
-            return f"{id},{n_tokens}\n"
+            return get_n_tokens_mods(mods)
         except TypeError as e:
             self.logger.warning(f"TypeError {e} with {id}")
-            return f"{id},-1\n"
+            return -1
 
     def _get_n_tokens(self, in_fname: str, n_tokens_dir: str) -> None:
-        """Tokenizes diff and messages and saves # of tokens in diffs and messages to separate files.
+        """Tokenizes diff and messages and saves # of tokens in diffs and messages.
+
+        For each of them, two files are saved:
+
+        * binary file with (id, # tokens) pairs as int64, which is used to find outliers ids
+        * histogram of # tokens, which is used to compute percentiles
 
         Args:
             in_fname: Path to read input data from.
@@ -96,59 +86,72 @@ class OutliersProcessor(BaseProcessor):
         """
         self.logger.info(f"Starting processing # tokens in {in_fname}")
 
-        open(os.path.join(n_tokens_dir, "n_tokens_diff.txt"), "w", encoding="utf-8").close()
-        open(os.path.join(n_tokens_dir, "n_tokens_message.txt"), "w", encoding="utf-8").close()
+        histograms = {"diff": IntHistogram(), "message": IntHistogram()}
+        for key in histograms:
+            open(os.path.join(n_tokens_dir, f"n_tokens_{key}.bin"), "wb").close()
 
         reader = self._read_input(in_fname)
         for chunk in tqdm(reader, desc=f"Tokenizing {in_fname}", leave=False):
-            with Parallel(self._n_workers) as pool:
-                # calculate # tokens in diffs from current chuck
-                diff_res = pool(
-                    delayed(self._get_n_tokens_mods)(item["id"], item["mods"])
-                    for _, item in chunk[["id", "mods"]].iterrows()
-                )
-                # calculate # tokens in messages from current chuck
-                message_res = pool(
-                    delayed(self._get_n_tokens_msg)(item["id"], item["message"])
-                    for _, item in chunk[["id", "message"]].iterrows()
-                )
+            ids = chunk["id"].tolist()
+            # calculate # tokens in diffs and messages from current chuck
+            n_tokens = {
+                "diff": self._map(self._get_n_tokens_mods, ids, chunk["mods"].tolist()),
+                "message": self._map(self._get_n_tokens_msg, ids, chunk["message"].tolist()),
+            }
             # append results from current chunk to target files
-            with open(os.path.join(n_tokens_dir, "n_tokens_diff.txt"), "a", encoding="utf-8") as file:
-                file.writelines(diff_res)
-            with open(os.path.join(n_tokens_dir, "n_tokens_message.txt"), "a", encoding="utf-8") as file:
-                file.writelines(message_res)
+            for key, cur_n_tokens in n_tokens.items():
+                histograms[key].update(n for n in cur_n_tokens if n != -1)
+                with open(os.path.join(n_tokens_dir, f"n_tokens_{key}.bin"), "ab") as file:
+                    np.array([ids, cur_n_tokens], dtype=np.int64).T.tofile(file)
+
+        for key, histogram in histograms.items():
+            histogram.save(os.path.join(n_tokens_dir, f"{key}_hist.json"))
+        save_n_tokens_source(n_tokens_dir, self._data_manager._get_fname(in_fname))
 
         self.logger.info(f"Finished processing # tokens in {in_fname}")
 
+    def _has_n_tokens(self, in_fname: str, n_tokens_dir: str) -> bool:
+        """Checks whether # of tokens in diffs and messages are already saved to given directory
+        and were computed on given input file."""
+        if not all(
+            os.path.exists(os.path.join(n_tokens_dir, fname))
+            for key in ["diff", "message"]
+            for fname in [f"n_tokens_{key}.bin", f"{key}_hist.json"]
+        ):
+            self.logger.warning(f"Couldn't find precomputed # tokens in {n_tokens_dir}, computing them")
+            return False
+        if not is_n_tokens_source(n_tokens_dir, self._data_manager._get_fname(in_fname)):
+            self.logger.warning(f"# tokens in {n_tokens_dir} weren't computed on current {in_fname}, computing them")
+            return False
+        return True
+
     def _get_percentiles(self, n_tokens_dir: str) -> None:
         """Calculates 1%, 5%, 90%, 95%, 99% percentiles of # tokens in diffs and messages.
 
         Args:
-            n_tokens_dir: Path to directory to read # of tokens from.
+            n_tokens_dir: Path to directory to read histograms of # of tokens from.
         """
-        diff_n_tokens = []
-        with open(os.path.join(n_tokens_dir, "n_tokens_diff.txt"), "r") as file:
-            for line in file:
-                id, n_tokens = (int(i) for i in line.strip().split(","))
-                if n_tokens != -1:
-                    diff_n_tokens.append(n_tokens)
-
-        message_n_tokens = []
-        with open(os.path.join(n_tokens_dir, "n_tokens_message.txt"), "r") as file:
-            for line in file:
-                id, n_tokens = (int(i) for i in line.strip().split(","))
-                if n_tokens != -1:
-                    message_n_tokens.append(n_tokens)
-
-        for q in [0.01, 0.05, 0.9, 0.95, 0.99]:
-            self._diff_percentiles[q] = np.quantile(diff_n_tokens, q)
-            self._message_percentiles[q] = np.quantile(message_n_tokens, q)
+        percentiles = [0.01, 0.05, 0.9, 0.95, 0.99]
+        diff_histogram = IntHistogram.load(os.path.join(n_tokens_dir, "diff_hist.json"))
+        message_histogram = IntHistogram.load(os.path.join(n_tokens_dir, "message_hist.json"))
+        self._diff_percentiles = diff_histogram.get_percentiles(percentiles)
+        self._message_percentiles = message_histogram.get_percentiles(percentiles)
 
         with open(os.path.join(n_tokens_dir, "diff.json"), "w") as file:
             json.dump(self._diff_percentiles, file)
         with open(os.path.join(n_tokens_dir, "message.json"), "w") as file:
             json.dump(self._message_percentiles, file)
 
+    @staticmethod
+    def _iterate_n_tokens(fname: str) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Iterates over (id, # tokens) pairs from given binary file in blocks, without loading it into memory."""
+        data = np.memmap(fname, dtype=np.int64, mode="r") if os.path.getsize(fname) else np.empty(0, dtype=np.int64)
+        data = data.reshape(-1, 2)
+        block_size = 1024 * 1024
+        for i in range(0, data.shape[0], block_size):
+            block = np.asarray(data[i : i + block_size])
+            yield block[:, 0], block[:, 1]
+
     def _get_ids_to_drop(self, n_tokens_dir: str) -> None:
         """Aggregates ids of examples which either:
             * have # tokens in diff or in message out of [lower_percentile, upper_percentile] range
@@ -160,27 +163,23 @@ class OutliersProcessor(BaseProcessor):
         """
         self._ids_to_drop = set()
 
-        with open(os.path.join(n_tokens_dir, "n_tokens_diff.txt"), "r") as file:
-            for line in file:
-                id, n_tokens = (int(i) for i in line.strip().split(","))
-                if (
-                    (n_tokens == -1)
-                    or (
-                        n_tokens < self._diff_percentiles[self._lower_percentile]
-                        or n_tokens > self._diff_percentiles[self._upper_percentile]
-                    )
-                    or (self._diff_upper_bound and n_tokens > self._diff_upper_bound)
-                ):
-                    self._ids_to_drop.add(id)
-
-        with open(os.path.join(n_tokens_dir, "n_tokens_message.txt"), "r") as file:
-            for line in file:
-                id, n_tokens = (int(i) for i in line.strip().split(","))
-                if (n_tokens == -1) or (
-                    n_tokens < self._message_percentiles[self._lower_percentile]
-                    or n_tokens > self._message_percentiles[self._upper_percentile]
-                ):
-                    self._ids_to_drop.add(id)
+        for ids, n_tokens in self._iterate_n_tokens(os.path.join(n_tokens_dir, "n_tokens_diff.bin")):
+            mask = (
+                (n_tokens == -1)
+                | (n_tokens < self._diff_percentiles[self._lower_percentile])
+                | (n_tokens > self._diff_percentiles[self._upper_percentile])
+            )
+            if self._diff_upper_bound:
+                mask |= n_tokens > self._diff_upper_bound
+            self._ids_to_drop.update(ids[mask].tolist())
+
+        for ids, n_tokens in self._iterate_n_tokens(os.path.join(n_tokens_dir, "n_tokens_message.bin")):
+            mask = (
+                (n_tokens == -1)
+                | (n_tokens < self._message_percentiles[self._lower_percentile])
+                | (n_tokens > self._message_percentiles[self._upper_percentile])
+            )
+            self._ids_to_drop.update(ids[mask].tolist())
 
     def prepare(self, in_fname: str, n_tokens_dir: str, percentile_dir: Optional[str] = None, **kwargs) -> None:
         """Tokenizes diffs and messages and calculates percentiles for # of tokens.
@@ -191,7 +190,10 @@ class OutliersProcessor(BaseProcessor):
             percentile_dir: Path to directory with already computed percentiles. Optional. Use-case: dropping outliers
                 from val/test by percentiles calculated on train.
         """
-        self._get_n_tokens(in_fname=in_fname, n_tokens_dir=n_tokens_dir)
+        if self._use_precomputed_n_tokens and self._has_n_tokens(in_fname, n_tokens_dir):
+            self.logger.info(f"Using # tokens precomputed at collection time from {n_tokens_dir}")
+        else:
+            self._get_n_tokens(in_fname=in_fname, n_tokens_dir=n_tokens_dir)
 
         if percentile_dir:
             # read precomputed percentiles
@@ -206,5 +208,17 @@ class OutliersProcessor(BaseProcessor):
         self._get_ids_to_drop(n_tokens_dir=n_tokens_dir)
         self.logger.info(f"Got {len(self._ids_to_drop)} outliers ids to drop")
 
+    def _get_prepare_state(self) -> Dict[str, Any]:
+        return {
+            "diff_percentiles": self._diff_percentiles,
+            "message_percentiles": self._message_percentiles,
+            "ids_to_drop": sorted(self._ids_to_drop),
+        }
+
+    def _set_prepare_state(self, state: Dict[str, Any]) -> None:
+        self._diff_percentiles = {float(k): v for k, v in state["diff_percentiles"].items()}
+        self._message_percentiles = {float(k): v for k, v in state["message_percentiles"].items()}
+        self._ids_to_drop = set(state["ids_to_drop"])
+
     def process(self, chunk: pd.DataFrame, **kwargs) -> pd.DataFrame:
         return chunk.loc[~chunk["id"].isin(self._ids_to_drop)]
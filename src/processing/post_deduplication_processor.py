@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import pandas as pd
 from tqdm import tqdm
@@ -136,5 +136,11 @@ class PostDeduplicationProcessor(BaseProcessor):
         self._get_outer_ids_to_drop(msg_clones_fname=msg_clones_fname, diff_clones_fname=diff_clones_fname)
         self.logger.info(f"Got {len(self._ids_to_drop)} ids to drop")
 
+    def _get_prepare_state(self) -> Dict[str, Any]:
+        return {"ids_to_drop": sorted(int(id) for id in self._ids_to_drop)}
+
+    def _set_prepare_state(self, state: Dict[str, Any]) -> None:
+        self._ids_to_drop = set(state["ids_to_drop"])
+
     def process(self, chunk: pd.DataFrame, **kwargs) -> pd.DataFrame:
         return chunk.loc[~chunk["id"].isin(self._ids_to_drop)]
@@ -1,10 +1,10 @@
 import hashlib
 import re
 from collections import Counter
+from functools import partial
 from typing import Dict, List, Optional, Union
 
 import pandas as pd
-from joblib import Parallel, delayed
 
 from ..utils import BaseProcessor
 
@@ -29,9 +29,16 @@ class PreDeduplicationProcessor(BaseProcessor):
         logger_name: Optional[str] = None,
     ):
         super().__init__(chunksize=chunksize, n_workers=n_workers, data_format=data_format, logger_name=logger_name)
-        self._separators = r'[;.\[\]\(\)\~!\-\_\+\&\*/%<>\^\|\?\{\}=\#,"\\\:\$\'`@ +\n\r\t]'
+        self._separators = re.compile(r'[;.\[\]\(\)\~!\-\_\+\&\*/%<>\^\|\?\{\}=\#,"\\\:\$\'`@ +\n\r\t]')
+        # all separators are single ASCII characters, so replacing them with spaces and splitting by space
+        # gives the same tokens as splitting by the regular expression, but faster
+        self._separators_table = str.maketrans(
+            {char: " " for char in map(chr, range(128)) if self._separators.fullmatch(char)}
+        )
+        # whitespaces that are not separators (they are kept inside tokens and only stripped from their ends)
+        self._other_spaces = re.compile(r"[^\S ]")
+        self._hunk_headers = re.compile("@@.*?@@\n")
         self._project_id = project_id
-        self._n_workers = n_workers
 
     def _get_diff_from_mods(self, mods: List[Dict[str, str]]) -> str:
         """Constructs single diff from all file modifications in one commit.
@@ -49,7 +56,13 @@ class PreDeduplicationProcessor(BaseProcessor):
 
     def _split_by_several_separators(self, x: str) -> List[str]:
         """Splits given string by punctuation and whitespaces."""
-        return [y.strip() for y in re.split(self._separators, x) if y]
+        return self._split_translated(x.translate(self._separators_table))
+
+    def _split_translated(self, x: str) -> List[str]:
+        """Splits given string with separators already replaced with spaces."""
+        if self._other_spaces.search(x) is None:
+            return x.split()
+        return [y.strip() for y in x.split(" ") if y]
 
     def _process_single_example(self, cur_id: int, cur_example: Union[str, List[Dict[str, str]]], data_col: str) -> str:
         """Converts a single example into format required by SourcererCC.
@@ -74,8 +87,15 @@ class PreDeduplicationProcessor(BaseProcessor):
         # message preprocessing
         else:
             processed_example = self._preprocess_msg(cur_id, cur_example)
+        return self._to_sourcerer_format(
+            cur_id, processed_example, self._split_by_several_separators(processed_example)
+        )
 
-        c = Counter(self._split_by_several_separators(processed_example))
+    def _to_sourcerer_format(self, cur_id: int, processed_example: str, tokens: List[str]) -> str:
+        """Calculates total # tokens and unique # tokens in preprocessed example and returns its representation:
+        'project_id,sample_id,total_n_tokens,unique_n_tokens,token_hash@#@token1@@::@@frequency,...'
+        """
+        c = Counter(tokens)
         tokens_enc = (
             self._hash_string(processed_example) + "@#@" + ",".join(f"{token}@@::@@{freq}" for token, freq in c.items())
         )
@@ -91,7 +111,7 @@ class PreDeduplicationProcessor(BaseProcessor):
         """
         try:
             processed_example = self._get_diff_from_mods(cur_example)
-            processed_example = re.sub("@@.*?@@\n", "", processed_example)
+            processed_example = self._hunk_headers.sub("", processed_example)
         except TypeError as e:
             self.logger.error(f"[diff] {cur_id} produced TypeError {e}")
             processed_example = str(cur_example)
@@ -109,6 +129,56 @@ class PreDeduplicationProcessor(BaseProcessor):
             processed_example = str(cur_example)
         return processed_example
 
+    def _join_mods(self, mods: List[Dict[str, str]]) -> Optional[str]:
+        """Constructs single diff from all file modifications in one commit (None for malformed modifications)."""
+        try:
+            return self._get_diff_from_mods(mods)
+        except TypeError:
+            return None
+
+    def _preprocess_batch(
+        self, ids: List[int], examples: List[Union[str, List[Dict[str, str]]]], data_col: str
+    ) -> List[str]:
+        """Preprocesses a batch of examples the same way as `_preprocess_msg` and `_preprocess_mods` do,
+        with pandas string methods. Examples that can't be preprocessed (e.g. malformed modifications)
+        are passed to these methods one by one to be reported.
+        """
+        if data_col == "message":
+            texts = [example if isinstance(example, str) else None for example in examples]
+            valid_texts = pd.Series([text for text in texts if text is not None], dtype=object).str.lower()
+            preprocess = self._preprocess_msg
+        else:
+            texts = list(map(self._join_mods, examples))
+            valid_texts = pd.Series([text for text in texts if text is not None], dtype=object)
+            valid_texts = valid_texts.str.replace(self._hunk_headers, "", regex=True)
+            preprocess = self._preprocess_mods
+
+        processed_texts = iter(valid_texts.tolist())
+        return [
+            next(processed_texts) if text is not None else preprocess(cur_id, example)
+            for cur_id, example, text in zip(ids, examples, texts)
+        ]
+
+    def process_row(self, cur_id: int, cur_example: Union[str, List[Dict[str, str]]], data_col: str, **kwargs) -> str:
+        return self._process_single_example(cur_id, cur_example, data_col)
+
+    def process_batch(
+        self, ids: List[int], examples: List[Union[str, List[Dict[str, str]]]], data_col: str, **kwargs
+    ) -> List[str]:
+        """Converts a batch of examples into format required by SourcererCC, running each step for the whole batch.
+
+        Preprocessing and replacing separators are done with pandas string methods; splitting, counting tokens
+        and hashing are done for each example, since pandas has no vectorized counterparts for them.
+
+        When some ids are not integers, examples are processed one by one (ids are converted or reported).
+        """
+        if not all(isinstance(cur_id, int) for cur_id in ids):
+            return super().process_batch(ids, examples, data_col=data_col)
+
+        processed_examples = pd.Series(self._preprocess_batch(ids, examples, data_col), dtype=object)
+        tokens = map(self._split_translated, processed_examples.str.translate(self._separators_table).tolist())
+        return list(map(self._to_sourcerer_format, ids, processed_examples.tolist(), tokens))
+
     def process(self, chunk: pd.DataFrame, data_col: str, **kwargs) -> List[str]:
         """Processes each example in a chunk into format required by SourcererCC.
 
@@ -116,9 +186,6 @@ class PreDeduplicationProcessor(BaseProcessor):
             chunk: Small subset of original dataset.
             data_col: Should be `message` to process messages or `mods` to process diffs.
         """
-        with Parallel(self._n_workers) as pool:
-            res = pool(
-                delayed(self._process_single_example)(cur_id=item["id"], cur_example=item[data_col], data_col=data_col)
-                for _, item in chunk[["id", data_col]].iterrows()
-            )
-        return res
+        return self._map_batches(
+            partial(self.process_batch, data_col=data_col), chunk["id"].tolist(), chunk[data_col].tolist()
+        )
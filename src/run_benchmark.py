@@ -0,0 +1,53 @@
+import logging
+import os
+
+import hydra
+from hydra.utils import to_absolute_path
+from omegaconf import DictConfig, OmegaConf
+
+from .benchmarking import CommitGenerator, ProcessingBenchmark
+
+
+@hydra.main(config_path="../configs", config_name="run_benchmark")
+def main(cfg: DictConfig) -> None:
+    for key in cfg.paths:
+        if cfg.paths[key]:
+            cfg.paths[key] = to_absolute_path(cfg.paths[key])
+    if cfg.training_processor:
+        for key in ["diff_tokenizer_name_or_path", "msg_tokenizer_name_or_path"]:
+            if ".json" in cfg.training_processor[key]:
+                cfg.training_processor[key] = to_absolute_path(cfg.training_processor[key])
+    os.makedirs(cfg.paths.output_dir, exist_ok=True)
+
+    logging.info("======= Using config =======")
+    logging.info(cfg)
+
+    generator = CommitGenerator(**cfg.commit_generator, data_format=cfg.data_format, logger_name="commit_generator")
+    benchmark = ProcessingBenchmark(
+        generator=generator,
+        output_dir=cfg.paths.output_dir,
+        data_format=cfg.data_format,
+        processors_kwargs=OmegaConf.to_container(cfg.processors),
+        training_processor_kwargs=OmegaConf.to_container(cfg.training_processor) if cfg.training_processor else None,
+        logger_name="benchmark",
+    )
+    if cfg.benchmark.diff_filter:
+        for n_commits in cfg.benchmark.n_commits:
+            benchmark.run_diff_filter(n_commits=n_commits)
+
+    results = benchmark.run(
+        n_commits=list(cfg.benchmark.n_commits),
+        n_workers=list(cfg.benchmark.n_workers),
+        chunksizes=list(cfg.benchmark.chunksizes),
+    )
+
+    if cfg.paths.baseline_fname:
+        slowdowns = benchmark.compare(
+            results, baseline_fname=cfg.paths.baseline_fname, max_slowdown=cfg.benchmark.max_slowdown
+        )
+        if slowdowns:
+            raise RuntimeError(f"{len(slowdowns)} stages are slower than baseline")
+
+
+if __name__ == "__main__":
+    main()
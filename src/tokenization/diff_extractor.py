@@ -1,10 +1,10 @@
 from typing import Dict, Optional
 
-import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
 from ..utils import BaseProcessor
+from ..utils.histogram import IntHistogram
 
 
 class DiffExtractor(BaseProcessor):
@@ -34,12 +34,11 @@ class DiffExtractor(BaseProcessor):
 
     def prepare(self, in_fname: str, **kwargs) -> None:
         """Calculates percentiles on diff lengths."""
-        diff_lens = []
+        histogram = IntHistogram()
         reader = self._read_input(in_fname)
         for chunk in tqdm(reader, leave=False, desc=f"Iterating over {in_fname} to compute diff lens percentiles"):
-            diff_lens.extend([len(diff) for diff in chunk["diff"].tolist()])
-        for q in [0.01, 0.05, 0.9, 0.95, 0.99]:
-            self._percentiles[q] = np.quantile(diff_lens, q)
+            histogram.update(len(diff) for diff in chunk["diff"].tolist())
+        self._percentiles = histogram.get_percentiles([0.01, 0.05, 0.9, 0.95, 0.99])
         self.logger.info(f"{self._percentiles}")
 
     def process(self, chunk: pd.DataFrame, **kwargs) -> pd.DataFrame:
@@ -76,4 +75,6 @@ class DiffExtractor(BaseProcessor):
                 if n_processed_examples >= n_examples:
                     break
 
+        self._close_outfile(out_fname, add_data_format=False)
+
         self.logger.info(f"Finished processing {in_fname}")
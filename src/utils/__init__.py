@@ -1,3 +1,4 @@
 from .base_utils import BaseProcessor
+from .watchdog_pool import WatchdogPool
 
-__all__ = ["BaseProcessor"]
+__all__ = ["BaseProcessor", "WatchdogPool"]
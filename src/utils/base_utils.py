@@ -1,17 +1,125 @@
+import json
 import logging
-from typing import List, Optional, Union
+import math
+import os
+import time
+from functools import partial
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import dask.dataframe as dd
-import jsonlines
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
 from tqdm import tqdm
 
+from .compression import get_compression, open_compressed
+from .metrics import StageMetrics
+
+
+def _apply_to_batch(func: Callable, *columns: Sequence) -> List[Any]:
+    """
+    Applies given function to each row of a batch, where batch is represented as separate columns.
+    """
+    return [func(*row) for row in zip(*columns)]
+
+
+def _apply_batch_func_timed(batch_func: Callable, *columns: Sequence) -> Tuple[List[Any], float]:
+    """
+    Applies given function to a whole batch (represented as separate columns) and additionally returns time spent on it.
+    """
+    start_time = time.perf_counter()
+    results = batch_func(*columns)
+    return results, time.perf_counter() - start_time
+
+
+class BufferedFileWriter:
+    """
+    This is a class for writing to a file which stays open until the writer is closed.
+
+    Data is accumulated in memory and written to disk when buffer size exceeds given threshold.
+
+    Args:
+        fname: Path to target file.
+        mode: Mode to open file in (`wb` to clear file, `ab` to append to file). Optional, default value is `ab`.
+        buffer_size: Maximum size of buffered data (in bytes). Optional, default value is 16 MB.
+        compression: Codec to compress data with on the fly (`gzip` or `zstd`). Optional, default value is None.
+        compression_level: Compression level. Optional, codec's default level is used when not given.
+    """
+
+    def __init__(
+        self,
+        fname: str,
+        mode: str = "ab",
+        buffer_size: int = 16 * 1024 * 1024,
+        compression: Optional[str] = None,
+        compression_level: Optional[int] = None,
+    ):
+        self._file = open_compressed(fname, mode=mode, compression=compression, compression_level=compression_level)
+        self._buffer: List[bytes] = []
+        self._buffered_bytes = 0
+        self._buffer_size = buffer_size
+
+    def write(self, data: bytes) -> None:
+        self._buffer.append(data)
+        self._buffered_bytes += len(data)
+        if self._buffered_bytes >= self._buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.write(b"".join(self._buffer))
+        self._file.flush()
+        self._buffer = []
+        self._buffered_bytes = 0
+
+    def tell(self) -> int:
+        """Returns position in target file, taking buffered data into account."""
+        return self._file.tell() + self._buffered_bytes
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
 
 class BaseManager:
     """
     This is a base class for writing & reading data.
+
+    It keeps a single buffered writer open for each output file until `close_outfile` is called.
+    Plain text outputs (lists of strings) are handled here, because they don't depend on chosen data format.
     """
 
+    data_format = ""
+    # whether data files can be split, truncated and concatenated at line boundaries
+    supports_byte_offsets = False
+
+    def __init__(self):
+        self._writers: Dict[str, BufferedFileWriter] = {}
+        # total size of serialized data passed to writers (for throughput statistics)
+        self.n_bytes_written = 0
+
+    def __getstate__(self):
+        # opened files can't be passed to other processes
+        state = self.__dict__.copy()
+        state["_writers"] = {}
+        return state
+
+    def _get_fname(self, fname: str, add_data_format: Optional[bool] = True) -> str:
+        return f"{fname}.{self.data_format}" if add_data_format else fname
+
+    def _open_writer(self, fname: str, mode: str, **writer_kwargs) -> BufferedFileWriter:
+        if fname in self._writers:
+            self._writers.pop(fname).close()
+        self._writers[fname] = BufferedFileWriter(fname, mode=mode, **writer_kwargs)
+        return self._writers[fname]
+
+    def _get_writer(self, fname: str) -> BufferedFileWriter:
+        if fname not in self._writers:
+            return self._open_writer(fname, mode="ab")
+        return self._writers[fname]
+
     def prepare_outfile(self, out_fname: str, add_data_format: Optional[bool] = True) -> None:
         """
         Does what might be required before saving to chosen output format.
@@ -19,12 +127,70 @@ class BaseManager:
         """
         raise NotImplementedError()
 
-    def append_to_outfile(self, data: pd.DataFrame, out_fname: str, add_data_format: Optional[bool] = True) -> None:
+    def append_to_outfile(
+        self, data: Union[pd.DataFrame, List[Dict[str, Any]]], out_fname: str, add_data_format: Optional[bool] = True
+    ) -> None:
         """
         Appends current data chunk to chosen output format.
         """
         raise NotImplementedError()
 
+    def append_lines_to_outfile(self, lines: List[str], out_fname: str) -> None:
+        """
+        Appends given lines to plain text file.
+        """
+        data = "".join(lines).encode("utf-8")
+        self.n_bytes_written += len(data)
+        self._get_writer(out_fname).write(data)
+
+    def close_outfile(self, out_fname: str, add_data_format: Optional[bool] = True) -> None:
+        """
+        Does what might be required after all data chunks are saved to chosen output format.
+        (e.g. write footer in case of parquet files)
+        """
+        out_fname = self._get_fname(out_fname, add_data_format=add_data_format)
+        if out_fname in self._writers:
+            self._writers.pop(out_fname).close()
+
+    def get_outfile_position(self, out_fname: str, add_data_format: Optional[bool] = True) -> int:
+        """
+        Writes all buffered data to target file and returns its size in bytes.
+        """
+        out_fname = self._get_fname(out_fname, add_data_format=add_data_format)
+        if out_fname in self._writers:
+            self._writers[out_fname].flush()
+        return os.path.getsize(out_fname) if os.path.exists(out_fname) else 0
+
+    def truncate_outfile(self, out_fname: str, position: int, add_data_format: Optional[bool] = True) -> None:
+        """
+        Drops everything after given position from target file and opens a writer to append to it.
+        """
+        out_fname = self._get_fname(out_fname, add_data_format=add_data_format)
+        if out_fname in self._writers:
+            self._writers.pop(out_fname).close()
+        open(out_fname, mode="ab").close()
+        os.truncate(out_fname, position)
+        self._open_writer(out_fname, mode="ab")
+
+    def append_file_to_outfile(self, in_fname: str, out_fname: str, add_data_format: Optional[bool] = True) -> None:
+        """
+        Appends whole contents of given file to target file and removes given file.
+        """
+        in_fname = self._get_fname(in_fname, add_data_format=add_data_format)
+        writer = self._get_writer(self._get_fname(out_fname, add_data_format=add_data_format))
+        with open(in_fname, mode="rb") as f:
+            for block in iter(lambda: f.read(16 * 1024 * 1024), b""):
+                writer.write(block)
+        os.remove(in_fname)
+
+    def get_shard_ranges(
+        self, in_fname: str, n_shards: int, add_data_format: Optional[bool] = True
+    ) -> List[Tuple[int, int]]:
+        """
+        Splits given file into (approximately) equal byte ranges which can be read independently.
+        """
+        raise NotImplementedError()
+
     def read_input(self, in_fname: str, add_data_format: Optional[bool] = True, **kwargs):
         """
         Reads data according to chosen output format (accessing full dataset/reading in chunks).
@@ -43,51 +209,332 @@ class JsonlManager(BaseManager):
     This is a class for writing & reading jsonl data.
     """
 
-    def prepare_outfile(self, out_fname: str, add_data_format: Optional[bool] = True) -> None:
+    data_format = "jsonl"
+    supports_byte_offsets = True
+
+    _COMPRESSED_EXTENSIONS = {".gz", ".bz2", ".zip", ".xz", ".zst", ".tar"}
+    # compressions that can be read line by line without pandas (see `utils.compression`)
+    _STREAM_COMPRESSIONS = {"gzip", "zstd"}
+
+    @staticmethod
+    def _dumps(record: Dict[str, Any]) -> bytes:
+        try:
+            return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY)
+        except orjson.JSONEncodeError:
+            # e.g. lone surrogates in strings, which can't be encoded to utf-8 without escaping
+            # (only they are escaped, other characters are kept as is, like orjson does)
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            return line.encode("utf-8", errors="backslashreplace")
+
+    def prepare_outfile(
+        self,
+        out_fname: str,
+        add_data_format: Optional[bool] = True,
+        compression: Optional[str] = None,
+        compression_level: Optional[int] = None,
+        append: bool = False,
+    ) -> None:
         """
-        Clears target file.
+        Clears target file (or keeps its contents when `append` is True) and opens a writer for it.
+        When compression is given, data is compressed on the fly.
         """
-        if add_data_format:
-            out_fname = f"{out_fname}.jsonl"
-
-        open(out_fname, mode="w").close()
+        self._open_writer(
+            self._get_fname(out_fname, add_data_format=add_data_format),
+            mode="ab" if append else "wb",
+            compression=compression,
+            compression_level=compression_level,
+        )
 
     def append_to_outfile(
         self,
-        data: pd.DataFrame,
+        data: Union[pd.DataFrame, List[Dict[str, Any]]],
         out_fname: str,
         add_data_format: Optional[bool] = True,
     ) -> None:
         """
         Appends current data chunk.
+
+        `pd.DataFrame` is serialized straight from its columns, without converting whole chunk to records first.
+        """
+        if isinstance(data, pd.DataFrame):
+            columns = data.columns.tolist()
+            records = (dict(zip(columns, row)) for row in zip(*(data[col].tolist() for col in columns)))
+        else:
+            records = data
+
+        data = b"".join(self._dumps(record) for record in records)
+        self.n_bytes_written += len(data)
+        self._get_writer(self._get_fname(out_fname, add_data_format=add_data_format)).write(data)
+
+    def get_shard_ranges(
+        self, in_fname: str, n_shards: int, add_data_format: Optional[bool] = True
+    ) -> List[Tuple[int, int]]:
         """
-        data = data.to_dict(orient="records")
+        Splits given file into (approximately) equal byte ranges, each range starts at the beginning of a line.
+        """
+        in_fname = self._get_fname(in_fname, add_data_format=add_data_format)
+        size = os.path.getsize(in_fname)
 
-        if add_data_format:
-            out_fname = f"{out_fname}.jsonl"
+        boundaries = [0]
+        with open(in_fname, mode="rb") as f:
+            for i in range(1, n_shards):
+                # move to the beginning of the next line after approximate boundary
+                f.seek(max(size * i // n_shards - 1, boundaries[-1]))
+                f.readline()
+                boundaries.append(max(f.tell(), boundaries[-1]))
+        boundaries.append(size)
 
-        with jsonlines.open(out_fname, mode="a") as writer:
-            writer.write_all(data)
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
 
-    def read_input(self, in_fname: str, add_data_format: Optional[bool] = True, **kwargs):
+    @staticmethod
+    def _read_chunks(
+        in_fname: str,
+        chunksize: int,
+        byte_range: Optional[Tuple[int, int]] = None,
+        skip_rows: Optional[int] = None,
+        compression: Optional[str] = None,
+        **kwargs,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Reads jsonl data in chunks of lines. Size of each chunk in bytes is saved to `chunk.attrs["n_bytes"]`.
+
+        Args:
+            in_fname: Path to read data from.
+            chunksize: Number of rows in each chunk.
+            byte_range: Start and end positions of the part of file to read, start should be at the beginning
+                of a line. Optional, whole file is read when not given.
+            skip_rows: Number of rows to skip (skipped rows are not parsed). Optional, default value is None.
+            compression: Codec file is compressed with (positions are not supported for compressed files).
+                Optional, default value is None.
+        """
+        if compression is not None and byte_range is not None:
+            raise ValueError("Reading byte ranges is not supported for compressed files")
+        start, end = byte_range if byte_range else (0, math.inf if compression else os.path.getsize(in_fname))
+        with open_compressed(in_fname, mode="rb", compression=compression) as f:
+            if start:
+                f.seek(start)
+            for _ in range(skip_rows or 0):
+                f.readline()
+            position = f.tell()
+            n_rows = skip_rows or 0
+
+            while position < end:
+                lines = []
+                while position < end and len(lines) < chunksize:
+                    line = f.readline()
+                    if not line:
+                        break
+                    position += len(line)
+                    lines.append(line)
+                if not lines:
+                    break
+
+                data = b"".join(lines)
+                chunk = pd.read_json(BytesIO(data), orient="records", lines=True, convert_dates=False, **kwargs)
+                chunk.index += n_rows
+                chunk.attrs["n_bytes"] = len(data)
+                n_rows += len(chunk)
+                yield chunk
+
+    def read_input(
+        self,
+        in_fname: str,
+        add_data_format: Optional[bool] = True,
+        chunksize: Optional[int] = None,
+        skip_rows: Optional[int] = None,
+        byte_range: Optional[Tuple[int, int]] = None,
+        **kwargs,
+    ):
         """
         Reads jsonl data with pandas.
+
+        Args:
+            in_fname: Path to read data from.
+            add_data_format: True to add `.jsonl` extension to given path.
+            chunksize: Number of rows in each chunk. Optional, whole file is read at once when not given.
+            skip_rows: Number of rows to skip from the start of the file (only supported for reading in chunks).
+                Optional, default value is None.
+            byte_range: Start and end positions of the part of file to read, start should be at the beginning
+                of a line (only supported for reading in chunks). Optional, default value is None.
         """
-        if add_data_format:
-            in_fname = f"{in_fname}.jsonl"
+        in_fname = self._get_fname(in_fname, add_data_format=add_data_format)
+        compression = kwargs.get("compression", "infer")
+        if compression == "infer":
+            compression = get_compression(in_fname)
+            is_compressed = os.path.splitext(in_fname)[1] in self._COMPRESSED_EXTENSIONS
+        else:
+            is_compressed = compression is not None
 
-        return pd.read_json(in_fname, orient="records", lines=True, convert_dates=False, **kwargs)
+        if chunksize and (not is_compressed or compression in self._STREAM_COMPRESSIONS):
+            kwargs = {key: value for key, value in kwargs.items() if key != "compression"}
+            return self._read_chunks(
+                in_fname,
+                chunksize=chunksize,
+                byte_range=byte_range,
+                skip_rows=skip_rows,
+                compression=compression if is_compressed else None,
+                **kwargs,
+            )
+        return pd.read_json(in_fname, orient="records", lines=True, convert_dates=False, chunksize=chunksize, **kwargs)
 
     def read_input_lazy(self, in_fname: str, add_data_format: Optional[bool] = True, **kwargs):
         """
         Reads jsonl data with dask.
         """
-        if add_data_format:
-            in_fname = f"{in_fname}.jsonl"
-
+        in_fname = self._get_fname(in_fname, add_data_format=add_data_format)
         return dd.read_json(in_fname, orient="records", lines=True, **kwargs)
 
 
+class ParquetManager(BaseManager):
+    """
+    This is a class for writing & reading parquet data.
+
+    Each appended chunk is saved as a separate row group, so reading in chunks doesn't require parsing whole file.
+    Modifications are stored as typed nested structs instead of JSON strings.
+    """
+
+    _MODS_TYPE = pa.list_(
+        pa.struct(
+            [
+                pa.field("change_type", pa.string()),
+                pa.field("old_path", pa.string()),
+                pa.field("new_path", pa.string()),
+                pa.field("diff", pa.string()),
+            ]
+        )
+    )
+
+    data_format = "parquet"
+
+    def __init__(self):
+        super().__init__()
+        self._parquet_writers: Dict[str, pq.ParquetWriter] = {}
+
+    def __getstate__(self):
+        # opened writers can't be passed to other processes
+        state = super().__getstate__()
+        state["_parquet_writers"] = {}
+        return state
+
+    def _get_schema(self, data: pd.DataFrame) -> pa.Schema:
+        """
+        Infers schema from given data chunk, using explicit types for known nested columns.
+        """
+        schema = pa.Schema.from_pandas(data, preserve_index=False)
+        if "mods" in schema.names:
+            schema = schema.set(schema.get_field_index("mods"), pa.field("mods", self._MODS_TYPE))
+        if "author" in schema.names and pa.types.is_list(schema.field("author").type):
+            schema = schema.set(schema.get_field_index("author"), pa.field("author", pa.list_(pa.string())))
+        return schema
+
+    @staticmethod
+    def _to_pandas(table: pa.Table, start: int) -> pd.DataFrame:
+        """
+        Converts arrow table to `pd.DataFrame`. Nested columns are converted to lists of Python objects
+        to match the result of reading jsonl data.
+        """
+        data = {}
+        for name, column in zip(table.column_names, table.columns):
+            if pa.types.is_nested(column.type):
+                data[name] = column.to_pylist()
+            else:
+                data[name] = column.to_pandas()
+        return pd.DataFrame(data, index=pd.RangeIndex(start, start + table.num_rows))
+
+    def prepare_outfile(self, out_fname: str, add_data_format: Optional[bool] = True) -> None:
+        """
+        Removes target file (parquet files can't be appended to, so writer is opened on first chunk).
+        """
+        out_fname = self._get_fname(out_fname, add_data_format=add_data_format)
+
+        if out_fname in self._parquet_writers:
+            self._parquet_writers.pop(out_fname).close()
+        if os.path.exists(out_fname):
+            os.remove(out_fname)
+
+    def append_to_outfile(
+        self,
+        data: Union[pd.DataFrame, List[Dict[str, Any]]],
+        out_fname: str,
+        add_data_format: Optional[bool] = True,
+    ) -> None:
+        """
+        Appends current data chunk as a new row group.
+        """
+        if not isinstance(data, pd.DataFrame):
+            data = pd.DataFrame.from_records(data)
+
+        out_fname = self._get_fname(out_fname, add_data_format=add_data_format)
+
+        if out_fname not in self._parquet_writers:
+            if data.empty:
+                # types can't be inferred from empty chunk
+                return
+            self._parquet_writers[out_fname] = pq.ParquetWriter(out_fname, self._get_schema(data))
+
+        writer = self._parquet_writers[out_fname]
+        table = pa.Table.from_pandas(data, schema=writer.schema, preserve_index=False)
+        # size before compression, actual file size is only known after footer is written
+        self.n_bytes_written += table.nbytes
+        writer.write_table(table)
+
+    def close_outfile(self, out_fname: str, add_data_format: Optional[bool] = True) -> None:
+        """
+        Writes file footer. When nothing was written to target parquet file, creates an empty one.
+        """
+        super().close_outfile(out_fname, add_data_format=add_data_format)
+        if not add_data_format:
+            return
+
+        out_fname = self._get_fname(out_fname, add_data_format=add_data_format)
+        if out_fname in self._parquet_writers:
+            self._parquet_writers.pop(out_fname).close()
+        elif not os.path.exists(out_fname):
+            pq.write_table(pa.table({}), out_fname)
+
+    def _read_chunks(self, in_fname: str, chunksize: int, columns: Optional[List[str]]) -> Iterator[pd.DataFrame]:
+        """
+        Iterates over parquet file in chunks of given size.
+        """
+        parquet_file = pq.ParquetFile(in_fname)
+        start = 0
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            table = pa.Table.from_batches([batch])
+            yield self._to_pandas(table, start)
+            start += table.num_rows
+
+    def read_input(
+        self,
+        in_fname: str,
+        add_data_format: Optional[bool] = True,
+        chunksize: Optional[int] = None,
+        columns: Optional[List[str]] = None,
+        **kwargs,
+    ):
+        """
+        Reads parquet data with pyarrow.
+
+        Args:
+            in_fname: Path to read data from.
+            add_data_format: True to add `.parquet` extension to given path.
+            chunksize: Number of rows in each chunk. Optional, whole file is read at once when not given.
+            columns: Subset of columns to read. Optional, all columns are read when not given.
+        """
+        in_fname = self._get_fname(in_fname, add_data_format=add_data_format)
+
+        if chunksize:
+            return self._read_chunks(in_fname, chunksize=chunksize, columns=columns)
+        return self._to_pandas(pq.read_table(in_fname, columns=columns), start=0)
+
+    def read_input_lazy(self, in_fname: str, add_data_format: Optional[bool] = True, **kwargs):
+        """
+        Reads parquet data with dask.
+        """
+        in_fname = self._get_fname(in_fname, add_data_format=add_data_format)
+
+        return dd.read_parquet(in_fname, **kwargs)
+
+
 class BaseProcessor:
     """
     This is a base class for data collection and processing, which provides methods for writing & reading data and
@@ -103,14 +550,26 @@ class BaseProcessor:
     ):
         self._chunksize = chunksize if chunksize else 1000
         self._n_workers = n_workers if n_workers else 1
+        self._pool: Optional[Parallel] = None
+        self._metrics: Optional[StageMetrics] = None
         self.logger = BaseProcessor._get_logger(logger_name)
         self.data_format = data_format
 
         if data_format == "jsonl":
             self._data_manager = JsonlManager()
+        elif data_format == "parquet":
+            self._data_manager = ParquetManager()
         else:
             raise NotImplementedError("Current data format is not supported")
 
+    def __getstate__(self):
+        # worker pool can't be passed to other processes, and workers don't need it or statistics collected so far
+        # (they return their counts to the main process instead)
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_metrics"] = None
+        return state
+
     @staticmethod
     def _get_logger(name):
         """
@@ -127,26 +586,101 @@ class BaseProcessor:
             logger.addHandler(fh)
         return logger
 
-    def _prepare_outfile(self, out_fname: str, add_data_format: Optional[bool] = True) -> None:
+    def _get_pool(self) -> Parallel:
+        """
+        Returns worker pool, which is created on first call and reused until `_close_pool` is called.
+        """
+        if self._pool is None:
+            self._pool = Parallel(self._n_workers)
+            self._pool.__enter__()
+        return self._pool
+
+    def _close_pool(self) -> None:
+        """
+        Shuts down worker pool (if it was created).
+        """
+        if self._pool is not None:
+            self._pool.__exit__(None, None, None)
+            self._pool = None
+
+    def _record_counts(self, counts: Dict[str, int]) -> None:
+        """
+        Adds processor-specific counters (e.g. how often each filter fires) to statistics of current chunk.
+        """
+        if self._metrics is not None:
+            self._metrics.record_counts(counts)
+
+    def _map(self, func: Callable, *columns: Sequence, batches_per_worker: int = 4) -> List[Any]:
+        """
+        Applies given function to each row and returns results in original order.
+
+        Rows are sent to workers in large contiguous batches instead of one at a time,
+        so that serialization overhead is paid once per batch.
+
+        Args:
+            func: Function to apply, it receives one value from each column as positional arguments.
+            *columns: Sequences of equal lengths (e.g. `chunk["mods"].tolist()`).
+            batches_per_worker: Number of batches to split rows into for each worker.
+        """
+        return self._map_batches(partial(_apply_to_batch, func), *columns, batches_per_worker=batches_per_worker)
+
+    def _map_batches(self, batch_func: Callable, *columns: Sequence, batches_per_worker: int = 4) -> List[Any]:
+        """
+        Splits given columns into large contiguous batches, applies given function to each whole batch
+        (in workers when there are several of them) and returns concatenated results in original order.
+
+        Args:
+            batch_func: Function to apply, it receives slices of all columns as positional arguments and should
+                return a list with one value for each row (e.g. `process_batch`).
+            *columns: Sequences of equal lengths (e.g. `chunk["mods"].tolist()`).
+            batches_per_worker: Number of batches to split rows into for each worker.
+        """
+        n_rows = len(columns[0]) if columns else 0
+        if self._n_workers == 1 or n_rows == 0:
+            return batch_func(*columns)
+
+        batch_size = math.ceil(n_rows / (self._n_workers * batches_per_worker))
+        start_time = time.perf_counter()
+        results = self._get_pool()(
+            delayed(_apply_batch_func_timed)(batch_func, *(column[i : i + batch_size] for column in columns))
+            for i in range(0, n_rows, batch_size)
+        )
+        if self._metrics is not None:
+            self._metrics.record_pool_usage(
+                wall_time=time.perf_counter() - start_time,
+                busy_time=sum(batch_time for _, batch_time in results),
+                n_workers=self._n_workers,
+            )
+        return [res for batch_results, _ in results for res in batch_results]
+
+    def _prepare_outfile(self, out_fname: str, add_data_format: Optional[bool] = True, **kwargs) -> None:
         """
         Does what might be required before saving to chosen output format.
+        Keyword arguments are passed to data manager (e.g. compression for jsonl files).
         """
-        self._data_manager.prepare_outfile(out_fname, add_data_format=add_data_format)
+        self._data_manager.prepare_outfile(out_fname, add_data_format=add_data_format, **kwargs)
 
     def _append_to_outfile(
         self,
-        data: Union[pd.DataFrame, List[str]],
+        data: Union[pd.DataFrame, List[Dict[str, Any]], List[str]],
         out_fname: str,
         add_data_format: Optional[bool] = True,
+        as_records: bool = False,
     ) -> None:
         """
-        Appends current data chunk to chosen output format.
+        Appends current data chunk to chosen output format. Lists are appended to plain text files as lines,
+        unless `as_records` is True (lists of dicts).
         """
-        if isinstance(data, pd.DataFrame):
+        if isinstance(data, pd.DataFrame) or as_records:
             self._data_manager.append_to_outfile(data, out_fname, add_data_format=add_data_format)
         else:
-            with open(out_fname, mode="a") as f:
-                f.writelines(data)
+            self._data_manager.append_lines_to_outfile(data, out_fname)
+
+    def _close_outfile(self, out_fname: str, add_data_format: Optional[bool] = True) -> None:
+        """
+        Does what might be required after saving all data chunks to chosen output format.
+        """
+        self._data_manager.close_outfile(out_fname, add_data_format=add_data_format)
 
     def _read_input(
         self,
@@ -188,13 +722,239 @@ class BaseProcessor:
         """
         raise NotImplementedError()
 
-    def __call__(self, in_fname: str, out_fname: str, add_data_format: Optional[bool] = True, **kwargs) -> None:
+    def process_batch(self, *columns: List[Any], **kwargs) -> List[Any]:
+        """
+        Implements processing logic for a batch of rows represented as whole columns (lists of values from the same
+        rows, e.g. `chunk["id"].tolist()` and `chunk["message"].tolist()`). Processors can override it to work
+        on whole columns at once (e.g. to flatten nested values or to amortize per-row overhead).
+
+        It is run by `_map_batches` (in workers when there are several of them), so it should only use state
+        that is already available after `prepare`. By default, each row is processed with `process_row`.
+
+        Args:
+            *columns: Columns of equal lengths.
+            **kwargs: Arbitrary keyword arguments.
+
+        Returns:
+            A single column of results, one value for each row.
+        """
+        return [self.process_row(*row, **kwargs) for row in zip(*columns)]
+
+    def process_row(self, *values: Any, **kwargs) -> Any:
+        """
+        Implements processing logic for a single row (used by default `process_batch`).
+
+        Args:
+            *values: One value from each column passed to `process_batch`.
+            **kwargs: Arbitrary keyword arguments.
+        """
+        raise NotImplementedError()
+
+    def _get_out_fnames(self, out_fname: str) -> List[str]:
+        """
+        Returns paths to all output files. Processors that save several versions of data should override this method
+        together with `_split_outputs`.
+        """
+        return [out_fname]
+
+    def _split_outputs(self, processed_chunk: Union[pd.DataFrame, List[str]]) -> List[Union[pd.DataFrame, List[str]]]:
+        """
+        Returns data to save to each output file (in the same order as `_get_out_fnames`).
+        """
+        return [processed_chunk]
+
+    def _get_prepare_state(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns JSON-serializable results of `prepare` which are required for processing chunks (e.g. percentiles),
+        so that they can be saved to checkpoint. When None is returned, `prepare` is run again on resuming.
+        """
+        return None
+
+    def _set_prepare_state(self, state: Dict[str, Any]) -> None:
+        """
+        Restores results of `prepare` from checkpoint.
+        """
+        pass
+
+    @staticmethod
+    def _load_checkpoint(fname: str, in_fname: str) -> Optional[Dict[str, Any]]:
+        """
+        Reads checkpoint from given file. Checkpoints made for other input files are ignored.
+        """
+        if not os.path.exists(fname):
+            return None
+        with open(fname, "r") as f:
+            checkpoint = json.load(f)
+        return checkpoint if checkpoint["in_fname"] == in_fname else None
+
+    @staticmethod
+    def _save_checkpoint(fname: str, checkpoint: Dict[str, Any]) -> None:
+        """
+        Saves checkpoint to given file (atomically, so that a crash while saving doesn't corrupt previous one).
+        """
+        with open(f"{fname}.tmp", "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(f"{fname}.tmp", fname)
+
+    @staticmethod
+    def _iterate_timed(reader: Iterable[pd.DataFrame]) -> Iterator[Tuple[pd.DataFrame, float]]:
+        """
+        Yields chunks from given reader together with time spent on reading each of them.
+        """
+        iterator = iter(reader)
+        while True:
+            start_time = time.perf_counter()
+            chunk = next(iterator, None)
+            if chunk is None:
+                return
+            yield chunk, time.perf_counter() - start_time
+
+    def _process_chunk(
+        self,
+        chunk: pd.DataFrame,
+        read_time: float,
+        out_fnames: List[str],
+        add_data_format: Optional[bool],
+        process_kwargs: Dict[str, Any],
+    ) -> None:
+        """
+        Processes a single chunk, saves results to output files and records statistics for this chunk.
+        """
+        n_bytes_written = self._data_manager.n_bytes_written
+
+        start_time = time.perf_counter()
+        outputs = self._split_outputs(self.process(chunk, **process_kwargs))
+        process_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for fname, data in zip(out_fnames, outputs):
+            self._append_to_outfile(data, fname, add_data_format=add_data_format)
+        write_time = time.perf_counter() - start_time
+
+        if self._metrics is not None:
+            self._metrics.record_chunk(
+                read_time=read_time,
+                process_time=process_time,
+                write_time=write_time,
+                rows_in=len(chunk),
+                rows_out=len(outputs[0]),
+                bytes_in=chunk.attrs.get("n_bytes"),
+                bytes_out=self._data_manager.n_bytes_written - n_bytes_written,
+            )
+
+    def _get_data_size(self, fnames: List[str], add_data_format: Optional[bool] = True) -> Optional[int]:
+        """
+        Returns total size of given files in bytes (None if any of them doesn't exist).
+        """
+        fnames = [self._data_manager._get_fname(fname, add_data_format=add_data_format) for fname in fnames]
+        if not all(os.path.exists(fname) for fname in fnames):
+            return None
+        return sum(os.path.getsize(fname) for fname in fnames)
+
+    def _save_metrics(self, in_fname: str, out_fnames: List[str], add_data_format: Optional[bool] = True) -> None:
+        """
+        Logs main statistics of the finished stage and appends all of them to `<logger name>.metrics.jsonl`.
+        """
+        bytes_in = self._get_data_size([in_fname])
+        bytes_out = self._get_data_size(out_fnames, add_data_format=add_data_format)
+        metrics = self._metrics.to_dict(bytes_in=bytes_in, bytes_out=bytes_out)
+        self.logger.info(
+            f"Processed {metrics['rows_in']} rows ({metrics['rows_out']} left) in {metrics['total_time']:.2f} s: "
+            f"read {metrics['read_time']:.2f} s, process {metrics['process_time']:.2f} s, "
+            f"write {metrics['write_time']:.2f} s, prepare {metrics['prepare_time']:.2f} s"
+        )
+        if metrics["counts"]:
+            self.logger.info(f"Counts: {metrics['counts']}")
+        self._metrics.save(f"{self.logger.name}.metrics.jsonl", bytes_in=bytes_in, bytes_out=bytes_out)
+
+    def _process_shard(
+        self,
+        in_fname: str,
+        out_fnames: List[str],
+        byte_range: Tuple[int, int],
+        add_data_format: Optional[bool],
+        process_kwargs: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        """
+        Processes given byte range of input file in chunks and saves results to separate files.
+
+        Returns:
+            Statistics for each processed chunk.
+        """
+        self._metrics = StageMetrics(
+            stage=self.logger.name,
+            processor=type(self).__name__,
+            in_fname=in_fname,
+            n_workers=self._n_workers,
+            chunksize=self._chunksize,
+        )
+        for fname in out_fnames:
+            self._prepare_outfile(fname, add_data_format=add_data_format)
+        try:
+            reader = self._read_input(in_fname, byte_range=byte_range)
+            for chunk, read_time in self._iterate_timed(reader):
+                self._process_chunk(chunk, read_time, out_fnames, add_data_format, process_kwargs)
+        finally:
+            for fname in out_fnames:
+                self._close_outfile(fname, add_data_format=add_data_format)
+            self._close_pool()
+        return self._metrics.chunks
+
+    def _process_shards(
+        self,
+        in_fname: str,
+        out_fnames: List[str],
+        n_shards: int,
+        add_data_format: Optional[bool],
+        process_kwargs: Dict[str, Any],
+    ) -> None:
+        """
+        Splits input file into byte ranges aligned with lines and processes each range in a separate process
+        (with its own reader and writers). Results are concatenated to output files in the original order.
+        """
+        shard_ranges = self._data_manager.get_shard_ranges(in_fname, n_shards)
+        shards_out_fnames = [[f"{fname}.shard_{i}" for fname in out_fnames] for i in range(len(shard_ranges))]
+        self.logger.info(f"Processing {in_fname} in {len(shard_ranges)} shards")
+
+        with Parallel(len(shard_ranges)) as pool:
+            shards_metrics = pool(
+                delayed(self._process_shard)(
+                    in_fname=in_fname,
+                    out_fnames=shard_out_fnames,
+                    byte_range=byte_range,
+                    add_data_format=add_data_format,
+                    process_kwargs=process_kwargs,
+                )
+                for byte_range, shard_out_fnames in zip(shard_ranges, shards_out_fnames)
+            )
+        for shard_metrics in shards_metrics:
+            self._metrics.chunks.extend(shard_metrics)
+
+        for shard_out_fnames in shards_out_fnames:
+            for fname, shard_fname in zip(out_fnames, shard_out_fnames):
+                self._data_manager.append_file_to_outfile(shard_fname, fname, add_data_format=add_data_format)
+
+    def __call__(
+        self,
+        in_fname: str,
+        out_fname: str,
+        add_data_format: Optional[bool] = True,
+        checkpoint: Optional[bool] = False,
+        n_shards: Optional[int] = None,
+        **kwargs,
+    ) -> None:
         """
         Iterates over input data in chunks, processes it in some way and saves results to separate file.
 
         Args:
             in_fname: Path to read input data from.
             out_fname: Path to save processed data to.
+            checkpoint: True to save progress after each chunk and to resume from previously saved progress
+                (if there is any). On resuming, results of `prepare` are restored when possible, outputs are truncated
+                to their size at the moment of last saved chunk and already processed rows are skipped.
+            n_shards: Number of shards to split input file into. When it is more than 1, each shard is read,
+                processed and saved in a separate process, which is useful for I/O bound stages. Note that
+                `prepare` still runs once over the whole input file. Optional, default value is None.
             **kwargs: Arbitrary keyword arguments. Keyword arguments starting from prefix 'prepare_'
                 will be passed to method that is called before data processing,
                 all others - to method that processes each chunk.
@@ -202,14 +962,76 @@ class BaseProcessor:
         prepare_kwargs = {key[len("prepare_") :]: value for key, value in kwargs.items() if key.startswith("prepare_")}
         process_kwargs = {key: value for key, value in kwargs.items() if not key.startswith("prepare_")}
 
+        if checkpoint and not self._data_manager.supports_byte_offsets:
+            self.logger.warning(f"Checkpoints are not supported for {self.data_format}, processing from scratch")
+            checkpoint = False
+        if n_shards and n_shards > 1 and not self._data_manager.supports_byte_offsets:
+            self.logger.warning(f"Sharding is not supported for {self.data_format}, processing in a single process")
+            n_shards = None
+        if n_shards and n_shards > 1 and checkpoint:
+            self.logger.warning("Checkpoints are not supported when processing in shards, processing from scratch")
+            checkpoint = False
+
         self.logger.info(f"Starting processing {in_fname}")
+        self._metrics = StageMetrics(
+            stage=self.logger.name,
+            processor=type(self).__name__,
+            in_fname=in_fname,
+            n_workers=self._n_workers,
+            chunksize=self._chunksize,
+        )
+
+        out_fnames = self._get_out_fnames(out_fname)
+        checkpoint_fname = f"{out_fname}.checkpoint.json"
+        prepare_checkpoint_fname = f"{out_fname}.prepare_checkpoint.json"
+        chunks_checkpoint = self._load_checkpoint(checkpoint_fname, in_fname) if checkpoint else None
+        prepare_checkpoint = self._load_checkpoint(prepare_checkpoint_fname, in_fname) if checkpoint else None
+
+        n_rows = 0
+        if chunks_checkpoint:
+            n_rows = chunks_checkpoint["n_rows"]
+            self.logger.info(f"Resuming processing {in_fname} after {n_rows} rows")
+            for fname, position in zip(out_fnames, chunks_checkpoint["positions"]):
+                self._data_manager.truncate_outfile(fname, position, add_data_format=add_data_format)
+        else:
+            for fname in out_fnames:
+                self._prepare_outfile(fname, add_data_format=add_data_format)
+
+        try:
+            if prepare_checkpoint:
+                self._set_prepare_state(prepare_checkpoint["state"])
+            else:
+                start_time = time.perf_counter()
+                self.prepare(in_fname, **prepare_kwargs)
+                self._metrics.record_prepare(time.perf_counter() - start_time)
+                prepare_state = self._get_prepare_state()
+                if checkpoint and prepare_state is not None:
+                    self._save_checkpoint(prepare_checkpoint_fname, {"in_fname": in_fname, "state": prepare_state})
+
+            if n_shards and n_shards > 1:
+                self._process_shards(in_fname, out_fnames, n_shards, add_data_format, process_kwargs)
+            else:
+                reader = self._read_input(in_fname, skip_rows=n_rows) if n_rows else self._read_input(in_fname)
+                for chunk, read_time in tqdm(self._iterate_timed(reader), leave=False):
+                    self._process_chunk(chunk, read_time, out_fnames, add_data_format, process_kwargs)
 
-        self._prepare_outfile(out_fname, add_data_format=add_data_format)
-        self.prepare(in_fname, **prepare_kwargs)
+                    if checkpoint:
+                        n_rows += len(chunk)
+                        positions = [
+                            self._data_manager.get_outfile_position(fname, add_data_format=add_data_format)
+                            for fname in out_fnames
+                        ]
+                        self._save_checkpoint(
+                            checkpoint_fname, {"in_fname": in_fname, "n_rows": n_rows, "positions": positions}
+                        )
+        finally:
+            for fname in out_fnames:
+                self._close_outfile(fname, add_data_format=add_data_format)
+            self._close_pool()
 
-        reader = self._read_input(in_fname)
-        for chunk in tqdm(reader, leave=False):
-            processed_chunk = self.process(chunk, **process_kwargs)
-            self._append_to_outfile(processed_chunk, out_fname, add_data_format=add_data_format)
+        for fname in [checkpoint_fname, prepare_checkpoint_fname]:
+            if os.path.exists(fname):
+                os.remove(fname)
 
+        self._save_metrics(in_fname, out_fnames, add_data_format=add_data_format)
         self.logger.info(f"Finished processing {in_fname}")
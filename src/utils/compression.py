@@ -0,0 +1,54 @@
+import gzip
+import io
+import os
+from typing import BinaryIO, Optional
+
+# supported codecs and extensions of files compressed with them
+COMPRESSION_EXTENSIONS = {"gzip": "gz", "zstd": "zst"}
+
+
+def get_compression(fname: str) -> Optional[str]:
+    """
+    Returns codec given file is compressed with according to its extension (None for uncompressed files).
+    """
+    extension = os.path.splitext(fname)[1].lstrip(".")
+    for compression, compression_extension in COMPRESSION_EXTENSIONS.items():
+        if extension == compression_extension:
+            return compression
+    return None
+
+
+def open_compressed(
+    fname: str, mode: str, compression: Optional[str] = None, compression_level: Optional[int] = None
+) -> BinaryIO:
+    """
+    Opens file in binary mode, data is (de)compressed on the fly when compression is given.
+
+    Args:
+        fname: Path to file.
+        mode: Mode to open file in (`rb`, `wb` or `ab`).
+        compression: Codec to use: `gzip`, `zstd` or None. Optional, default value is None.
+        compression_level: Compression level. Optional, codec's default level is used when not given.
+    """
+    if compression is None:
+        return open(fname, mode=mode)
+
+    if compression == "gzip":
+        if compression_level is None:
+            return gzip.open(fname, mode=mode)
+        return gzip.open(fname, mode=mode, compresslevel=compression_level)
+
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires `zstandard` package, install it via `pip install zstandard`")
+        if "r" in mode:
+            # files might consist of several concatenated frames, reader doesn't support `readline` on its own
+            reader = zstandard.ZstdDecompressor().stream_reader(open(fname, mode="rb"), read_across_frames=True)
+            return io.BufferedReader(reader)
+        if compression_level is None:
+            return zstandard.open(fname, mode=mode)
+        return zstandard.open(fname, mode=mode, cctx=zstandard.ZstdCompressor(level=compression_level))
+
+    raise ValueError(f"Unknown compression {compression}. Currently supported are {list(COMPRESSION_EXTENSIONS)}.")
@@ -0,0 +1,89 @@
+import json
+import math
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class IntHistogram:
+    """
+    This is a class for computing exact quantiles over a stream of non-negative integers (e.g. lengths or # tokens).
+
+    Only the number of occurrences of each distinct value is stored, so memory depends on the number of distinct
+    values rather than on the size of the stream. Histograms are mergeable: histograms built on separate parts
+    of data (e.g. in different processes) can be combined into a histogram for the whole data.
+
+    Quantiles are the same as `np.quantile` with default (linear) interpolation returns on the full list of values.
+
+    Args:
+        counts: Initial number of occurrences of each value. Optional, histogram is empty by default.
+    """
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None):
+        self._counts: Dict[int, int] = dict(counts) if counts else {}
+
+    def __len__(self) -> int:
+        return sum(self._counts.values())
+
+    def update(self, values: Iterable[int]) -> None:
+        """
+        Adds given values to histogram.
+        """
+        values = np.fromiter(values, dtype=np.int64)
+        if values.size == 0:
+            return
+        unique_values, counts = np.unique(values, return_counts=True)
+        for value, count in zip(unique_values.tolist(), counts.tolist()):
+            self._counts[value] = self._counts.get(value, 0) + count
+
+    def merge(self, other: "IntHistogram") -> None:
+        """
+        Adds all values from other histogram to this one.
+        """
+        for value, count in other._counts.items():
+            self._counts[value] = self._counts.get(value, 0) + count
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns q-th quantile of all added values.
+        """
+        if not self._counts:
+            raise ValueError("Can't compute quantile of an empty histogram")
+
+        values = sorted(self._counts)
+        cumulative_counts = np.cumsum([self._counts[value] for value in values])
+        n = int(cumulative_counts[-1])
+
+        # same computation of virtual index and interpolation as numpy uses for `linear` method
+        virtual_index = (n - 1) * q
+        prev_index = min(max(math.floor(virtual_index), 0), n - 1)
+        next_index = min(prev_index + 1, n - 1)
+        gamma = virtual_index - prev_index
+
+        # k-th smallest value is the first one with cumulative count greater than k
+        a, b = (values[np.searchsorted(cumulative_counts, i, side="right")] for i in [prev_index, next_index])
+        diff_b_a = b - a
+        if gamma >= 0.5:
+            return b - diff_b_a * (1 - gamma)
+        return a + diff_b_a * gamma
+
+    def get_percentiles(self, percentiles: List[float]) -> Dict[float, float]:
+        """
+        Returns a dictionary with given percentiles as keys and corresponding quantiles as values.
+        """
+        return {q: self.quantile(q) for q in percentiles}
+
+    def save(self, fname: str) -> None:
+        """
+        Saves histogram to JSON file (as a list of [value, # occurrences] pairs).
+        """
+        with open(fname, "w") as file:
+            json.dump({"counts": sorted(self._counts.items())}, file)
+
+    @staticmethod
+    def load(fname: str) -> "IntHistogram":
+        """
+        Reads histogram from JSON file.
+        """
+        with open(fname, "r") as file:
+            return IntHistogram({value: count for value, count in json.load(file)["counts"]})
@@ -0,0 +1,136 @@
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+
+class StageMetrics:
+    """
+    This is a class for collecting throughput and latency statistics of a single run of processing stage.
+
+    Statistics are collected for each chunk (read, process and write time, # rows and # bytes
+    before and after processing, worker utilization) and for the whole stage (including time spent in `prepare`).
+
+    Args:
+        stage: Name of the stage (e.g. logger name of the processor).
+        processor: Name of the processor class.
+        in_fname: Path to input data.
+        n_workers: Maximum number of concurrently running jobs.
+        chunksize: Number of examples in a single chunk.
+    """
+
+    def __init__(self, stage: str, processor: str, in_fname: str, n_workers: int, chunksize: int):
+        self._info: Dict[str, Any] = {
+            "stage": stage,
+            "processor": processor,
+            "in_fname": in_fname,
+            "n_workers": n_workers,
+            "chunksize": chunksize,
+        }
+        self._start_time = time.time()
+        self._prepare_time = 0.0
+        self._pool_time = 0.0
+        self._pool_busy_time = 0.0
+        self._pool_n_workers = n_workers
+        self._counts: Dict[str, int] = {}
+        self.chunks: List[Dict[str, Any]] = []
+
+    def record_pool_usage(self, wall_time: float, busy_time: float, n_workers: int) -> None:
+        """
+        Accumulates worker pool usage until the end of current chunk (or `prepare`).
+
+        Args:
+            wall_time: Time spent waiting for workers.
+            busy_time: Total time workers spent on actual work.
+            n_workers: Number of workers.
+        """
+        self._pool_time += wall_time
+        self._pool_busy_time += busy_time
+        self._pool_n_workers = n_workers
+
+    def record_counts(self, counts: Dict[str, int]) -> None:
+        """
+        Accumulates processor-specific counters (e.g. how often each filter fires) until the end of current chunk.
+        """
+        for key, value in counts.items():
+            self._counts[key] = self._counts.get(key, 0) + value
+
+    def _pop_utilization(self) -> Optional[float]:
+        """
+        Returns worker utilization since the last call (None if worker pool wasn't used).
+        """
+        utilization = None
+        if self._pool_time > 0:
+            utilization = self._pool_busy_time / (self._pool_time * self._pool_n_workers)
+        self._pool_time, self._pool_busy_time = 0.0, 0.0
+        return utilization
+
+    def record_prepare(self, prepare_time: float) -> None:
+        self._prepare_time = prepare_time
+        self._info["prepare_worker_utilization"] = self._pop_utilization()
+
+    def record_chunk(
+        self,
+        read_time: float,
+        process_time: float,
+        write_time: float,
+        rows_in: int,
+        rows_out: int,
+        bytes_in: Optional[int],
+        bytes_out: Optional[int],
+    ) -> None:
+        self.chunks.append(
+            {
+                "read_time": read_time,
+                "process_time": process_time,
+                "write_time": write_time,
+                "rows_in": rows_in,
+                "rows_out": rows_out,
+                "bytes_in": bytes_in,
+                "bytes_out": bytes_out,
+                "worker_utilization": self._pop_utilization(),
+                "counts": self._counts,
+            }
+        )
+        self._counts = {}
+
+    def to_dict(self, bytes_in: Optional[int] = None, bytes_out: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Aggregates statistics over all chunks.
+
+        Args:
+            bytes_in: Total size of input data. Optional, by default the sum over chunks is used.
+            bytes_out: Total size of output data. Optional, by default the sum over chunks is used.
+        """
+        total_time = time.time() - self._start_time
+        res = dict(self._info)
+        res["start_time"] = self._start_time
+        res["total_time"] = total_time
+        res["prepare_time"] = self._prepare_time
+        res["n_chunks"] = len(self.chunks)
+        for key in ["read_time", "process_time", "write_time", "rows_in", "rows_out"]:
+            res[key] = sum(chunk[key] for chunk in self.chunks)
+        for key, total in [("bytes_in", bytes_in), ("bytes_out", bytes_out)]:
+            chunk_values = [chunk[key] for chunk in self.chunks]
+            res[key] = total if total is not None or None in chunk_values else sum(chunk_values)
+
+        utilizations = [
+            (chunk["worker_utilization"], chunk["process_time"])
+            for chunk in self.chunks
+            if chunk["worker_utilization"] is not None
+        ]
+        process_time = sum(t for _, t in utilizations)
+        res["worker_utilization"] = sum(u * t for u, t in utilizations) / process_time if process_time > 0 else None
+        res["counts"] = {}
+        for chunk in self.chunks:
+            for key, value in chunk.get("counts", {}).items():
+                res["counts"][key] = res["counts"].get(key, 0) + value
+        res["rows_per_second"] = res["rows_in"] / total_time if total_time > 0 else None
+        res["chunks"] = self.chunks
+        return res
+
+    def save(self, out_fname: str, bytes_in: Optional[int] = None, bytes_out: Optional[int] = None) -> None:
+        """
+        Appends aggregated statistics to given file as a single JSON line.
+        """
+        with open(out_fname, "a") as f:
+            f.write(json.dumps(self.to_dict(bytes_in=bytes_in, bytes_out=bytes_out)) + "\n")
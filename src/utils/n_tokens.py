@@ -0,0 +1,55 @@
+import json
+import os
+from typing import Dict, List
+
+# file next to saved # of tokens, which ties them to the data file they were computed on
+N_TOKENS_SOURCE_FNAME = "source.json"
+
+
+def get_n_tokens_str(string: str) -> int:
+    """Splits given string by whitespaces and returns # of tokens."""
+    return len(string.split())
+
+
+def get_n_tokens_mods(mods: List[Dict[str, str]]) -> int:
+    """
+    Tokenizes each diff in commit modifications (together with a header describing modified file)
+    and returns total # of tokens. Raises TypeError for malformed modifications.
+    """
+    n_tokens = 0
+    for mod in mods:
+        if mod["change_type"] == "UNKNOWN":
+            continue
+        if mod["change_type"] == "ADD":
+            file_diff = f"new file {mod['new_path']}\n"
+        elif mod["change_type"] == "DELETE":
+            file_diff = f"deleted file {mod['old_path']}\n"
+        elif mod["change_type"] == "RENAME":
+            file_diff = f"rename from {mod['old_path']}\nrename to {mod['new_path']}\n"
+        elif mod["change_type"] == "COPY":
+            file_diff = f"copy from {mod['old_path']}\ncopy to {mod['new_path']}\n"
+        else:
+            file_diff = f"{mod['new_path']}\n"
+        n_tokens += get_n_tokens_str(file_diff)
+        n_tokens += get_n_tokens_str(mod["diff"])
+    return n_tokens
+
+
+def _get_data_signature(data_fname: str) -> Dict[str, int]:
+    stat = os.stat(data_fname)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def save_n_tokens_source(n_tokens_dir: str, data_fname: str) -> None:
+    """Saves size and modification time of data file # of tokens in given directory were computed on."""
+    with open(os.path.join(n_tokens_dir, N_TOKENS_SOURCE_FNAME), "w") as file:
+        json.dump(_get_data_signature(data_fname), file)
+
+
+def is_n_tokens_source(n_tokens_dir: str, data_fname: str) -> bool:
+    """Checks whether # of tokens in given directory were computed on given data file (and it wasn't changed since)."""
+    source_fname = os.path.join(n_tokens_dir, N_TOKENS_SOURCE_FNAME)
+    if not os.path.exists(source_fname) or not os.path.exists(data_fname):
+        return False
+    with open(source_fname, "r") as file:
+        return json.load(file) == _get_data_signature(data_fname)
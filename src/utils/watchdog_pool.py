@@ -0,0 +1,173 @@
+import logging
+import multiprocessing
+import time
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+def _worker_loop(conn: Connection) -> None:
+    """
+    Receives function to run first (and reports when it is loaded), then receives tasks (as positional arguments)
+    one at a time and sends back their results.
+    """
+    func: Optional[Callable] = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        except Exception as e:  # e.g. function can't be unpickled
+            conn.send(("error", e))
+            continue
+        if message is None:
+            return
+
+        kind, payload = message
+        if kind == "func":
+            func = payload
+            conn.send(("ready", None))
+            continue
+        try:
+            conn.send(("result", func(*payload)))
+        except Exception as e:
+            conn.send(("error", e))
+
+
+class _Worker:
+    def __init__(self, context: multiprocessing.context.BaseContext):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.func_id: Optional[int] = None  # # of `WatchdogPool.map` call that sent current function
+        self.is_loading = False  # whether current function is being loaded
+        self.task: Optional[Tuple[int, float]] = None  # (index of current task, its deadline)
+
+    @property
+    def is_idle(self) -> bool:
+        return not self.is_loading and self.task is None
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WatchdogPool:
+    """
+    This is a pool of worker processes, which enforces a time budget on each task.
+
+    Each worker runs a single task at a time. When a task exceeds its budget (e.g. because of catastrophic
+    backtracking in some regular expression), its worker is killed and replaced with a new one, and the task is
+    reported as `FAILED` (the same happens when a worker dies unexpectedly). Other tasks are not affected.
+
+    Args:
+        n_workers: Number of worker processes.
+        logger_name: Name of logger for this class. Optional, default value is None.
+    """
+
+    FAILED = object()
+
+    def __init__(self, n_workers: int, logger_name: Optional[str] = None):
+        self._n_workers = n_workers
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[_Worker] = []
+        self._n_calls = 0
+        self._logger_name = logger_name
+        self.n_killed = 0
+
+    @property
+    def logger(self) -> logging.Logger:
+        return logging.getLogger(self._logger_name)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        self.n_killed += 1
+        new_worker = _Worker(self._context)
+        self._workers[self._workers.index(worker)] = new_worker
+        return new_worker
+
+    def map(self, func: Callable, *columns: Sequence, time_budgets: Sequence[float]) -> List[Any]:
+        """
+        Applies given function to each row in worker processes and returns results in original order
+        (`FAILED` for rows that exceeded their time budget).
+
+        Args:
+            func: Function to apply, it receives one value from each column as positional arguments
+                (it is sent to each worker once per call, so it can be a method of a large object).
+            *columns: Sequences of equal lengths.
+            time_budgets: Time budget for each row (in seconds).
+        """
+        if not time_budgets:
+            return []
+        while len(self._workers) < self._n_workers:
+            self._workers.append(_Worker(self._context))
+
+        results: List[Any] = [WatchdogPool.FAILED] * len(time_budgets)
+        pending: Deque[Tuple[int, Tuple[Any, ...]]] = deque(enumerate(zip(*columns)))
+        busy: Dict[Connection, _Worker] = {}
+        self._n_calls += 1
+        while pending or busy:
+            for worker in self._workers:
+                if not worker.is_idle or not pending:
+                    continue
+                if worker.func_id != self._n_calls:
+                    # time budgets don't include loading function (e.g. imports in a new worker)
+                    worker.conn.send(("func", func))
+                    worker.func_id, worker.is_loading = self._n_calls, True
+                else:
+                    i, args = pending.popleft()
+                    worker.conn.send(("task", args))
+                    worker.task = (i, time.perf_counter() + time_budgets[i])
+                busy[worker.conn] = worker
+
+            deadlines = [worker.task[1] for worker in busy.values() if worker.task is not None]
+            timeout = max(min(deadlines) - time.perf_counter(), 0) if deadlines else None
+            for conn in wait(list(busy), timeout=timeout):
+                worker = busy.pop(conn)
+                try:
+                    kind, res = conn.recv()
+                except EOFError:
+                    if worker.task is None:
+                        self.close()
+                        raise RuntimeError("Worker died while loading function")
+                    self.logger.warning(f"Worker died while processing row {worker.task[0]}, replacing it")
+                    self._replace(worker)
+                    continue
+
+                if kind == "error":
+                    # other workers might still be busy with tasks from this call
+                    self.close()
+                    raise res
+                if kind == "result":
+                    results[worker.task[0]] = res
+                worker.is_loading, worker.task = False, None
+
+            now = time.perf_counter()
+            for conn, worker in list(busy.items()):
+                if worker.task is not None and now > worker.task[1]:
+                    i = worker.task[0]
+                    self.logger.warning(f"Row {i} exceeded time budget of {time_budgets[i]:.1f} s, replacing worker")
+                    del busy[conn]
+                    self._replace(worker)
+        return results
+
+    def close(self) -> None:
+        """
+        Shuts down all worker processes.
+        """
+        for worker in self._workers:
+            worker.close()
+        self._workers = []
@@ -0,0 +1,130 @@
+import os
+import subprocess
+
+from src.collection import GitLogMiner
+
+
+def _git(repo_path, *args, date="2021-01-01T12:00:00"):
+    env = dict(
+        os.environ,
+        GIT_AUTHOR_NAME="author",
+        GIT_AUTHOR_EMAIL="author@example.com",
+        GIT_AUTHOR_DATE=date,
+        GIT_COMMITTER_NAME="author",
+        GIT_COMMITTER_EMAIL="author@example.com",
+        GIT_COMMITTER_DATE=date,
+    )
+    return subprocess.run(
+        ["git", "-C", str(repo_path), "-c", "commit.gpgsign=false", *args],
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout.decode()
+
+
+def _commit(repo_path, message, day, *args):
+    date = f"2021-01-{day:02d}T12:00:00"
+    _git(repo_path, "add", "-A", date=date)
+    _git(repo_path, "commit", "-q", "-m", message, *args, date=date)
+    return _git(repo_path, "rev-parse", "HEAD").strip()
+
+
+def _make_repo(repo_path):
+    """Creates repository with all kinds of commits and returns hashes, messages and mods expected from them."""
+    _git(repo_path, "init", "-q", "-b", "main")
+    expected = []
+
+    (repo_path / "a.py").write_text("x = 1\n")
+    (repo_path / "data.bin").write_bytes(b"\x00\x01\x02")
+    commit_hash = _commit(repo_path, "Initial commit", 1)
+    expected.append(
+        (
+            commit_hash,
+            "Initial commit",
+            [
+                {"change_type": "ADD", "old_path": None, "new_path": "a.py", "diff": "@@ -0,0 +1 @@\n+x = 1\n"},
+                {
+                    "change_type": "ADD",
+                    "old_path": None,
+                    "new_path": "data.bin",
+                    "diff": "Binary files /dev/null and b/data.bin differ\n",
+                },
+            ],
+        )
+    )
+
+    # message lines that look like a diff shouldn't be parsed as modifications
+    message = "Change x\n\ndiff --git a/c.py b/c.py\n--- a/c.py\n+++ b/c.py\n@@ -1 +1 @@\n-y = 1\n+y = 2"
+    (repo_path / "a.py").write_text("x = 2\n")
+    commit_hash = _commit(repo_path, message, 2)
+    expected.append(
+        (
+            commit_hash,
+            message,
+            [
+                {
+                    "change_type": "MODIFY",
+                    "old_path": "a.py",
+                    "new_path": "a.py",
+                    "diff": "@@ -1 +1 @@\n-x = 1\n+x = 2\n",
+                }
+            ],
+        )
+    )
+
+    os.rename(repo_path / "a.py", repo_path / "b.py")
+    commit_hash = _commit(repo_path, "Rename a.py", 3)
+    expected.append(
+        (commit_hash, "Rename a.py", [{"change_type": "RENAME", "old_path": "a.py", "new_path": "b.py", "diff": ""}])
+    )
+
+    (repo_path / "data.bin").write_bytes(b"\x00\x03")
+    commit_hash = _commit(repo_path, "Change binary file", 4)
+    expected.append(
+        (
+            commit_hash,
+            "Change binary file",
+            [
+                {
+                    "change_type": "MODIFY",
+                    "old_path": "data.bin",
+                    "new_path": "data.bin",
+                    "diff": "Binary files a/data.bin and b/data.bin differ\n",
+                }
+            ],
+        )
+    )
+
+    commit_hash = _commit(repo_path, "Empty commit", 5, "--allow-empty")
+    expected.append((commit_hash, "Empty commit", []))
+
+    _git(repo_path, "checkout", "-q", "-b", "feature")
+    (repo_path / "c.py").write_text("y = 1\n")
+    commit_hash = _commit(repo_path, "Add c.py", 6)
+    expected.append(
+        (
+            commit_hash,
+            "Add c.py",
+            [{"change_type": "ADD", "old_path": None, "new_path": "c.py", "diff": "@@ -0,0 +1 @@\n+y = 1\n"}],
+        )
+    )
+
+    # like in PyDriller, merge commits don't have modifications
+    _git(repo_path, "checkout", "-q", "main")
+    _git(repo_path, "merge", "-q", "--no-ff", "-m", "Merge feature", "feature", date="2021-01-07T12:00:00")
+    expected.append((_git(repo_path, "rev-parse", "HEAD").strip(), "Merge feature", []))
+    return expected
+
+
+def _mine(repo_path, **kwargs):
+    return [
+        (commit["hash"], commit["message"], commit["mods"])
+        for commit in GitLogMiner(str(repo_path), **kwargs).traverse_commits()
+    ]
+
+
+def test_commits_are_mined_like_pydriller(tmp_path):
+    expected = _make_repo(tmp_path)
+    assert _mine(tmp_path) == expected
+    assert _mine(tmp_path, only_no_merge=True) == expected[:-1]
+    assert _mine(tmp_path, only_commits=[expected[3][0], expected[1][0]]) == [expected[1], expected[3]]
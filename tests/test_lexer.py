@@ -0,0 +1,82 @@
+import json
+import os
+import time
+
+import pandas as pd
+
+from src.processing import Lexer
+
+
+def _make_chunk(diffs):
+    return pd.DataFrame(
+        {
+            "id": list(range(len(diffs))),
+            "mods": [
+                [{"change_type": "MODIFY", "old_path": "a.py", "new_path": "a.py", "diff": diff}] for diff in diffs
+            ],
+        }
+    )
+
+
+def _process_part(lexer, tmp_path, part, diffs):
+    with open(tmp_path / "literals.json", "w") as file:
+        json.dump({0.95: 100}, file)
+    lexer.prepare(os.path.join(tmp_path, part), literals_len_dir=str(tmp_path), percentile_dir=str(tmp_path))
+    return lexer.process(_make_chunk(diffs))
+
+
+def test_quarantine_is_kept_per_part(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # processors write logs to working directory
+    quarantine_fname = str(tmp_path / "quarantine.jsonl")
+    short_diff, long_diff = "+x = 1\n", "+x = 1\n" * 10
+    lexer = Lexer(0.95, data_format="jsonl", max_diff_len=20, quarantine_fname=quarantine_fname, logger_name="lexer")
+
+    # ids restart from 0 in each part, so commit 0 quarantined in train shouldn't affect commit 0 in val
+    train = _process_part(lexer, tmp_path, "train", [long_diff, short_diff])
+    val = _process_part(lexer, tmp_path, "val", [short_diff, short_diff])
+    assert train["id"].tolist() == [1]
+    assert val["id"].tolist() == [0, 1]
+
+    with open(quarantine_fname) as file:
+        assert [json.loads(line) for line in file] == [{"part": "train", "id": 0, "reason": "size"}]
+
+    # quarantined commits are skipped in next runs even without size limit, only in their own part
+    lexer = Lexer(0.95, data_format="jsonl", quarantine_fname=quarantine_fname, logger_name="lexer")
+    assert _process_part(lexer, tmp_path, "train", [short_diff, short_diff])["id"].tolist() == [1]
+    assert _process_part(lexer, tmp_path, "val", [short_diff, short_diff])["id"].tolist() == [0, 1]
+
+
+class _SlowLexer(Lexer):
+    """Lexer that hangs on commit 3 (defined at module level, so that spawned workers can unpickle it)."""
+
+    def _lex_commit_mods(self, cur_id, cur_mods):
+        if cur_id == 3:
+            time.sleep(60)
+        return super()._lex_commit_mods(cur_id, cur_mods)
+
+
+def test_time_budget_quarantines_only_slow_commit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    quarantine_fname = str(tmp_path / "quarantine.jsonl")
+    diffs = [f"+x = {i}\n" for i in range(8)]
+    expected = _process_part(Lexer(0.95, data_format="jsonl", logger_name="lexer"), tmp_path, "train", diffs)
+
+    # a single worker gets batches of 2 commits: batch with commit 3 exceeds its budget,
+    # then commits 2 and 3 are retried one by one and only commit 3 exceeds its own budget
+    lexer = _SlowLexer(
+        0.95,
+        data_format="jsonl",
+        time_budget=0.5,
+        quarantine_fname=quarantine_fname,
+        n_workers=1,
+        logger_name="lexer",
+    )
+    try:
+        res = _process_part(lexer, tmp_path, "train", diffs)
+        assert lexer._watchdog_pool.n_killed == 2
+    finally:
+        lexer._close_pool()
+
+    pd.testing.assert_frame_equal(res, expected.loc[expected["id"] != 3])
+    with open(quarantine_fname) as file:
+        assert [json.loads(line) for line in file] == [{"part": "train", "id": 3, "reason": "time"}]
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from src.utils.watchdog_pool import WatchdogPool
+
+# functions are defined at module level, so that spawned workers can unpickle them
+
+
+def _square_or_hang(x):
+    if x == 1:
+        time.sleep(60)
+    return x * x
+
+
+def _square_or_raise(x):
+    if x == 1:
+        raise ValueError("bad row")
+    return x * x
+
+
+def test_slow_rows_fail_and_workers_are_replaced():
+    pool = WatchdogPool(n_workers=2)
+    try:
+        assert pool.map(_square_or_hang, [0, 1, 2, 3], time_budgets=[1.0] * 4) == [0, WatchdogPool.FAILED, 4, 9]
+        assert pool.n_killed == 1
+        # replaced worker is used in next calls
+        assert pool.map(_square_or_hang, [2, 3], time_budgets=[1.0] * 2) == [4, 9]
+    finally:
+        pool.close()
+
+
+def test_pool_is_closed_when_task_raises():
+    pool = WatchdogPool(n_workers=2)
+    assert pool.map(_square_or_raise, [0, 2], time_budgets=[1.0] * 2) == [0, 4]
+    processes = [worker.process for worker in pool._workers]
+
+    with pytest.raises(ValueError, match="bad row"):
+        pool.map(_square_or_raise, [0, 1, 2, 3], time_budgets=[1.0] * 4)
+    assert pool._workers == []
+    assert not any(process.is_alive() for process in processes)